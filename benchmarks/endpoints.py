@@ -0,0 +1,181 @@
+"""
+Benchmark of the main pages against generated databases of several sizes.
+
+Run from the repository root:
+
+    python -m benchmarks.endpoints [--sizes 1000 100000 1000000] [--output results.json]
+
+For each size, a database with about that many claims is generated (see
+veronique.generate), a server is started on it, and every endpoint is requested
+a few times after a warm-up request. The results are printed as JSON, so runs
+before and after a change can be compared; besides the time as seen by the
+client, they include the number of SQL statements and the time spent on them
+according to the Server-Timing header.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from http.cookies import SimpleCookie
+from pathlib import Path
+
+import requests
+
+from benchmarks.remote import free_port, start_server
+
+SERVER_TIMING = re.compile(r'sql;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def generate(db_path, claims, seed):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-m", "veronique.generate", "--claims", str(claims), "--seed", str(seed)],
+        env={**os.environ, "VERONIQUE_DB": str(db_path)},
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def endpoints(db_path):
+    """Pick the URLs to request, based on what's in the database."""
+    conn = sqlite3.connect(db_path)
+    entity = conn.execute(
+        """
+        SELECT object_id FROM claims
+        WHERE object_id IS NOT NULL AND verb_id >= 0
+        GROUP BY object_id
+        ORDER BY count(*) DESC
+        LIMIT 1
+        """,
+    ).fetchone()[0]
+    name = conn.execute("SELECT value FROM claims WHERE id = ?", (entity,)).fetchone()[0]
+    query = conn.execute(
+        "SELECT id FROM queries WHERE label LIKE 'Most linked entities%' ORDER BY id",
+    ).fetchone()[0]
+    conn.close()
+    term = name.split()[0][:5]
+    return {
+        "homepage": "/",
+        "entity page": f"/claims/{entity}",
+        "claims list": "/claims",
+        "search": f"/search?q={term}",
+        "autocomplete": f"/autocomplete/link/query/0?ac-query={term[:3]}",
+        "query view": f"/queries/{query}",
+        # last, since it's the slowest by far on big databases
+        "network": "/network",
+    }
+
+
+def login(host, username="admin", password="admin"):
+    """Log in like a browser would, and return a session carrying the cookie."""
+    session = requests.Session()
+    response = session.post(
+        f"{host}/login",
+        data={"username": username, "password": password},
+        allow_redirects=False,
+    )
+    if "session" not in response.cookies:
+        raise RuntimeError(f"Couldn't log in as {username}")
+    # the cookie is marked as secure, so requests wouldn't send it over HTTP
+    cookie = SimpleCookie(response.headers["Set-Cookie"])["session"]
+    session.headers["Cookie"] = cookie.OutputString(attrs=[])
+    return session
+
+
+def measure(session, url, repeat, timeout):
+    seconds, queries, sql_ms = [], [], []
+    for i in range(repeat + 1):
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=timeout, allow_redirects=False)
+        except requests.Timeout:
+            return {"error": f"timed out after {timeout:g}s"}
+        elapsed = time.perf_counter() - start
+        if response.status_code != 200:
+            raise RuntimeError(f"{url} returned {response.status_code}")
+        if i == 0:
+            # warm-up
+            continue
+        seconds.append(elapsed)
+        if match := SERVER_TIMING.search(response.headers.get("Server-Timing", "")):
+            sql_ms.append(float(match.group(1)))
+            queries.append(int(match.group(2)))
+    return {
+        "min_ms": min(seconds) * 1000,
+        "median_ms": statistics.median(seconds) * 1000,
+        "max_ms": max(seconds) * 1000,
+        "queries": statistics.median(queries) if queries else None,
+        "sql_ms": statistics.median(sql_ms) if sql_ms else None,
+    }
+
+
+def run(size, args, tmp):
+    db_path = Path(tmp) / f"benchmark-{size}.db"
+    result = {"claims": size, "generate_s": generate(db_path, size, args.seed)}
+    print(f"{size:,} claims generated in {result['generate_s']:.1f}s", file=sys.stderr)
+    urls = endpoints(db_path)
+    server, host = start_server(db_path, free_port())
+    try:
+        session = login(host)
+        result["endpoints"] = {}
+        for label, url in urls.items():
+            stats = measure(session, f"{host}{url}", args.repeat, args.timeout)
+            stats["url"] = url
+            result["endpoints"][label] = stats
+            if "error" in stats:
+                print(f"  {label:<15} {stats['error']}", file=sys.stderr)
+            else:
+                print(f"  {label:<15} {stats['median_ms']:10.1f} ms", file=sys.stderr)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            # still busy with a request that timed out
+            server.kill()
+            server.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5, help="requests per endpoint, after a warm-up")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per request")
+    parser.add_argument("--output", help="file to write the results to, instead of stdout")
+    args = parser.parse_args()
+
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "commit": subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=False,
+        ).stdout.strip() or None,
+        "seed": args.seed,
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            results["runs"].append(run(size, args, tmp))
+    out = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
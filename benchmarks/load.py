@@ -0,0 +1,240 @@
+"""
+Load test with concurrent users doing a mix of things against a local server.
+
+Run from the repository root:
+
+    python -m benchmarks.load [--users 10] [--duration 30] [--claims 10000] [--output results.json]
+
+A database with about the given number of claims is generated (see
+veronique.generate) and a server is started on it. Every simulated user logs in
+like a browser would, and then keeps picking something to do until the time is
+up: viewing the homepage or an entity, typing the start of a name into an
+autocomplete field one keystroke at a time, adding a claim, or looking at a
+saved query. The mix can be changed with --mix.
+
+The results are printed as JSON (and summarized on stderr): throughput overall,
+and the number of requests, errors and the p50/p95/p99 latencies per route, so
+runs before and after a change to the database layer, the caches or the number
+of workers can be compared.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+import requests
+
+from benchmarks.endpoints import generate, login
+from benchmarks.remote import free_port, start_server
+
+MIX = {"page": 50, "autocomplete": 25, "write": 15, "query": 10}  # relative frequency
+
+
+def targets(db_path):
+    """Pick what the users will look at and write to, based on what's in the database."""
+    conn = sqlite3.connect(db_path)
+    entities = [
+        (claim_id, name)
+        for claim_id, name in conn.execute(
+            "SELECT id, value FROM claims WHERE verb_id = -1 ORDER BY id",
+        )
+    ]
+    queries = [row[0] for row in conn.execute("SELECT id FROM queries ORDER BY id")]
+    verb = conn.execute(
+        "SELECT id FROM verbs WHERE label LIKE 'nickname%' ORDER BY id",
+    ).fetchone()[0]
+    conn.close()
+    return {"entities": entities, "queries": queries, "verb": verb}
+
+
+class User(threading.Thread):
+    def __init__(self, number, host, data, mix, until, think):
+        super().__init__(daemon=True)
+        self.rng = random.Random(number)
+        self.host = host
+        self.data = data
+        self.mix = mix
+        self.until = until
+        self.think = think
+        self.samples = []  # (route, seconds, ok)
+        self.session = None
+
+    def request(self, route, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(
+                method, f"{self.host}{url}", allow_redirects=False, timeout=60, **kwargs,
+            )
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        self.samples.append((route, time.perf_counter() - start, ok))
+
+    def page(self):
+        if self.rng.random() < 0.3:
+            self.request("/", "GET", "/")
+        else:
+            claim_id, _ = self.rng.choice(self.data["entities"])
+            self.request("/claims/<id>", "GET", f"/claims/{claim_id}")
+
+    def autocomplete(self):
+        _, name = self.rng.choice(self.data["entities"])
+        for length in range(1, min(len(name), 6) + 1):
+            self.request(
+                "/autocomplete/<variant>/query/<data>",
+                "GET",
+                "/autocomplete/link/query/0",
+                params={"ac-query": name[:length]},
+            )
+
+    def write(self):
+        claim_id, _ = self.rng.choice(self.data["entities"])
+        self.request(
+            "/claims/new/<ids>/outgoing",
+            "POST",
+            f"/claims/new/{claim_id}/outgoing",
+            data={"verb": self.data["verb"], "value": f"load test {self.rng.randrange(10**6)}"},
+        )
+
+    def query(self):
+        query_id = self.rng.choice(self.data["queries"])
+        self.request("/queries/<id>", "GET", f"/queries/{query_id}")
+
+    def run(self):
+        start = time.perf_counter()
+        self.session = login(self.host)
+        self.samples.append(("/login", time.perf_counter() - start, True))
+        actions = list(self.mix)
+        weights = list(self.mix.values())
+        while time.monotonic() < self.until:
+            getattr(self, self.rng.choices(actions, weights=weights)[0])()
+            if self.think:
+                time.sleep(self.rng.expovariate(1 / self.think))
+
+
+def percentiles(seconds):
+    if len(seconds) < 2:
+        return {f"p{p}_ms": seconds[0] * 1000 for p in (50, 95, 99)}
+    cuts = statistics.quantiles(seconds, n=100, method="inclusive")
+    return {f"p{p}_ms": cuts[p - 1] * 1000 for p in (50, 95, 99)}
+
+
+def summarize(users, elapsed):
+    by_route = defaultdict(list)
+    errors = defaultdict(int)
+    for user in users:
+        for route, seconds, ok in user.samples:
+            by_route[route].append(seconds)
+            if not ok:
+                errors[route] += 1
+    total = sum(len(seconds) for seconds in by_route.values())
+    return {
+        "requests": total,
+        "requests_per_s": total / elapsed,
+        "routes": {
+            route: {
+                "requests": len(seconds),
+                "errors": errors[route],
+                "requests_per_s": len(seconds) / elapsed,
+                **percentiles(seconds),
+            }
+            for route, seconds in sorted(by_route.items())
+        },
+    }
+
+
+def parse_mix(value):
+    """Parse something like page=50,write=10 into relative frequencies."""
+    mix = dict.fromkeys(MIX, 0)
+    for part in value.split(","):
+        action, _, weight = part.partition("=")
+        if action not in MIX:
+            raise argparse.ArgumentTypeError(f"unknown action {action!r}, expected one of {', '.join(MIX)}")
+        mix[action] = float(weight)
+    return {action: weight for action, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=10, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to keep going for")
+    parser.add_argument("--claims", type=int, default=10_000, help="size of the generated database")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--think", type=float, default=0, help="mean seconds between actions of a user")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=MIX,
+        help=f"relative frequency of actions (default: {','.join(f'{k}={v}' for k, v in MIX.items())})",
+    )
+    parser.add_argument("--output", help="file to write the results to, instead of stdout")
+    args = parser.parse_args()
+
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "commit": subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=False,
+        ).stdout.strip() or None,
+        "seed": args.seed,
+        "claims": args.claims,
+        "users": args.users,
+        "duration_s": args.duration,
+        "think_s": args.think,
+        "mix": args.mix,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "load.db"
+        seconds = generate(db_path, args.claims, args.seed)
+        print(f"{args.claims:,} claims generated in {seconds:.1f}s", file=sys.stderr)
+        data = targets(db_path)
+        server, host = start_server(db_path, free_port())
+        try:
+            until = time.monotonic() + args.duration
+            users = [
+                User(args.seed * 1000 + i, host, data, args.mix, until, args.think)
+                for i in range(args.users)
+            ]
+            start = time.perf_counter()
+            for user in users:
+                user.start()
+            for user in users:
+                user.join()
+            results.update(summarize(users, time.perf_counter() - start))
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+
+    print(f"{results['requests_per_s']:.1f} requests/s", file=sys.stderr)
+    for route, stats in results["routes"].items():
+        print(
+            f"  {route:<38} {stats['requests']:6} "
+            f"p50 {stats['p50_ms']:7.1f} ms  p95 {stats['p95_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms"
+            + (f"  {stats['errors']} errors" if stats["errors"] else ""),
+            file=sys.stderr,
+        )
+    out = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark of the remote query protocol against a local test server.
+
+Run from the repository root:
+
+    python -m benchmarks.remote [--entities 2000]
+
+This creates a temporary database, starts a server on it, and compares the
+old way of talking to it (one fresh HTTP connection per statement) with the
+current client (keep-alive session, batched statements, compressed and
+streamed results).
+
+Keep in mind that round trips to localhost are very cheap, so the gains from
+connection reuse and compression are much bigger against a real server
+(especially behind TLS) than what this shows; batching is the main win here.
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from base64 import b64encode
+from http.cookies import SimpleCookie
+from pathlib import Path
+
+import requests
+
+PASSWORD = "benchmark"
+QUERY = "SELECT id, verb_id, value FROM claims WHERE id = :id"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def populate(db_path, n):
+    with open("veronique_initial_pw", "w") as f:
+        f.write(PASSWORD)
+    os.environ["VERONIQUE_DB"] = str(db_path)
+    from veronique import db
+
+    db.migrate()
+    cur = db.conn.cursor()
+    cur.executemany(
+        "INSERT INTO claims (verb_id, value, owner_id) VALUES (?, ?, 0)",
+        ((db.ROOT, f"Entity {i}") for i in range(n)),
+    )
+    db.conn.commit()
+    return [row["id"] for row in cur.execute("SELECT id FROM claims")]
+
+
+def start_server(db_path, port):
+    server = subprocess.Popen(
+        [
+            sys.executable, "-m", "sanic", "veronique:app",
+            "--host", "127.0.0.1", "--port", str(port), "--single-process",
+        ],
+        env={**os.environ, "VERONIQUE_DB": str(db_path)},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    host = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{host}/login", timeout=1)
+            return server, host
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("Server didn't start")
+
+
+def login(host):
+    r = requests.post(
+        f"{host}/login",
+        data={"username": "admin", "password": PASSWORD},
+        allow_redirects=False,
+    )
+    # requests keeps the cookie quoted, SimpleCookie unquotes it
+    session = SimpleCookie(r.headers["Set-Cookie"])["session"].value
+    return b64encode(session.encode()).decode()
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<45} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--entities", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "benchmark.db"
+        ids = populate(db_path, args.entities)
+        from veronique.remote import RemoteConnection
+
+        server, host = start_server(db_path, free_port())
+        try:
+            token = login(host)
+            headers = {"Authorization": f"Digest {token}"}
+            conn = RemoteConnection(host, token)
+            n = len(ids)
+
+            def unbatched():
+                for claim_id in ids:
+                    r = requests.post(
+                        f"{host}/queries/remote",
+                        json={"q": QUERY, "p": {"id": claim_id}},
+                        headers=headers,
+                    )
+                    r.raise_for_status()
+
+            def session():
+                for claim_id in ids:
+                    conn.execute(QUERY, {"id": claim_id}).fetchall()
+
+            def batched():
+                return conn.execute_many(QUERY, ({"id": claim_id} for claim_id in ids))
+
+            def full_old():
+                r = requests.post(
+                    f"{host}/queries/remote",
+                    json={"q": "SELECT * FROM claims"},
+                    headers=headers,
+                )
+                r.raise_for_status()
+                return r.json()
+
+            def full_new():
+                return conn.execute("SELECT * FROM claims").fetchall()
+
+            print(f"{n} lookups by ID:")
+            timed("  one connection per statement (old client)", unbatched)
+            timed("  keep-alive session, one statement each", session)
+            results = timed("  one batched request", batched)
+            assert len(results) == n
+            print(f"all {n} claims at once:")
+            timed("  single response (old client)", full_old)
+            rows = timed("  streamed, compressed", full_new)
+            assert len(rows) == n
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,8 @@ def pytest_sessionstart(session):
     with open("veronique_initial_pw", "w") as f:
         f.write("admin")
     os.environ["VERONIQUE_DB"] = ":memory:"
+    from veronique import db
+    db.migrate()
 
 
 
@@ -0,0 +1,147 @@
+import asyncio
+from itertools import combinations
+
+import pytest
+
+import veronique.objects as O
+from veronique import analytics, db
+from veronique.analytics import (
+    Graph,
+    Metrics,
+    connected_components,
+    degree_centrality,
+    label_propagation,
+    pagerank,
+)
+from veronique.context import context
+
+LINK = 1
+OTHER_LINK = 2
+
+
+@pytest.fixture
+def graph():
+    # two 4-cliques joined by a bridge (4-5), plus a separate pair (10-11)
+    return Graph(
+        0,
+        [
+            *((a, LINK, b) for a, b in combinations([1, 2, 3, 4], 2)),
+            *((a, LINK, b) for a, b in combinations([5, 6, 7, 8], 2)),
+            (4, LINK, 5),
+            (10, LINK, 11),
+            (11, OTHER_LINK, 10),
+        ],
+    )
+
+
+def test_csr(graph):
+    assert list(graph.ids) == [1, 2, 3, 4, 5, 6, 7, 8, 10, 11]
+    i = graph.index[4]
+    assert sorted(graph.ids[j] for j in graph.neighbours(i)) == [1, 2, 3, 5]
+
+
+def test_degree(graph):
+    assert dict(zip(graph.ids, degree_centrality(graph))) == {
+        1: 3, 2: 3, 3: 3, 4: 4, 5: 4, 6: 3, 7: 3, 8: 3, 10: 1, 11: 1,
+    }
+
+
+def test_pagerank(graph):
+    ranks = dict(zip(graph.ids, pagerank(graph)))
+    assert sum(ranks.values()) == pytest.approx(1)
+    assert ranks[4] == pytest.approx(ranks[5])
+    assert ranks[4] > ranks[1]
+    assert ranks[10] == pytest.approx(ranks[11])
+
+
+def test_components(graph):
+    labels = [graph.ids[c] for c in connected_components(graph)]
+    assert labels == [1, 1, 1, 1, 1, 1, 1, 1, 10, 10]
+
+
+def test_communities(graph):
+    labels = dict(zip(graph.ids, (graph.ids[c] for c in label_propagation(graph))))
+    assert labels[1] == labels[2] == labels[3] == labels[4]
+    assert labels[5] == labels[6] == labels[7] == labels[8]
+    assert labels[1] != labels[5]
+    assert labels[10] == labels[11] != labels[1]
+
+
+def test_metrics(graph):
+    metrics = Metrics.compute(graph)
+    assert metrics.component[8] == 1
+    assert metrics.degree[10] == 1
+
+
+def test_empty_graph():
+    metrics = Metrics.compute(Graph(0, []))
+    assert metrics.pagerank == {}
+
+
+@pytest.mark.asyncio
+async def test_keep_fresh():
+    context.user = O.User(0)
+    try:
+        a, b, category = (O.Claim.new_entity(f"Analytics {name}") for name in ("a", "b", "category"))
+        version = analytics.graph_version()
+        O.Claim.new(a, O.Verb(db.IS_A), category)
+        # categories aren't part of the graph
+        assert analytics.graph_version() == version
+        O.Claim.new(a, O.Verb.new("analytics link", data_type=O.TYPES["directed_link"]), b)
+        assert analytics.graph_version() > version
+    finally:
+        del context.user
+
+    task = asyncio.create_task(analytics.keep_fresh())
+    try:
+        for _ in range(500):
+            await asyncio.sleep(0.01)
+            if db.conn.execute("SELECT graph_metrics_version FROM state").fetchone()[0] == analytics.graph_version():
+                break
+    finally:
+        task.cancel()
+    row = db.conn.execute("SELECT degree FROM graph_metrics WHERE claim_id = ?", (a.id,)).fetchone()
+    assert row["degree"] == 1
+
+
+def test_claim():
+    context.user = O.User(0)
+    try:
+        a, b = (O.Claim.new_entity(f"Analytics claim {name}") for name in ("a", "b"))
+        O.Claim.new(a, O.Verb.new("analytics claim link", data_type=O.TYPES["directed_link"]), b)
+    finally:
+        del context.user
+
+    version = analytics._claim()
+    assert version == analytics.graph_version()
+    # another worker leaves it alone
+    assert analytics._claim() is None
+    # unless the claim is too old
+    db.conn.execute("UPDATE state SET graph_metrics_claimed_at = datetime('now', '-1 day')")
+    db.conn.commit()
+    assert analytics._claim() == version
+    db.conn.execute("UPDATE state SET graph_metrics_claim = NULL")
+    db.conn.commit()
+
+
+def test_metrics_dont_compute(monkeypatch):
+    context.user = O.User(0)
+    try:
+        a, b = (O.Claim.new_entity(f"Analytics stale {name}") for name in ("a", "b"))
+        O.Claim.new(a, O.Verb.new("analytics stale link", data_type=O.TYPES["directed_link"]), b)
+    finally:
+        del context.user
+
+    def compute(graph):
+        raise AssertionError("computed during a request")
+
+    monkeypatch.setattr(Metrics, "compute", compute)
+    # the previous results, if any
+    assert a.id not in analytics.metrics().degree
+
+
+def test_network_metrics(admin_client):
+    for size in ("degree", "pagerank"):
+        _, resp = admin_client.get(f"/network?size={size}&color=community")
+        assert resp.status == 200
+
@@ -0,0 +1,141 @@
+import gzip
+import sqlite3
+import threading
+
+import pytest
+
+from veronique import backup, db
+
+ACCOUNTS = 5000
+BALANCE = 100
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # a file, so that backups are made from a separate connection
+    path = tmp_path / "live.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE accounts (id INTEGER PRIMARY KEY, balance INTEGER, padding TEXT)")
+    conn.executemany(
+        "INSERT INTO accounts (balance, padding) VALUES (?, ?)",
+        ((BALANCE, "x" * 200) for _ in range(ACCOUNTS)),
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, "path", str(path))
+    monkeypatch.setattr(backup, "directory", tmp_path / "backups")
+    return path
+
+
+def _total(path):
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        return conn.execute("SELECT count(*), sum(balance) FROM accounts").fetchone()
+    finally:
+        conn.close()
+
+
+@pytest.mark.asyncio
+async def test_snapshot_under_concurrent_writes(database, tmp_path, monkeypatch):
+    # small steps, so that the copy takes long enough to be written to
+    monkeypatch.setattr(backup, "BACKUP_PAGES_PER_STEP", 5)
+    done = threading.Event()
+    transfers = 0
+
+    def write():
+        nonlocal transfers
+        conn = sqlite3.connect(database, timeout=10)
+        while not done.is_set():
+            # moves money around; the total never changes
+            with conn:
+                conn.execute("UPDATE accounts SET balance = balance - 1 WHERE id = ?", (transfers % ACCOUNTS + 1,))
+                conn.execute("UPDATE accounts SET balance = balance + 1 WHERE id = ?", (ACCOUNTS - transfers % ACCOUNTS,))
+            transfers += 1
+        conn.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        await backup.snapshot(tmp_path / "snapshot.db")
+    finally:
+        done.set()
+        writer.join()
+    assert transfers > 0
+    assert _total(tmp_path / "snapshot.db") == (ACCOUNTS, ACCOUNTS * BALANCE)
+
+
+@pytest.mark.asyncio
+async def test_create_and_prune(database):
+    backup.directory.mkdir()
+    for day in range(1, 4):
+        (backup.directory / f"veronique-2000010{day}-000000.db.gz").touch()
+    path = await backup.create()
+    assert backup.backups()[0] == path
+    with gzip.open(path) as f:
+        assert f.read(15) == b"SQLite format 3"
+    backup.prune(keep=2)
+    assert [p.name for p in backup.backups()] == [
+        path.name,
+        "veronique-20000103-000000.db.gz",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_restore(database):
+    path = await backup.create()
+    conn = sqlite3.connect(database)
+    conn.execute("DELETE FROM accounts")
+    conn.commit()
+    conn.close()
+    backup.restore(path)
+    assert _total(database) == (ACCOUNTS, ACCOUNTS * BALANCE)
+
+
+def test_restore_damaged(database, tmp_path):
+    damaged = tmp_path / "damaged.db"
+    damaged.write_bytes(b"not a database")
+    with pytest.raises(sqlite3.DatabaseError):
+        backup.restore(damaged)
+    assert _total(database) == (ACCOUNTS, ACCOUNTS * BALANCE)
+
+
+def test_routes(admin_client, tmp_path, monkeypatch):
+    monkeypatch.setattr(backup, "directory", tmp_path)
+    _, resp = admin_client.post("/backups", follow_redirects=False)
+    assert resp.status == 302
+    (path,) = backup.backups()
+    _, resp = admin_client.get("/backups")
+    assert path.name in resp.text
+    _, resp = admin_client.get(f"/backups/{path.name}")
+    assert gzip.decompress(resp.body).startswith(b"SQLite format 3")
+    _, resp = admin_client.get("/backups/snapshot")
+    assert resp.headers["content-disposition"].startswith("attachment")
+    assert gzip.decompress(resp.body).startswith(b"SQLite format 3")
+
+
+def test_admin_only(user_client):
+    _, resp = user_client.get("/backups/snapshot")
+    assert resp.status == 403
+
+
+def test_wal(database, tmp_path, monkeypatch):
+    monkeypatch.delattr(db, "conn")  # so that get_connection() opens the file
+    conn = db.get_connection()
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        # a read in progress doesn't keep anyone from writing
+        reader = sqlite3.connect(database)
+        reader.execute("BEGIN")
+        reader.execute("SELECT count(*) FROM accounts").fetchone()
+        conn.execute("UPDATE accounts SET balance = balance WHERE id = 1")
+        conn.commit()
+        reader.rollback()
+        reader.close()
+        # copies don't depend on a -wal file
+        backup.copy(tmp_path / "copy.db")
+        copy = sqlite3.connect(tmp_path / "copy.db")
+        assert copy.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+        copy.close()
+    finally:
+        conn.close()
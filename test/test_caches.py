@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+import pytest
+
+import veronique.objects as O
+from veronique import caches, db
+from veronique.context import context
+
+
+@pytest.fixture
+def unregister():
+    """Remove caches made by a test from the registry again."""
+    yield
+    for name in ("test", "test expired"):
+        caches.registry.pop(name, None)
+
+
+def test_cache(unregister):
+    cache = caches.Cache("test", ttl=timedelta(hours=1), max_size=2)
+    cache.set(1, "one", tags=[("claim", 1)])
+    cache.set(2, "two", tags=[("claim", 2), ("user", 0)])
+    assert cache.get(1) == "one"
+    cache.set(3, "three", tags=[("user", 0)])
+    # 2 was used least recently
+    assert cache.get(2) is caches.MISSING
+    caches.invalidate(("user", 0))
+    assert cache.get(3) is caches.MISSING
+    assert cache.get(1) == "one"
+    assert (len(cache), cache.hits, cache.misses, cache.evictions, cache.invalidations) == (1, 2, 2, 1, 1)
+
+    expired = caches.Cache("test expired", ttl=timedelta(0))
+    expired.set(None, "stale")
+    assert expired.get(None) is caches.MISSING
+
+
+def test_writes_invalidate_only_what_they_change():
+    context.user = O.User(0)
+    try:
+        changed, unchanged = (O.Claim.new_entity(f"Cache {name}") for name in ("changed", "unchanged"))
+        changed_data, unchanged_data = changed.get_data(), unchanged.get_data()
+        assert changed.get_data() is changed_data
+        O.Claim.new(changed, O.Verb(db.COMMENT), O.Plain("cached no more", O.Verb(db.COMMENT)))
+        assert changed.get_data() is not changed_data
+        assert changed.get_data()["has_claims"]
+        assert unchanged.get_data() is unchanged_data
+
+        inferables = O.Verb.get_inferables()
+        assert O.Verb.get_inferables() is inferables
+        verb = O.Verb.new("cache inferred", data_type=O.TYPES["inferred"], extra="{}")
+        assert verb in [inferable.verb for inferable in O.Verb.get_inferables()]
+        verb.delete()
+        assert verb not in [inferable.verb for inferable in O.Verb.get_inferables()]
+    finally:
+        del context.user
@@ -0,0 +1,44 @@
+import veronique.objects as O
+from veronique import db
+from veronique.context import context
+
+
+def _changes(client, **params):
+    _, resp = client.get("/changes", params=params)
+    return resp.json
+
+
+def test_changes(admin_client):
+    since = db.conn.execute("SELECT coalesce(max(seq), 0) FROM changes").fetchone()[0]
+    context.user = O.User(0)
+    try:
+        entity = O.Claim.new_entity("Changed entity")
+        verb = O.Verb.new("changes test", data_type=O.TYPES["string"])
+        claim = O.Claim.new(entity, verb, O.Plain("x", verb))
+        assert claim.subject == entity  # delete() needs a loaded claim
+        claim.delete()
+        verb.rename("changes test (renamed)")
+    finally:
+        del context.user
+    changes = _changes(admin_client, since=since)["changes"]
+    assert [(c["table_name"], c["key"], c["operation"]) for c in changes] == [
+        ("claims", str(entity.id), "insert"),
+        ("verbs", str(verb.id), "insert"),
+        ("claims", str(claim.id), "insert"),
+        ("claims", str(claim.id), "delete"),
+        ("verbs", str(verb.id), "update"),
+    ]
+    assert {c["user_id"] for c in changes} == {0}
+
+
+def test_changes_paging(admin_client):
+    first = _changes(admin_client, limit=1)
+    assert len(first["changes"]) == 1
+    assert first["more"]
+    second = _changes(admin_client, since=first["next"], limit=1)
+    assert second["changes"][0]["seq"] > first["next"]
+
+
+def test_changes_admin_only(user_client):
+    _, resp = user_client.get("/changes")
+    assert resp.status == 403
@@ -0,0 +1,215 @@
+import pytest
+
+import veronique.objects as O
+from veronique import db, orphans
+from veronique.context import context
+
+
+def test_bulk_claim(admin_client):
+    context.user = O.User(0)
+    try:
+        entities = [O.Claim.new_entity(f"Bulk entity {i}") for i in range(3)]
+        bystander = O.Claim.new_entity("Bulk bystander")
+        verb = O.Verb.new("bulk test", data_type=O.TYPES["string"])
+        link = O.Verb.new("bulk link", data_type=O.TYPES["directed_link"])
+        bystander_data = bystander.get_data()
+    finally:
+        del context.user
+    since = db.conn.execute("SELECT max(seq) FROM changes").fetchone()[0]
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        _, resp = admin_client.post(
+            f"/claims/new/{','.join(str(e.id) for e in entities)}/outgoing",
+            data={"verb": verb.id, "value": "same for all"},
+        )
+    finally:
+        db.conn.set_trace_callback(None)
+    assert resp.status_code == 302
+    assert statements.count("COMMIT") == 1
+    rows = db.conn.execute(
+        "SELECT subject_id, value FROM claims WHERE verb_id = ? ORDER BY subject_id",
+        (verb.id,),
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [(e.id, "same for all") for e in entities]
+    assert db.conn.execute(
+        "SELECT count(*) FROM changes WHERE seq > ? AND operation = 'insert'",
+        (since,),
+    ).fetchone()[0] == 3
+    # only the subjects' data is forgotten
+    context.user = O.User(0)
+    try:
+        assert bystander.get_data() is bystander_data
+        assert entities[0].get_data()["has_claims"]
+    finally:
+        del context.user
+
+    _, resp = admin_client.post(
+        f"/claims/new/{entities[0].id},{entities[1].id}/incoming",
+        data={"verb": link.id, "value": bystander.id},
+    )
+    assert resp.status_code == 302
+    rows = db.conn.execute(
+        "SELECT subject_id, object_id FROM claims WHERE verb_id = ? ORDER BY object_id",
+        (link.id,),
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [(bystander.id, entities[0].id), (bystander.id, entities[1].id)]
+
+
+def test_bulk_avatar():
+    avatar = O.Verb(db.AVATAR)
+    context.user = O.User(0)
+    try:
+        # more than fit in one statement
+        entities = [O.Claim.new_entity(f"Bulk avatar {i}") for i in range(600)]
+        O.Claim.new_many(entities, avatar, O.Plain("old.png", avatar))
+        O.Claim.new_many(entities, avatar, O.Plain("new.png", avatar))
+    finally:
+        del context.user
+    rows = db.conn.execute(
+        "SELECT value, count(*) FROM claims WHERE verb_id = ? AND subject_id BETWEEN ? AND ? GROUP BY value",
+        (db.AVATAR, entities[0].id, entities[-1].id),
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [("new.png", 600)]
+
+
+def test_merge(admin_client):
+    context.user = O.User(0)
+    try:
+        knows = O.Verb.new("merge knows", data_type=O.TYPES["directed_link"])
+        notes = O.Verb.new("merge notes", data_type=O.TYPES["text"])
+        keep, gone, friend = (O.Claim.new_entity(f"Merge {name}") for name in ("keep", "gone", "friend"))
+        O.Claim.new(keep, knows, friend)
+        duplicate = O.Claim.new(gone, knows, friend)
+        validity = O.Claim.new(duplicate, O.Verb(db.VALID_FROM), O.Plain.decode(O.Verb(db.VALID_FROM), "2020-01-01--2020-01-01"))
+        comment = O.Claim.new(gone, O.Verb(db.COMMENT), O.Plain("about gone", O.Verb(db.COMMENT)))
+        mention = O.Claim.new(friend, notes, O.Plain(f"Knows [@{gone.id}].", notes))
+        about_duplicate = O.Claim.new(friend, knows, duplicate)
+        duplicate_mention = O.Claim.new(friend, notes, O.Plain(f"See [@{duplicate.id}].", notes))
+        between = O.Claim.new(keep, knows, gone)
+        between_comment = O.Claim.new(between, O.Verb(db.COMMENT), O.Plain("a loop soon", O.Verb(db.COMMENT)))
+        assert friend.get_data()
+    finally:
+        del context.user
+    since = db.conn.execute("SELECT max(seq) FROM changes").fetchone()[0]
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        _, resp = admin_client.post("/tools/merge", data={"value": [keep.id, gone.id]})
+    finally:
+        db.conn.set_trace_callback(None)
+    assert resp.status_code == 302
+    assert statements.count("COMMIT") == 1
+
+    def row(claim_id):
+        return db.conn.execute("SELECT * FROM claims WHERE id = ?", (claim_id,)).fetchone()
+
+    assert row(gone.id) is None
+    assert row(comment.id)["subject_id"] == keep.id
+    assert row(mention.id)["value"] == f"Knows [@{keep.id}]."
+    # the two links to friend are one now, with the data of both
+    assert row(duplicate.id) is None
+    links = db.conn.execute(
+        "SELECT id FROM claims WHERE verb_id = ? AND object_id = ?", (knows.id, friend.id),
+    ).fetchall()
+    assert len(links) == 1
+    assert row(validity.id)["subject_id"] == links[0]["id"]
+    # and everything about, linking to or mentioning the duplicate followed
+    assert row(about_duplicate.id)["object_id"] == links[0]["id"]
+    assert row(duplicate_mention.id)["value"] == f"See [@{links[0]['id']}]."
+    assert db.conn.execute(
+        "SELECT count(*) FROM changes WHERE seq > ? AND key = ? AND operation = 'update'",
+        (since, str(validity.id)),
+    ).fetchone()[0] == 1
+    # a link between the two would be a loop now, and is gone with its data
+    assert row(between.id) is None
+    assert row(between_comment.id) is None
+    assert not db.conn.execute(
+        "SELECT count(*) FROM inverted_index WHERE table_name = 'claims' AND id = ?", (gone.id,),
+    ).fetchone()[0]
+    context.user = O.User(0)
+    try:
+        assert O.Claim(mention.id).object.value == f"Knows [@{keep.id}]."
+    finally:
+        del context.user
+
+
+def test_delete_cascades(admin_client):
+    context.user = O.User(0)
+    try:
+        knows = O.Verb.new("cascade knows", data_type=O.TYPES["directed_link"])
+        doomed, friend = (O.Claim.new_entity(f"Cascade {name}") for name in ("doomed", "friend"))
+        link = O.Claim.new(friend, knows, doomed)
+        validity = O.Claim.new(link, O.Verb(db.VALID_FROM), O.Plain.decode(O.Verb(db.VALID_FROM), "2020-01-01--2020-01-01"))
+        comment = O.Claim.new(doomed, O.Verb(db.COMMENT), O.Plain("about doomed", O.Verb(db.COMMENT)))
+        assert friend.get_data()
+    finally:
+        del context.user
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        _, resp = admin_client.delete(f"/claims/{doomed.id}")
+    finally:
+        db.conn.set_trace_callback(None)
+    assert resp.status_code == 200
+    assert statements.count("COMMIT") == 1
+    gone = (doomed.id, link.id, validity.id, comment.id)
+    assert not db.conn.execute(
+        f"SELECT count(*) FROM claims WHERE id IN ({','.join('?' * len(gone))})", gone,
+    ).fetchone()[0]
+    assert db.conn.execute("SELECT id FROM claims WHERE id = ?", (friend.id,)).fetchone()
+    assert not db.conn.execute(
+        "SELECT count(*) FROM forward_index WHERE table_name = 'claims' AND id = ?", (doomed.id,),
+    ).fetchone()[0]
+    assert db.conn.execute(
+        "SELECT count(*) FROM changes WHERE table_name = 'claims' AND key = ? AND operation = 'delete'",
+        (str(validity.id),),
+    ).fetchone()[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_collect_orphans():
+    context.user = O.User(0)
+    try:
+        entity = O.Claim.new_entity("Orphan parent")
+        comment = O.Claim.new(entity, O.Verb(db.COMMENT), O.Plain("soon an orphan", O.Verb(db.COMMENT)))
+    finally:
+        del context.user
+    # as if deleted by hand, or before deletes cascaded
+    db.conn.execute("DELETE FROM claims WHERE id = ?", (entity.id,))
+    db.conn.commit()
+    O.Claim.forget(entity.id)
+
+    await orphans.collect_in_background()
+    report = orphans.reports[-1]
+    assert report["claims"] >= 1
+    assert report["index_rows"] >= 1
+    assert not db.conn.execute("SELECT id FROM claims WHERE id = ?", (comment.id,)).fetchone()
+    assert not db.conn.execute(
+        "SELECT count(*) FROM inverted_index WHERE table_name = 'claims' AND id = ?", (entity.id,),
+    ).fetchone()[0]
+
+
+@pytest.mark.asyncio
+async def test_collect_keeps_claims_of_deleted_verbs():
+    context.user = O.User(0)
+    try:
+        entity = O.Claim.new_entity("Verbless")
+        verb = O.Verb.new("soon deleted", data_type=O.TYPES["string"])
+        claim = O.Claim.new(entity, verb, O.Plain("still here", verb))
+        verb.delete()
+    finally:
+        del context.user
+
+    await orphans.collect_in_background()
+    assert db.conn.execute("SELECT id FROM claims WHERE id = ?", (claim.id,)).fetchone()
+    # the verb's ID can be reused, which would give this claim a new verb
+    db.conn.execute("DELETE FROM claims WHERE id = ?", (claim.id,))
+    db.conn.commit()
+
+
+def test_orphans_page(admin_client):
+    _, resp = admin_client.get("/settings/orphans")
+    assert resp.status_code == 200
+    _, resp = admin_client.post("/settings/orphans")
+    assert resp.status_code == 302
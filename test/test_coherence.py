@@ -0,0 +1,119 @@
+import sqlite3
+
+import pytest
+
+import veronique.objects as O
+from veronique import coherence, db
+from veronique.context import context
+from veronique.settings import settings as S
+
+
+@pytest.fixture
+def other_worker(tmp_path, monkeypatch):
+    """A second connection to the same database file, as another worker would have."""
+    path = tmp_path / "shared.db"
+    copy = sqlite3.connect(path)
+    db.conn.backup(copy)
+    copy.close()
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    monkeypatch.setattr(db, "conn", conn)
+    monkeypatch.setattr(coherence, "_data_version", None)
+    monkeypatch.setattr(coherence, "_seq", None)
+    coherence.sync()
+    other = sqlite3.connect(path)
+    other.row_factory = sqlite3.Row
+    context.user = O.User(0)
+    yield other
+    del context.user
+    other.close()
+    conn.close()
+    # don't leave anything from this database behind in the caches
+    coherence.forget_all()
+
+
+def _write(conn, sql, params, table_name, key):
+    cur = conn.cursor()
+    cur.execute(sql, params)
+    db.log_change(cur, table_name, key, "update")
+    conn.commit()
+
+
+def test_verb(other_worker):
+    verb = O.Verb.new("coherence test", data_type=O.TYPES["string"])
+    assert verb.label == "coherence test"
+    _write(
+        other_worker,
+        "UPDATE verbs SET label = 'renamed elsewhere' WHERE id = ?",
+        (verb.id,),
+        "verbs",
+        verb.id,
+    )
+    assert O.Verb(verb.id).label == "coherence test"
+    coherence.sync()
+    assert O.Verb(verb.id).label == "renamed elsewhere"
+
+
+def test_claim_data(other_worker):
+    entity = O.Claim.new_entity("Coherent entity")
+    comment = O.Claim.new(entity, O.Verb(db.COMMENT), O.Plain("before", O.Verb(db.COMMENT)))
+    assert entity.get_data()[db.COMMENT][0].object.value == "before"
+    _write(
+        other_worker,
+        "UPDATE claims SET value = 'after' WHERE id = ?",
+        (comment.id,),
+        "claims",
+        comment.id,
+    )
+    coherence.sync()
+    assert entity.get_data()[db.COMMENT][0].object.value == "after"
+
+
+def test_logout_elsewhere(other_worker):
+    generation = O.User(0).generation
+    _write(
+        other_worker,
+        "UPDATE users SET generation = generation + 1 WHERE id = 0",
+        (),
+        "users",
+        0,
+    )
+    coherence.sync()
+    assert O.User(0).generation == generation + 1
+
+
+def test_setting(other_worker):
+    S.app_name = "Before"
+    _write(
+        other_worker,
+        "UPDATE settings SET value = 'After' WHERE key = 'app_name'",
+        (),
+        "settings",
+        "app_name",
+    )
+    assert S.app_name == "Before"
+    coherence.sync()
+    assert S.app_name == "After"
+
+
+def test_nothing_changed(other_worker):
+    verb = O.Verb.new("coherence test 2", data_type=O.TYPES["string"])
+    # our own writes don't count
+    coherence.sync()
+    assert O.Verb(verb.id) is verb
+
+
+def test_many_changes(other_worker, monkeypatch):
+    monkeypatch.setattr(coherence, "COHERENCE_MAX_CHANGES", 2)
+    verb = O.Verb.new("coherence test 3", data_type=O.TYPES["string"])
+    for _ in range(3):
+        _write(other_worker, "SELECT 1", (), "claims", 0)
+    coherence.sync()
+    assert O.Verb(verb.id) is not verb
+
+
+def test_everything_changed(other_worker):
+    verb = O.Verb.new("coherence test 4", data_type=O.TYPES["string"])
+    _write(other_worker, "SELECT 1", (), coherence.EVERYTHING, coherence.EVERYTHING)
+    coherence.sync()
+    assert O.Verb(verb.id) is not verb
@@ -0,0 +1,141 @@
+import json
+from xml.etree import ElementTree
+
+import pytest
+from sanic_testing.reusable import ReusableClient
+
+import veronique.objects as O
+from veronique import export
+from veronique.context import context
+
+
+@pytest.fixture(scope="module")
+def query():
+    context.user = O.User(0)
+    alice = O.Claim.new_entity("Alice")
+    bob = O.Claim.new_entity("Bob")
+    verb = O.Verb.new("exports to", data_type=O.TYPES["directed_link"])
+    O.Claim.new(alice, verb, bob)
+    query = O.Query.new(
+        "export test",
+        f"SELECT subject_id AS from_c, verb_id AS how_v, object_id AS to_c FROM claims WHERE verb_id = {verb.id}",
+    )
+    del context.user
+    return query
+
+
+@pytest.fixture(scope="module")
+def redacted_user():
+    context.user = O.User(0)
+    O.User.new(
+        name="redacted",
+        password="redacted",
+        readable_verbs=[],
+        writable_verbs=[],
+        viewable_queries=[],
+        redact=True,
+    )
+    del context.user
+
+
+@pytest.fixture
+def redacted_client(client, redacted_user):
+    from veronique import app
+    _, resp = client.post("/login", data={"username": "redacted", "password": "redacted"})
+    with ReusableClient(app, client_kwargs={"cookies": {"session": resp.cookies["session"]}}) as rc:
+        yield rc
+
+
+def test_csv(admin_client, query):
+    _, resp = admin_client.get(f"/queries/{query.id}/export?format=csv&labels=1")
+    assert resp.status == 200
+    assert resp.headers["content-type"].startswith("text/csv")
+    header, row = resp.text.splitlines()
+    assert header == "from_c,from_c_label,how_v,how_v_label,to_c,to_c_label"
+    assert row.split(",")[1::2] == ["Alice", "exports to", "Bob"]
+
+
+def test_csv_empty(admin_client):
+    context.user = O.User(0)
+    query = O.Query.new("empty export", "SELECT id AS claim_c FROM claims WHERE 0")
+    del context.user
+    _, resp = admin_client.get(f"/queries/{query.id}/export?format=csv")
+    assert resp.status == 200
+    assert resp.text.splitlines() == ["claim_c"]
+
+
+def test_ndjson(admin_client, query):
+    _, resp = admin_client.get(f"/queries/{query.id}/export?format=ndjson")
+    (line,) = resp.text.splitlines()
+    assert set(json.loads(line)) == {"from_c", "how_v", "to_c"}
+
+
+def test_columnar(admin_client, query):
+    _, resp = admin_client.get(f"/queries/{query.id}/export?format=columnar&labels=1")
+    (chunk,) = resp.text.splitlines()
+    assert json.loads(chunk)["to_c_label"] == ["Bob"]
+
+
+def test_permissions(user_client, query):
+    _, resp = user_client.get(f"/queries/{query.id}/export")
+    assert resp.status == 403
+
+
+def test_errors(admin_client):
+    context.user = O.User(0)
+    query = O.Query.new("broken export", "SELECT * FROM nonexistent")
+    del context.user
+    _, resp = admin_client.get(f"/queries/{query.id}/export")
+    assert resp.status == 400
+    assert "no such table" in resp.text
+
+
+def test_database_ndjson(admin_client, query, monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_BATCH_SIZE", 2)
+    _, resp = admin_client.get("/export/ndjson")
+    assert resp.status == 200
+    records = [json.loads(line) for line in resp.text.splitlines()]
+    # entities and claims are mixed, in the order of their IDs
+    order = {"verb": 0, "query": 1, "entity": 2, "claim": 2}
+    assert [order[r["type"]] for r in records] == sorted(order[r["type"]] for r in records)
+    ids = [r["id"] for r in records if r["type"] in ("entity", "claim")]
+    assert ids == sorted(ids) == sorted(set(ids))
+    names = {r["name"]: r["id"] for r in records if r["type"] == "entity"}
+    (link,) = (r for r in records if r.get("object") == names["Bob"])
+    assert link["subject"] == names["Alice"]
+    assert next(r for r in records if r["type"] == "query" and r["id"] == query.id)["sql"]
+
+
+def test_database_graphs(admin_client, query):
+    _, resp = admin_client.get("/export/graphml")
+    ns = {"g": "http://graphml.graphdrawing.org/xmlns"}
+    graph = ElementTree.fromstring(resp.body).find("g:graph", ns)
+    nodes = {node.get("id"): node.find("g:data", ns).text for node in graph.findall("g:node", ns)}
+    assert any(
+        (nodes[edge.get("source")], nodes[edge.get("target")]) == ("Alice", "Bob")
+        for edge in graph.findall("g:edge", ns)
+    )
+    _, resp = admin_client.get("/export/gexf")
+    ns = {"g": "http://gexf.net/1.3"}
+    graph = ElementTree.fromstring(resp.body).find("g:graph", ns)
+    assert {node.get("label") for node in graph.iter("{http://gexf.net/1.3}node")} >= {"Alice", "Bob"}
+    assert graph.find("g:edges/g:edge[@label='exports to']", ns) is not None
+
+
+def test_database_permissions(user_client, query):
+    _, resp = user_client.get("/export/ndjson")
+    assert resp.status == 200
+    records = [json.loads(line) for line in resp.text.splitlines()]
+    # only the built-in verbs are readable, and no queries are viewable
+    assert {r["type"] for r in records} <= {"verb", "entity", "claim"}
+    assert all(r["id"] < 0 for r in records if r["type"] == "verb")
+    assert all(r["verb"] < 0 for r in records if r["type"] == "claim")
+
+
+@pytest.mark.parametrize("fmt", export.DATABASE_FORMATS)
+def test_database_redacted(redacted_client, query, fmt):
+    _, resp = redacted_client.get(f"/export/{fmt}")
+    assert resp.status == 200
+    assert "Alice" not in resp.text
+    assert "Claim #" in resp.text
+
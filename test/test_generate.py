@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from veronique import coherence, db, generate
+from veronique.context import context
+
+
+@pytest.fixture
+def copy(tmp_path, monkeypatch):
+    """Return a function that switches to a fresh copy of the test database."""
+    original = db.conn
+    connections = []
+
+    def switch(name):
+        conn = sqlite3.connect(tmp_path / name)
+        original.backup(conn)
+        conn.row_factory = sqlite3.Row
+        connections.append(conn)
+        monkeypatch.setattr(db, "conn", conn)
+        coherence.forget_all()
+        return conn
+
+    yield switch
+    del context.user
+    for conn in connections:
+        conn.close()
+    coherence.forget_all()
+
+
+def _claims(conn):
+    return conn.execute(
+        "SELECT id, subject_id, verb_id, value, object_id FROM claims ORDER BY id",
+    ).fetchall()
+
+
+def test_generate(copy):
+    first = copy("first.db")
+    before = first.execute("SELECT count(*) FROM claims").fetchone()[0]
+    written = generate.generate(2000, seed=1, report=lambda message: None)
+    assert written >= 2000
+    assert first.execute("SELECT count(*) FROM claims").fetchone()[0] == before + written + 4
+    # mentions, validities and avatars are all there
+    assert first.execute("SELECT count(*) FROM claims WHERE value LIKE '%[@%]%'").fetchone()[0]
+    assert first.execute(
+        "SELECT count(*) FROM claims v JOIN claims c ON v.subject_id = c.id WHERE v.verb_id = ?",
+        (db.VALID_FROM,),
+    ).fetchone()[0]
+    assert first.execute("SELECT count(*) FROM claims WHERE verb_id = ?", (db.AVATAR,)).fetchone()[0]
+    # and entities can be found
+    assert first.execute("SELECT count(DISTINCT id) FROM forward_index WHERE table_name = 'claims'").fetchone()[0]
+    del context.user
+
+    second = copy("second.db")
+    generate.generate(2000, seed=1, report=lambda message: None)
+    assert [tuple(row) for row in _claims(first)] == [tuple(row) for row in _claims(second)]
@@ -0,0 +1,95 @@
+import json
+
+import veronique.objects as O
+from veronique import db, importer
+from veronique.context import context
+from veronique.search import find
+
+
+def _records(*records):
+    return "".join(f"{json.dumps(record)}\n" for record in records)
+
+
+def test_import(tmp_path):
+    context.user = O.User(0)
+    try:
+        O.Verb.new("import notes", data_type=O.TYPES["text"])
+        O.Verb.new("import knows", data_type=O.TYPES["directed_link"])
+    finally:
+        del context.user
+    path = tmp_path / "people.jsonl"
+    path.write_text(
+        _records(
+            {"key": "ada", "name": "Ada Importington"},
+            {"key": "charles", "name": "Charles Importington"},
+            {"key": "knows", "subject": "ada", "verb": "import knows", "object": "charles"},
+            {"subject": "knows", "verb": "valid from", "value": "1833-06-05--1833-06-05"},
+            {"subject": "charles", "verb": "import notes", "value": "Corresponds with [@ada]."},
+            {"subject": "ada", "verb": "no such verb", "value": "x"},
+            {"subject": "nobody", "verb": "comment", "value": "x"},
+        )
+        + "not json\n",
+    )
+    since = db.conn.execute("SELECT max(seq) FROM changes").fetchone()[0]
+    messages = []
+    stats = importer.import_file(path, report=messages.append)
+    assert stats["records"] == 8
+    assert (stats["entities"], stats["claims"], stats["skipped"], stats["errors"]) == (2, 3, 0, 3)
+    assert len(messages) == 3
+    assert messages[0].startswith("line 6:")
+
+    ada, charles = (
+        db.conn.execute(
+            "SELECT claim_id FROM external_keys WHERE source = 'people' AND key = ?", (key,),
+        ).fetchone()[0]
+        for key in ("ada", "charles")
+    )
+    # deferred until the end, but done
+    assert db.conn.execute(
+        "SELECT value FROM claims WHERE subject_id = ? AND value LIKE 'Corresponds%'", (charles,),
+    ).fetchone()[0] == f"Corresponds with [@{ada}]."
+    assert {row["id"] for row in find(db.conn.cursor(), "Importington", table="claims")} == {ada, charles}
+    assert db.conn.execute(
+        "SELECT count(*) FROM changes WHERE seq > ?", (since,),
+    ).fetchone()[0] == 5
+    assert not db.conn.execute("SELECT count(*) FROM external_keys WHERE pending").fetchone()[0]
+
+    # again, with one more claim
+    with path.open("a") as f:
+        f.write(_records({"subject": "ada", "verb": "comment", "value": "first programmer"}))
+    stats = importer.import_file(path, report=messages.append)
+    assert (stats["entities"], stats["claims"], stats["skipped"]) == (0, 1, 5)
+    assert db.conn.execute(
+        "SELECT count(*) FROM claims WHERE value = 'Ada Importington'",
+    ).fetchone()[0] == 1
+
+
+def test_import_csv(tmp_path):
+    path = tmp_path / "places.csv"
+    path.write_text(
+        "key,name,subject,verb,value,object\n"
+        "rome,Importable Rome,,,,\n"
+        ",,rome,comment,eternal,\n"
+        ",,#-1,comment,not allowed,\n",
+    )
+    stats = importer.import_file(path, report=lambda message: None)
+    assert (stats["entities"], stats["claims"], stats["errors"]) == (1, 1, 1)
+    assert find(db.conn.cursor(), "Importable Rome", table="claims")
+
+
+def test_reimport_after_delete(tmp_path):
+    path = tmp_path / "deleted.jsonl"
+    path.write_text(_records({"key": "gone", "name": "Deleted Importee"}))
+    importer.import_file(path, report=lambda message: None)
+    (claim_id,) = db.conn.execute(
+        "SELECT claim_id FROM external_keys WHERE source = 'deleted' AND key = 'gone'",
+    ).fetchone()
+    O.Claim(claim_id).delete()
+    context.user = O.User(0)
+    try:
+        # takes the same ID, if it was the highest one
+        O.Claim.new_entity("Unrelated newcomer")
+    finally:
+        del context.user
+    stats = importer.import_file(path, report=lambda message: None)
+    assert (stats["entities"], stats["skipped"]) == (1, 0)
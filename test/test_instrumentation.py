@@ -0,0 +1,89 @@
+import pytest
+
+from veronique import db, instrumentation
+from veronique.context import context
+
+
+@pytest.mark.parametrize(
+    ("sql", "shape"),
+    [
+        ("SELECT * FROM claims WHERE id = ?", "SELECT * FROM claims WHERE id = ?"),
+        (
+            """
+            SELECT value
+            FROM settings  -- cached elsewhere
+            WHERE key = 'page_size'
+            """,
+            "SELECT value FROM settings WHERE key = ?",
+        ),
+        ("SELECT * FROM verbs WHERE id IN (?, ?,?) AND id > 12", "SELECT * FROM verbs WHERE id IN (...) AND id > ?"),
+        ("SELECT * FROM t1 WHERE x = 'it''s' LIMIT 1.5", "SELECT * FROM t1 WHERE x = ? LIMIT ?"),
+    ],
+)
+def test_normalize(sql, shape):
+    assert instrumentation.normalize(sql) == shape
+
+
+def test_attribution():
+    instrumentation.start_request("/instrumented")
+    db.conn.execute("SELECT 1 AS instrumented").fetchall()
+    cur = db.conn.cursor()
+    cur.execute("SELECT 2 AS instrumented")
+    cur.fetchone()
+    assert context.timing.queries == 2
+    assert context.timing.sql_seconds > 0
+    stats = instrumentation.shapes["SELECT ? AS instrumented"]
+    assert stats.count >= 2
+    assert stats.rows >= 2
+    header = instrumentation.finish_request()
+    assert header.startswith('sql;dur=')
+    assert '"2 queries"' in header
+    assert instrumentation.endpoints["/instrumented"].queries.count == 1
+    del context.timing
+
+
+def test_server_timing(admin_client):
+    _, response = admin_client.get("/claims")
+    assert 'desc="' in response.headers["Server-Timing"]
+    _, response = admin_client.get("/metrics")
+    assert 'veronique_request_sql_queries_bucket{endpoint="/claims",le="+Inf"}' in response.text
+    assert "veronique_sql_statements_total{shape=" in response.text
+    _, response = admin_client.get("/metrics/sql")
+    assert response.status == 200
+    assert "/claims" in response.text
+
+
+def test_admin_only(user_client):
+    _, response = user_client.get("/metrics")
+    assert response.status == 403
+
+
+def test_slow_queries(admin_client):
+    db.conn.execute("CREATE TABLE slow_test (id INTEGER PRIMARY KEY, n INTEGER)")
+    db.conn.executemany("INSERT INTO slow_test (n) VALUES (?)", ((i,) for i in range(1000)))
+    db.conn.commit()
+    # anything is slow with such a threshold
+    instrumentation.start_request("/slow", slow_threshold=1e-9)
+    db.conn.execute("SELECT * FROM slow_test WHERE n > ? ORDER BY n", (10,)).fetchall()
+    instrumentation.finish_request()
+    del context.timing
+    instrumentation.log_slow_queries(db.conn)
+    row = db.conn.execute(
+        "SELECT * FROM slow_queries WHERE shape LIKE '%slow_test%' ORDER BY id DESC",
+    ).fetchone()
+    assert row["endpoint"] == "/slow"
+    assert row["shape"] == "SELECT * FROM slow_test WHERE n > ? ORDER BY n"
+    assert row["parameters"] == 1
+    assert "SCAN slow_test" in row["plan"]
+    _, response = admin_client.get("/settings/slow-queries")
+    assert "SCAN slow_test" in response.text
+
+
+def test_slow_query_log_size(monkeypatch):
+    monkeypatch.setattr(instrumentation, "SLOW_QUERY_LOG_SIZE", 3)
+    instrumentation.start_request("/slow", slow_threshold=1e-9)
+    for i in range(5):
+        db.conn.execute(f"SELECT {i} AS slow_{i}").fetchall()
+    del context.timing
+    instrumentation.log_slow_queries(db.conn)
+    assert db.conn.execute("SELECT count(*) FROM slow_queries").fetchone()[0] == 3
@@ -0,0 +1,91 @@
+import json
+import sqlite3
+
+import pytest
+
+from veronique import db
+
+MIGRATIONS = dict(db.MIGRATIONS)
+
+@pytest.fixture
+def connection(tmp_path):
+    conn = sqlite3.connect(tmp_path / "migrations.db")
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def _migrate(conn, monkeypatch, numbers):
+    monkeypatch.setattr(db, "MIGRATIONS", {n: MIGRATIONS[n] for n in numbers})
+    return db.migrate(conn, report=lambda message: None)
+
+
+def test_resumable(connection, monkeypatch):
+    fail_at = 30
+    monkeypatch.setattr(db, "MIGRATIONS", {})
+
+    @db.migration(0)
+    def create(cur):
+        cur.execute("CREATE TABLE state (version INTEGER)")
+        cur.execute("INSERT INTO state (version) VALUES (0)")
+        cur.execute("CREATE TABLE numbers (id INTEGER PRIMARY KEY, n INTEGER)")
+        cur.executemany("INSERT INTO numbers (n) VALUES (?)", ((i,) for i in range(100)))
+
+    @db.migration(1, resumable=True)
+    def double(cur, checkpoint):
+        for first, last, last_id in db.id_ranges(cur, "numbers", checkpoint, size=10):
+            if first > fail_at:
+                raise sqlite3.OperationalError("interrupted")
+            cur.execute("UPDATE numbers SET n = n * 2 WHERE id BETWEEN ? AND ?", (first, last))
+            yield last, last, last_id
+
+    with pytest.raises(SystemExit):
+        db.migrate(connection, report=lambda message: None)
+    # the chunks before the error are kept, along with the checkpoint
+    assert db.current_version(connection) == 1
+    assert connection.execute("SELECT checkpoint FROM migration_checkpoints").fetchone()[0] == 30
+    assert connection.execute("SELECT n FROM numbers WHERE id = 30").fetchone()[0] == 58
+    assert connection.execute("SELECT n FROM numbers WHERE id = 31").fetchone()[0] == 30
+
+    fail_at = 100
+    timings = db.migrate(connection, report=lambda message: None)
+    assert list(timings) == ["double"]
+    assert db.pending(connection) == []
+    assert connection.execute("SELECT sum(n) FROM numbers").fetchone()[0] == 2 * sum(range(100))
+    assert connection.execute("SELECT * FROM migration_checkpoints").fetchall() == []
+
+
+def test_converted_migrations(connection, monkeypatch):
+    with open("veronique_initial_pw", "w") as f:
+        f.write("admin")
+    _migrate(connection, monkeypatch, range(23))
+    cur = connection.cursor()
+    cur.execute(
+        "INSERT INTO verbs (id, label, data_type, extra) VALUES (1, 'mood', 'choice', ?)",
+        (json.dumps([" happy", "sad\n", "\u3000bored\xa0"]),),
+    )
+    cur.execute("INSERT INTO verbs (id, label, data_type) VALUES (2, 'notes', 'text')")
+    cur.execute("INSERT INTO verbs (id, label, data_type) VALUES (3, 'nickname', 'string')")
+    for verb_id, value in [
+        (1, " happy"),
+        (1, "\u3000bored\xa0"),
+        (2, "met <@5> and <@12>"),
+        (3, "<@5>"),
+        (db.VALID_FROM, "1990-0?-??"),
+        (db.VALID_UNTIL, "1985"),
+    ]:
+        cur.execute("INSERT INTO claims (verb_id, value) VALUES (?, ?)", (verb_id, value))
+    connection.commit()
+
+    _migrate(connection, monkeypatch, range(23, 28))
+    assert json.loads(
+        connection.execute("SELECT extra FROM verbs WHERE id = 1").fetchone()[0]
+    ) == ["happy", "sad", "bored"]
+    assert [row[0] for row in connection.execute("SELECT value FROM claims ORDER BY id")] == [
+        "happy",
+        "bored",
+        "met [@5] and [@12]",
+        "<@5>",
+        "1990-01-01--1990-09-30",
+        "1985-01-01--1985-12-31",
+    ]
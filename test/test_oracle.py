@@ -0,0 +1,49 @@
+import pytest
+
+from veronique.analytics import Graph
+from veronique.oracle import UNREACHABLE, DistanceOracle, bfs, shortest_path
+
+LINK = 1
+SECRET_LINK = 2
+
+
+@pytest.fixture
+def graph():
+    # a ring 1..8 with a shortcut 1-5 via a secret verb, plus a separate pair
+    return Graph(
+        0,
+        [
+            *((n, LINK, n % 8 + 1) for n in range(1, 9)),
+            (1, SECRET_LINK, 5),
+            (20, LINK, 21),
+        ],
+    )
+
+
+def test_bfs(graph):
+    distances = bfs(graph, graph.index[1])
+    assert distances[graph.index[5]] == 1
+    assert distances[graph.index[4]] == 2
+    assert distances[graph.index[20]] == UNREACHABLE
+
+
+def test_estimate(graph):
+    oracle = DistanceOracle(graph, landmark_count=4)
+    lower, upper = oracle.estimate(2, 6)
+    assert lower <= 3 <= upper
+    assert oracle.estimate(1, 1) == (0, 0)
+    assert oracle.estimate(1, 20) == (None, None)
+    assert oracle.estimate(1, 999) == (None, None)
+
+
+@pytest.mark.parametrize("with_oracle", [False, True])
+def test_shortest_path(graph, with_oracle):
+    oracle = DistanceOracle(graph, landmark_count=4) if with_oracle else None
+    assert shortest_path(graph, 1, 5, oracle=oracle) == [1, 5]
+    assert len(shortest_path(graph, 2, 6, oracle=oracle)) == 4
+    assert shortest_path(graph, 1, 5, verbs={LINK}, oracle=oracle) in (
+        [1, 2, 3, 4, 5],
+        [1, 8, 7, 6, 5],
+    )
+    assert shortest_path(graph, 1, 20, oracle=oracle) is None
+    assert shortest_path(graph, 20, 21, verbs={SECRET_LINK}, oracle=oracle) is None
@@ -0,0 +1,44 @@
+import marshal
+
+from veronique import profiling
+from veronique.settings import settings as S
+
+
+def test_on_demand(admin_client):
+    _, response = admin_client.get("/claims?profile=1")
+    location = response.headers["X-Profile"]
+    _, response = admin_client.get(location)
+    assert "function calls" in response.text
+    _, response = admin_client.get(f"{location}/download")
+    stats = marshal.loads(response.body)
+    assert any(name == "list_labelled_claims" for _, _, name in stats)
+    _, response = admin_client.get("/profiles")
+    assert location in response.text
+
+
+def test_header(admin_client):
+    _, response = admin_client.get("/verbs", headers={"X-Profile": "1"})
+    assert "X-Profile" in response.headers
+
+
+def test_not_for_users(user_client):
+    _, response = user_client.get("/claims?profile=1")
+    assert "X-Profile" not in response.headers
+    _, response = user_client.get("/profiles")
+    assert response.status == 403
+
+
+def test_sampling(user_client, monkeypatch):
+    monkeypatch.setattr(profiling, "_last_sample", float("-inf"))
+    S.update({"profiling_endpoint": "/queries", "profiling_rate": 100})
+    try:
+        _, response = user_client.get("/queries")
+        assert "X-Profile" in response.headers
+        assert profiling.profiles[-1].sampled
+        # not again within PROFILING_MIN_INTERVAL
+        _, response = user_client.get("/queries")
+        assert "X-Profile" not in response.headers
+        _, response = user_client.get("/verbs")
+        assert "X-Profile" not in response.headers
+    finally:
+        S.update({"profiling_endpoint": None, "profiling_rate": None})
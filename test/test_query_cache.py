@@ -0,0 +1,63 @@
+import pytest
+
+import veronique.objects as O
+from veronique import db, instrumentation, query_cache
+
+
+def _query(label):
+    cur = db.conn.cursor()
+    cur.execute("CREATE TABLE IF NOT EXISTS numbers (n INTEGER)")
+    cur.execute("DELETE FROM numbers")
+    cur.executemany("INSERT INTO numbers (n) VALUES (?)", ((n,) for n in range(50)))
+    db.conn.commit()
+    return O.Query.new(label, "SELECT n FROM numbers ORDER BY n")
+
+
+@pytest.mark.asyncio
+async def test_pages_come_from_one_execution():
+    query = _query("cached pages")
+    calls = []
+
+    async def execute(limit, offset):
+        calls.append((limit, offset))
+        return db.conn.execute(f"{query.sql} LIMIT {limit} OFFSET {offset}").fetchall()
+
+    page = await query_cache.get_page(query, 0, 20, execute)
+    assert [row["n"] for row in page] == list(range(20))
+    page = await query_cache.get_page(query, 2, 20, execute)
+    assert [row["n"] for row in page] == list(range(40, 50))
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate():
+    query = O.Query.new("cache invalidation", "SELECT key FROM settings WHERE key LIKE 'cache test %'")
+    assert len(await query.run(page_no=0, page_size=100)) == 0
+    db.conn.execute("INSERT INTO settings (key, value) VALUES ('cache test 1', '')")
+    db.conn.commit()
+    assert len(await query.run(page_no=0, page_size=100)) == 1
+
+
+@pytest.mark.asyncio
+async def test_housekeeping_keeps_cache(monkeypatch):
+    query = _query("cache housekeeping")
+    assert len(await query.run(page_no=0, page_size=100)) == 50
+    # e.g. this query itself was slow
+    monkeypatch.setattr(
+        instrumentation, "_slow", [("2026-01-01 00:00:00", "/queries/<query_id>", query.sql, "[]", 1000, "")],
+    )
+    instrumentation.log_slow_queries(db.conn)
+    db.conn.execute("UPDATE users SET last_session_at = datetime('now') WHERE id = 0")
+    db.conn.commit()
+    assert query_cache.lookup(query) is not None
+
+
+@pytest.mark.asyncio
+async def test_ttl_ignores_writes():
+    query = _query("cache ttl")
+    query.update(query.sql, query.label, cache_ttl=600)
+    assert len(await query.run(page_no=0, page_size=100)) == 50
+    db.conn.execute("INSERT INTO numbers (n) VALUES (50)")
+    db.conn.commit()
+    assert len(await query.run(page_no=0, page_size=100)) == 50
+    assert query_cache.lookup(query) is not None
@@ -0,0 +1,136 @@
+"""
+Budgets for the number of SQL statements that pages run.
+
+Pages are requested with cold caches against a generated database, and the
+number of statements is taken from the Server-Timing header. A page that runs
+more statements than its budget most likely does something once per item it
+shows (N+1 queries); if more statements are really needed, raise the budget in
+the same change, so that it's a deliberate decision.
+
+Pages that would need a budget growing with the data instead are requested
+against two databases of different sizes, and may not run more statements on
+the larger one.
+"""
+
+import re
+import sqlite3
+from contextlib import contextmanager
+
+import pytest
+
+import veronique.objects as O
+from veronique import coherence, db, generate, instrumentation, security
+from veronique.context import context
+
+STATEMENTS = re.compile(r'desc="(\d+) queries"')
+
+# route -> maximum number of statements, as admin; about 15% above what they
+# took when the budget was last set
+BUDGETS = {
+    "/": 70,
+    "/claims": 160,
+    "/claims/{entity}": 235,
+    "/claims/{entity}/edit": 5,
+    "/verbs/{verb}": 220,
+    "/queries/{query}": 11,
+    "/search?q={term}": 165,
+    "/autocomplete/link/query/0?ac-query={term}": 44,
+    "/settings": 4,
+}
+# routes that show everything there is, or a page of it
+SCALED = ["/network", "/verbs", "/queries", "/users"]
+# claims to generate -> verbs, queries and users to add; even the smaller one
+# fills a page of each
+SIZES = {300: 25, 1200: 50}
+# users can only see what they're allowed to, which changes the queries needed
+USER_BUDGETS = {
+    "/": 6,
+    "/claims": 82,
+    "/claims/{entity}": 19,
+    "/search?q={term}": 82,
+}
+
+
+@contextmanager
+def _copy(path, claims):
+    """Switch to a copy of the test database with generated data in it."""
+    conn = sqlite3.connect(path, factory=instrumentation.Connection)
+    db.conn.backup(conn)
+    conn.row_factory = sqlite3.Row
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(db, "conn", conn)
+        coherence.forget_all()
+        generate.generate(claims, seed=0, report=lambda message: None)
+        del context.user
+        yield conn
+    conn.close()
+    coherence.forget_all()
+
+
+@pytest.fixture(scope="module")
+def seeded(tmp_path_factory):
+    with _copy(tmp_path_factory.mktemp("seeded") / "seeded.db", 1000) as conn:
+        entity = conn.execute(
+            """
+            SELECT object_id FROM claims
+            WHERE object_id IS NOT NULL AND verb_id >= 0
+            GROUP BY object_id
+            ORDER BY count(*) DESC
+            LIMIT 1
+            """,
+        ).fetchone()[0]
+        yield {
+            "entity": entity,
+            "verb": conn.execute("SELECT max(id) FROM verbs WHERE data_type = 'directed_link'").fetchone()[0],
+            "query": conn.execute("SELECT max(id) FROM queries WHERE label LIKE 'Most linked%'").fetchone()[0],
+            "term": conn.execute("SELECT value FROM claims WHERE id = ?", (entity,)).fetchone()[0][:4],
+        }
+
+
+def statements(client, url):
+    """Request a page with cold caches and return how many statements it ran."""
+    coherence.forget_all()
+    _, response = client.get(url)
+    assert response.status == 200, url
+    return int(STATEMENTS.search(response.headers["Server-Timing"]).group(1))
+
+
+@pytest.mark.parametrize("route", BUDGETS)
+def test_admin(seeded, admin_client, route):
+    url = route.format(**seeded)
+    count = statements(admin_client, url)
+    assert count <= BUDGETS[route], f"{url} ran {count} statements, budget is {BUDGETS[route]}"
+
+
+@pytest.mark.parametrize("route", USER_BUDGETS)
+def test_user(seeded, user_client, route):
+    url = route.format(**seeded)
+    count = statements(user_client, url)
+    assert count <= USER_BUDGETS[route], f"{url} ran {count} statements, budget is {USER_BUDGETS[route]}"
+
+
+def test_scale(admin_client, tmp_path, monkeypatch):
+    # users are only added to be listed, they don't need safe passwords
+    monkeypatch.setattr(security, "SECURITY_PBKDF2_HMAC_ROUNDS", 1)
+    counts = {}
+    for claims, rows in SIZES.items():
+        with _copy(tmp_path / f"{claims}.db", claims):
+            context.user = O.User(0)
+            try:
+                for i in range(rows):
+                    O.Verb.new(f"scale {claims} {i}", data_type=O.TYPES["string"])
+                    O.Query.new(f"Scale {claims} {i}", "SELECT 1")
+                    O.User.new(
+                        name=f"scale {claims} {i}",
+                        password="scale",
+                        readable_verbs=[],
+                        writable_verbs=[],
+                        viewable_queries=[],
+                        redact=False,
+                    )
+            finally:
+                del context.user
+            counts[claims] = {route: statements(admin_client, route) for route in SCALED}
+    small, large = counts.values()
+    for route in SCALED:
+        assert large[route] <= small[route], f"{route} ran {small[route]} statements, then {large[route]} with more data"
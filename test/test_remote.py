@@ -0,0 +1,151 @@
+import json
+import sqlite3
+
+import veronique.objects as O
+from veronique import db, protocol, remote
+from veronique.context import context
+
+
+def _messages(resp):
+    return [json.loads(line) for line in resp.text.splitlines()]
+
+
+def test_single_statement(admin_client):
+    _, resp = admin_client.post("/queries/remote", json={"q": "SELECT 1 AS x"})
+    assert resp.json == [{"x": 1}]
+
+
+def test_batch(admin_client):
+    body, headers = protocol.encode(
+        {
+            "batch": [
+                {"q": "SELECT :n AS n", "many": [{"n": n} for n in range(3)]},
+                {"q": "SELECT 'a' AS a WHERE 0"},
+                {"q": "SELECT value AS v FROM json_each('[1,2,3]')"},
+            ],
+        },
+        compress=True,
+    )
+    _, resp = admin_client.post("/queries/remote", content=body, headers=headers)
+    assert resp.status == 200
+    messages = _messages(resp)
+    assert messages[-1]["done"]
+    assert [m["rows"] for m in messages[:3]] == [[[0]], [[1]], [[2]]]
+    # the empty result (index 3) has no messages
+    assert messages[3] == {"i": 4, "columns": ["v"], "rows": [[1], [2], [3]]}
+
+
+def test_batch_error(admin_client):
+    _, resp = admin_client.post(
+        "/queries/remote",
+        json={"batch": [{"q": "SELECT 1"}, {"q": "DELETE FROM claims"}, {"q": "SELECT 2"}]},
+    )
+    messages = _messages(resp)
+    assert messages[-1]["i"] == 1
+    assert "readonly" in messages[-1]["error"]
+
+
+def test_response_compression(admin_client):
+    _, resp = admin_client.post(
+        "/queries/remote",
+        json={"batch": [{"q": "SELECT 1 AS x"}]},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert resp.headers["content-encoding"] == "gzip"
+    # decompressed transparently by the test client, just like by requests
+    assert _messages(resp)[0]["rows"] == [[1]]
+
+
+def _revision(client):
+    _, resp = client.get("/queries/remote/revision")
+    return resp.json["revision"]
+
+
+def test_is_write():
+    for sql in (
+        "insert INTO claims (verb_id, value) VALUES (-1, 'x')",
+        "WITH old(id) AS (SELECT id FROM claims WHERE value = ')') DELETE FROM claims WHERE id IN old",
+        "WITH RECURSIVE n(i) AS (SELECT 1 UNION SELECT i + 1 FROM n) UPDATE claims SET value = 'x' WHERE id IN n",
+        "WITH n AS NOT MATERIALIZED (SELECT 2), m AS (SELECT 3) INSERT INTO claims (verb_id, value) SELECT * FROM n, m",
+        "PRAGMA user_version = 2",
+        "VACUUM",
+    ):
+        assert remote.is_write(sql), sql
+    for sql in (
+        "SELECT * FROM updates",
+        "WITH deleted AS (SELECT 1) SELECT * FROM deleted",
+        "PRAGMA data_version",
+        "PRAGMA table_info(claims)",
+    ):
+        assert not remote.is_write(sql), sql
+
+
+def test_write_and_revision(admin_client):
+    revision = _revision(admin_client)
+    _, resp = admin_client.post(
+        "/queries/remote/write",
+        json={"batch": [{"q": "INSERT INTO claims (verb_id, value) VALUES (-1, 'Remote')"}]},
+    )
+    assert resp.status == 200
+    (result,) = resp.json["results"]
+    assert result["rowcount"] == 1
+    assert resp.json["revision"] > revision
+
+    _, resp = admin_client.post(
+        "/queries/remote",
+        json={"batch": [{"q": "SELECT value FROM claims WHERE id = ?", "p": [result["lastrowid"]]}]},
+    )
+    first, done = _messages(resp)
+    assert first["rows"] == [["Remote"]]
+    assert done["revision"] == _revision(admin_client)
+
+
+def test_write_is_logged(admin_client):
+    context.user = O.User(0)
+    try:
+        entity = O.Claim.new_entity("Remotely renamed")
+        assert entity.get_data() is not None
+    finally:
+        del context.user
+    _, resp = admin_client.post(
+        "/queries/remote/write",
+        json={"batch": [{"q": "UPDATE claims SET value = 'Renamed remotely' WHERE id = ?", "p": [entity.id]}]},
+    )
+    assert resp.status == 200
+    # this worker forgot everything, and others will, too
+    assert O.Claim(entity.id) is not entity
+    assert tuple(db.conn.execute(
+        "SELECT table_name, key FROM changes ORDER BY seq DESC LIMIT 1",
+    ).fetchone()) == ("*", "*")
+
+
+def test_write_rolls_back_on_error(admin_client):
+    revision = _revision(admin_client)
+    _, resp = admin_client.post(
+        "/queries/remote/write",
+        json={
+            "batch": [
+                {"q": "INSERT INTO claims (verb_id, value) VALUES (-1, 'Rolled back')"},
+                {"q": "INSERT INTO nonexistent VALUES (1)"},
+            ],
+        },
+    )
+    assert resp.status == 400
+    assert _revision(admin_client) == revision
+
+
+def test_snapshot(admin_client, tmp_path):
+    _, resp = admin_client.get("/queries/remote/snapshot")
+    path = tmp_path / "snapshot.db"
+    path.write_bytes(resp.content)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT revision FROM state").fetchone()[0] == int(resp.headers["x-revision"])
+    conn.close()
+
+
+def test_remote_access_is_admin_only(user_client):
+    for path in ("revision", "snapshot"):
+        _, resp = user_client.get(f"/queries/remote/{path}")
+        assert resp.status == 403
+    _, resp = user_client.post("/queries/remote/write", json={"batch": []})
+    assert resp.status == 403
@@ -0,0 +1,129 @@
+import sqlite3
+from datetime import timedelta
+
+import pytest
+
+from veronique import db, sandbox
+
+RUNAWAY = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n)
+    SELECT count(*) FROM n
+"""
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # the sandbox needs a database file to open its own connections to
+    path = tmp_path / "sandbox.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE numbers (n INTEGER)")
+    conn.executemany("INSERT INTO numbers (n) VALUES (?)", ((n,) for n in range(50)))
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, "path", str(path))
+    monkeypatch.setattr(sandbox, "_idle", [])
+    return path
+
+
+@pytest.mark.asyncio
+async def test_run(database):
+    rows = await sandbox.run("SELECT sum(n) AS total FROM numbers WHERE n < ?", (10,))
+    assert rows[0]["total"] == 45
+
+
+@pytest.mark.asyncio
+async def test_read_only(database):
+    with pytest.raises(sqlite3.OperationalError):
+        await sandbox.run("DELETE FROM numbers")
+    assert len(await sandbox.run("SELECT * FROM numbers")) == 50
+
+
+@pytest.mark.asyncio
+async def test_row_limit(database):
+    with pytest.raises(sandbox.QueryError, match="more than 10 rows"):
+        await sandbox.run("SELECT * FROM numbers", max_rows=10)
+
+
+def test_step_limit(database):
+    with pytest.raises(sandbox.QueryError, match="budget"):
+        sandbox.execute(RUNAWAY, budget=sandbox.Budget(step_limit=1_000_000))
+
+
+def test_time_limit(database):
+    budget = sandbox.Budget(time_limit=timedelta(milliseconds=100))
+    with pytest.raises(sandbox.QueryError, match="longer than 0.1 seconds"):
+        sandbox.execute(RUNAWAY, budget=budget)
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels(database):
+    class Transport:
+        def is_closing(self):
+            return True
+
+    class Request:
+        transport = Transport()
+
+    with pytest.raises(sandbox.QueryError, match="cancelled"):
+        await sandbox.run(RUNAWAY, request=Request())
+
+
+def test_main_connection_fallback():
+    # the test suite runs on an in-memory database
+    with pytest.raises(sqlite3.OperationalError):
+        sandbox.execute("DELETE FROM verbs")
+    with pytest.raises(sandbox.QueryError, match="budget"):
+        sandbox.execute(RUNAWAY, budget=sandbox.Budget(step_limit=1_000_000))
+    assert db.conn.execute("PRAGMA query_only").fetchone()[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream(database):
+    batches = [
+        [row["n"] for row in rows]
+        async for rows in sandbox.stream("SELECT n FROM numbers ORDER BY n", batch_size=20)
+    ]
+    assert [len(batch) for batch in batches] == [20, 20, 10]
+    assert batches[2][-1] == 49
+    assert len(sandbox._idle) == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_deadline(database, monkeypatch):
+    # a slow client can't keep a pooled connection for longer than the time limit
+    batches = sandbox.stream("SELECT n FROM numbers ORDER BY n", batch_size=20)
+    assert len(await batches.__anext__()) == 20
+    later = sandbox.monotonic() + 3600
+    monkeypatch.setattr(sandbox, "monotonic", lambda: later)
+    with pytest.raises(sandbox.QueryError, match="longer than"):
+        await batches.__anext__()
+    assert len(sandbox._idle) == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_main_connection_fallback():
+    batches = sandbox.stream("SELECT id FROM verbs WHERE 0")
+    (batch,) = [batch async for batch in batches]
+    assert batch == []
+    assert batch.columns == ["id"]
+    batches = sandbox.stream("SELECT id FROM verbs", batch_size=1)
+    await batches.__anext__()
+    # others can write while the stream waits for its client
+    assert db.conn.execute("PRAGMA query_only").fetchone()[0] == 0
+    await batches.aclose()
+
+
+@pytest.mark.asyncio
+async def test_snapshot(database):
+    writer = sqlite3.connect(database, timeout=0)
+    writer.execute("PRAGMA journal_mode = WAL")
+    with sandbox.snapshot() as conn:
+        # the writer doesn't wait for the reader, and the reader doesn't see
+        # what it wrote
+        writer.execute("INSERT INTO numbers (n) VALUES (50)")
+        writer.commit()
+        batches = [rows async for rows in sandbox.stream("SELECT n FROM numbers", batch_size=20, conn=conn)]
+        assert sum(map(len, batches)) == 50
+    writer.close()
+    # the connection was its own, not one from the pool
+    assert sandbox._idle == []
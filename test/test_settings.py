@@ -0,0 +1,97 @@
+from types import SimpleNamespace
+
+import pytest
+
+from veronique import coherence, db
+from veronique.constants import DEFAULT_PAGE_SIZE
+from veronique.context import context
+from veronique.settings import settings as S
+
+
+@pytest.fixture
+def queries():
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    yield statements
+    db.conn.set_trace_callback(None)
+
+
+def _as(name):
+    context.user = SimpleNamespace(id=0, name=name)
+
+
+def test_no_leak_between_users():
+    _as("settings-alice")
+    S.page_size = 7
+    assert S.page_size == 7
+    _as("settings-bob")
+    assert S.page_size == DEFAULT_PAGE_SIZE
+    S.page_size = 11
+    _as("settings-alice")
+    assert S.page_size == 7
+    del context.user
+
+
+def test_one_query_per_user(queries):
+    _as("settings-carol")
+    coherence.forget_all()
+    queries.clear()
+    assert S.page_size + S.index_days_back + S.search_n
+    assert S.index_type and S.app_name
+    assert sum("SELECT" in statement for statement in queries) == 2
+    del context.user
+
+
+def test_defaults_are_converted():
+    # nothing stored for this user, so the default is used
+    _as("settings-erin")
+    assert S.index_recent_events_mod(25) == 1
+    assert S.page_size == DEFAULT_PAGE_SIZE
+    del context.user
+    # without a user, too
+    assert S.index_recent_events_mod(25) == 1
+
+
+def test_batched_save(queries):
+    _as("settings-dave")
+    assert S.page_size == DEFAULT_PAGE_SIZE
+    queries.clear()
+    S.update({"page_size": "12", "index_type": "newest_claims", "index_days_back": None})
+    assert not any(statement.startswith("SELECT") for statement in queries)
+    assert sum(statement == "COMMIT" for statement in queries) == 1
+    assert (S.page_size, S.index_type) == (12, "newest_claims")
+    # stored values survive forgetting the cache
+    coherence.forget_all()
+    assert (S.page_size, S.index_type) == (12, "newest_claims")
+    del context.user
+
+
+def test_save_with_stale_cache():
+    _as("settings-frank")
+    assert S.page_size == DEFAULT_PAGE_SIZE
+    # saved by another worker, this one hasn't noticed yet
+    db.conn.execute("INSERT INTO settings (key, value) VALUES ('page_size:settings-frank', '5')")
+    db.conn.commit()
+    S.update({"page_size": "6"})
+    rows = db.conn.execute("SELECT value FROM settings WHERE key = 'page_size:settings-frank'").fetchall()
+    assert [row["value"] for row in rows] == ["6"]
+    del context.user
+
+
+def test_save_bad_value():
+    _as("settings-grace")
+    with pytest.raises(ValueError):
+        S.update({"index_days_back": "17", "page_size": "abc"})
+    assert not db.conn.in_transaction
+    assert S.index_days_back != 17
+    coherence.forget_all()
+    assert S.index_days_back != 17
+    del context.user
+
+
+def test_save_form(admin_client, user_client):
+    user_client.post("/settings", data={"page_size": "3", "index_type": "newest_entities"})
+    _, response = user_client.get("/settings")
+    assert 'name="page_size" min=1 value="3"' in response.text
+    _, response = admin_client.get("/settings")
+    assert 'name="page_size" min=1 value="3"' not in response.text
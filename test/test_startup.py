@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.remote import free_port, start_server
+
+# generous, to allow for slow machines; this is about catching regressions
+# like an eagerly imported heavy dependency, not about exact numbers.
+IMPORT_BUDGET = 1.5  # seconds
+FIRST_RESPONSE_BUDGET = 8  # seconds
+LAZY_MODULES = ("phonenumbers", "pycountry", "markdown_it")
+
+MEASURE_IMPORT = f"""
+import json, sys, time
+start = time.perf_counter()
+import veronique
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "loaded": [name for name in {LAZY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def _import(db_path):
+    out = subprocess.run(
+        [sys.executable, "-c", MEASURE_IMPORT],
+        env={**os.environ, "VERONIQUE_DB": str(db_path)},
+        capture_output=True,
+        check=True,
+    ).stdout
+    return json.loads(out)
+
+
+def test_import(tmp_path):
+    db_path = tmp_path / "startup.db"
+    results = [_import(db_path) for _ in range(3)]
+    assert min(result["seconds"] for result in results) < IMPORT_BUDGET
+    # heavy dependencies and the database are only loaded when needed
+    assert results[0]["loaded"] == []
+    assert not db_path.exists()
+
+
+def test_first_response(tmp_path):
+    with open("veronique_initial_pw", "w") as f:
+        f.write("admin")
+    start = time.perf_counter()
+    try:
+        server, _ = start_server(tmp_path / "startup.db", free_port())
+    finally:
+        if os.path.exists("veronique_initial_pw"):
+            os.remove("veronique_initial_pw")
+    elapsed = time.perf_counter() - start
+    server.terminate()
+    server.wait()
+    assert elapsed < FIRST_RESPONSE_BUDGET
@@ -1,17 +1,31 @@
 import re
 from datetime import datetime
 
-from sanic import Sanic, file, html, redirect
+from sanic import Sanic, html, raw, redirect
 
 import veronique.objects as O
-from veronique import security
+from veronique import (
+    analytics,
+    coherence,
+    db,
+    instrumentation,
+    oracle,
+    orphans,
+    profiling,
+    security,
+)
 from veronique.constants import SESSION_MAX_AGE, SESSION_REFRESH_AFTER
 from veronique.context import context
 from veronique.routes import (
     autocomplete,
+    backups,
+    changes,
     claims,
+    exports,
     index,
+    metrics,
     network,
+    profiles,
     queries,
     search,
     settings,
@@ -20,7 +34,8 @@ from veronique.routes import (
     users,
     verbs,
 )
-from veronique.utils import D
+from veronique.settings import settings as S
+from veronique.utils import D, asset, template
 
 app = Sanic("Veronique")
 app.blueprint(claims)
@@ -34,9 +49,37 @@ app.blueprint(index)
 app.blueprint(search)
 app.blueprint(tools)
 app.blueprint(autocomplete)
+app.blueprint(changes)
+app.blueprint(backups)
+app.blueprint(metrics)
+app.blueprint(profiles)
+app.blueprint(exports)
+
+def _endpoint(request):
+    return f"/{request.route.path}" if request.route else "(unknown)"
+
+
+@app.before_server_start
+async def apply_migrations(app):
+    db.migrate()
+
+
+@app.after_server_start
+async def start_background_tasks(app):
+    app.add_task(oracle.keep_fresh())
+    app.add_task(analytics.keep_fresh())
+    app.add_task(orphans.keep_clean())
+
+
+@app.on_request
+async def start_timing(request):
+    instrumentation.start_request(_endpoint(request), S.slow_query_threshold)
+
 
-with open("data/login.html") as f:
-    LOGIN = f.read().format
+@app.on_request
+async def sync_caches(request):
+    # other workers might have changed something
+    coherence.sync()
 
 
 @app.on_request
@@ -73,6 +116,25 @@ async def auth(request):
     return unauthorized
 
 
+@app.on_request
+async def start_profile(request):
+    # after auth, so we know whether the user is an admin
+    profiling.start(request, _endpoint(request), S.profiling_endpoint, S.profiling_rate)
+
+
+@app.on_response
+async def finish_profile(request, response):
+    if profile := profiling.finish():
+        response.headers["X-Profile"] = f"/profiles/{profile.id}"
+
+
+@app.on_response
+async def server_timing(request, response):
+    if header := instrumentation.finish_request():
+        response.headers["Server-Timing"] = header
+    instrumentation.log_slow_queries(db.conn)
+
+
 @app.on_response
 async def refresh_session(request, response):
     """If authenticated requests have overly old payloads, refresh them."""
@@ -100,7 +162,7 @@ async def login(request):
         then = request.args.get("then")
     else:
         then = ""
-    return html(LOGIN(then=then))
+    return html(template("login.html")(then=then))
 
 
 @app.post("/login")
@@ -127,4 +189,4 @@ async def do_login(request):
 
 @app.get("/favicon.ico")
 async def favicon_ico(request):
-    return await file("data/favicon.ico", mime_type="image/x-icon")
+    return raw(asset("favicon.ico"), content_type="image/x-icon")
@@ -0,0 +1,344 @@
+"""
+Graph analytics over link claims.
+
+The graph considered here is undirected: every claim whose verb is a link
+(directed or undirected) connects its subject and its object. Category claims
+are ignored, they'd otherwise turn every category into the biggest hub.
+
+Adjacency is stored in compressed sparse row (CSR) form: the neighbours of the
+node with index i are indices[indptr[i]:indptr[i + 1]], and verbs holds the
+verb ID of the link behind each of those entries. All algorithms work on whole
+slices of these arrays instead of going back to the database per node.
+
+They are plain Python loops over the standard library's array module, not
+numpy/scipy sparse matrices: graphs of a personal database are small enough
+for that, and it keeps Véronique free of heavy dependencies.
+
+Only one worker computes the metrics for a given graph version: it claims the
+version under the write lock first, the others then read its results from the
+graph_metrics table.
+"""
+
+import asyncio
+import random
+import sqlite3
+from array import array
+from collections import Counter
+
+from veronique import db
+from veronique.constants import (
+    ANALYTICS_CLAIM_TIMEOUT,
+    ANALYTICS_LABEL_PROPAGATION_MAX_ITERATIONS,
+    ANALYTICS_PAGERANK_DAMPING,
+    ANALYTICS_PAGERANK_MAX_ITERATIONS,
+    ANALYTICS_PAGERANK_TOLERANCE,
+    ANALYTICS_REFRESH_INTERVAL,
+)
+from veronique.db import IS_A
+
+_graph = None
+_metrics = None
+
+
+def graph_version():
+    """Return a counter that changes whenever any link claim changes."""
+    cur = db.conn.cursor()
+    return cur.execute("SELECT graph_version FROM state").fetchone()["graph_version"]
+
+
+class Graph:
+    def __init__(self, version, links):
+        self.version = version
+        links = set(links)
+        self.ids = array("q", sorted({node for s, _, o in links for node in (s, o)}))
+        self.index = {claim_id: i for i, claim_id in enumerate(self.ids)}
+        n = len(self.ids)
+        degree = [0] * n
+        for s, _, o in links:
+            degree[self.index[s]] += 1
+            degree[self.index[o]] += 1
+        self.indptr = array("q", [0] * (n + 1))
+        for i, d in enumerate(degree):
+            self.indptr[i + 1] = self.indptr[i] + d
+        self.indices = array("q", [0] * self.indptr[n])
+        self.verbs = array("q", [0] * self.indptr[n])
+        fill = array("q", self.indptr[:n])
+        for s, verb_id, o in links:
+            a, b = self.index[s], self.index[o]
+            for x, y in ((a, b), (b, a)):
+                self.indices[fill[x]] = y
+                self.verbs[fill[x]] = verb_id
+                fill[x] += 1
+
+    @classmethod
+    def load(cls, version=None):
+        if version is None:
+            version = graph_version()
+        cur = db.conn.cursor()
+        rows = cur.execute(
+            """
+            SELECT c.subject_id, c.verb_id, c.object_id
+            FROM claims c
+            LEFT JOIN verbs v
+            ON c.verb_id = v.id
+            WHERE v.data_type LIKE '%directed_link'
+            AND c.verb_id != ?
+            AND c.subject_id IS NOT NULL
+            AND c.object_id IS NOT NULL
+            AND c.subject_id != c.object_id
+            """,
+            (IS_A,),
+        ).fetchall()
+        return cls(version, (tuple(row) for row in rows))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def neighbours(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+
+def load_graph():
+    """Return the link graph, rebuilding it only if links changed."""
+    global _graph
+    version = graph_version()
+    if _graph is None or _graph.version != version:
+        _graph = Graph.load(version)
+    return _graph
+
+
+def degree_centrality(graph):
+    """Number of distinct neighbours per node."""
+    return [len(set(graph.neighbours(i))) for i in range(len(graph))]
+
+
+def pagerank(
+    graph,
+    *,
+    damping=ANALYTICS_PAGERANK_DAMPING,
+    tolerance=ANALYTICS_PAGERANK_TOLERANCE,
+    max_iterations=ANALYTICS_PAGERANK_MAX_ITERATIONS,
+):
+    """
+    PageRank by power iteration.
+
+    Nodes only exist because they have links, so there are no dangling nodes
+    to take care of. Parallel links (different verbs between the same two
+    claims) count as stronger connections.
+    """
+    n = len(graph)
+    if not n:
+        return []
+    indptr, indices = graph.indptr, graph.indices
+    out_degree = [indptr[i + 1] - indptr[i] for i in range(n)]
+    rank = [1 / n] * n
+    base = (1 - damping) / n
+    for _ in range(max_iterations):
+        contrib = [r / d for r, d in zip(rank, out_degree)]
+        new_rank = [
+            base + damping * sum(map(contrib.__getitem__, indices[indptr[i]:indptr[i + 1]]))
+            for i in range(n)
+        ]
+        error = sum(abs(a - b) for a, b in zip(new_rank, rank))
+        rank = new_rank
+        if error < n * tolerance:
+            break
+    return rank
+
+
+def connected_components(graph):
+    """Label each node with the index of the first node of its component."""
+    n = len(graph)
+    labels = [-1] * n
+    for start in range(n):
+        if labels[start] != -1:
+            continue
+        labels[start] = start
+        frontier = [start]
+        while frontier:
+            next_frontier = []
+            for i in frontier:
+                for j in graph.neighbours(i):
+                    if labels[j] == -1:
+                        labels[j] = start
+                        next_frontier.append(j)
+            frontier = next_frontier
+    return labels
+
+
+def label_propagation(
+    graph,
+    *,
+    max_iterations=ANALYTICS_LABEL_PROPAGATION_MAX_ITERATIONS,
+    seed=0,
+):
+    """
+    Community detection via (asynchronous) label propagation.
+
+    Every node starts out with its own label and repeatedly adopts the label
+    that is most common among its neighbours. Nodes are visited in random
+    order and ties are broken randomly, otherwise labels flood across bridges
+    between clusters. The RNG is seeded, so results are still deterministic.
+    """
+    rng = random.Random(seed)
+    labels = list(range(len(graph)))
+    order = list(range(len(graph)))
+    for _ in range(max_iterations):
+        changed = False
+        rng.shuffle(order)
+        for i in order:
+            counts = Counter(map(labels.__getitem__, graph.neighbours(i)))
+            best = max(counts.values())
+            if counts.get(labels[i]) == best:
+                continue
+            labels[i] = rng.choice(sorted(label for label, c in counts.items() if c == best))
+            changed = True
+        if not changed:
+            break
+    return labels
+
+
+class Metrics:
+    """Per-claim analytics results, as dicts keyed by claim ID."""
+
+    def __init__(self, version):
+        self.version = version
+        self.degree = {}
+        self.pagerank = {}
+        self.component = {}
+        self.community = {}
+
+    @classmethod
+    def compute(cls, graph):
+        metrics = cls(graph.version)
+        ids = graph.ids
+        for claim_id, degree, rank, component, community in zip(
+            ids,
+            degree_centrality(graph),
+            pagerank(graph),
+            connected_components(graph),
+            label_propagation(graph),
+        ):
+            metrics.degree[claim_id] = degree
+            metrics.pagerank[claim_id] = rank
+            metrics.component[claim_id] = ids[component]
+            metrics.community[claim_id] = ids[community]
+        return metrics
+
+    @classmethod
+    def from_table(cls, version):
+        metrics = cls(version)
+        cur = db.conn.cursor()
+        for row in cur.execute(
+            "SELECT claim_id, degree, pagerank, component, community FROM graph_metrics"
+        ):
+            metrics.degree[row["claim_id"]] = row["degree"]
+            metrics.pagerank[row["claim_id"]] = row["pagerank"]
+            metrics.component[row["claim_id"]] = row["component"]
+            metrics.community[row["claim_id"]] = row["community"]
+        return metrics
+
+    def materialize(self):
+        """Write results to the graph_metrics table, for use in queries."""
+        cur = db.conn.cursor()
+        try:
+            cur.execute("DELETE FROM graph_metrics")
+            cur.executemany(
+                """
+                INSERT INTO graph_metrics
+                    (claim_id, degree, pagerank, component, community)
+                VALUES
+                    (?, ?, ?, ?, ?)
+                """,
+                (
+                    (
+                        claim_id,
+                        self.degree[claim_id],
+                        self.pagerank[claim_id],
+                        self.component[claim_id],
+                        self.community[claim_id],
+                    )
+                    for claim_id in self.degree
+                ),
+            )
+            # queries can read the table, so it counts as a change to the data
+            cur.execute(
+                "UPDATE state SET graph_metrics_version = ?, revision = revision + 1",
+                (self.version,),
+            )
+            db.conn.commit()
+        except sqlite3.OperationalError:
+            # e.g. in read-only mode; the in-memory results are still fine.
+            db.conn.rollback()
+
+
+def metrics():
+    """
+    Return the latest graph metrics, without computing anything.
+
+    keep_fresh() computes them in the background, so right after links change
+    these may still be the previous ones (or empty, before the first run).
+    """
+    global _metrics
+    if _metrics is not None and _metrics.version == graph_version():
+        return _metrics
+    version = db.conn.execute("SELECT graph_metrics_version FROM state").fetchone()[0]
+    if version is None:
+        return Metrics(None)
+    if _metrics is None or _metrics.version != version:
+        _metrics = Metrics.from_table(version)
+    return _metrics
+
+
+def _claim():
+    """
+    Return the graph version this worker should compute metrics for, if any.
+
+    The check happens under the write lock, and the version is recorded as
+    claimed, so of several workers only the first one does the work. A claim
+    older than ANALYTICS_CLAIM_TIMEOUT is taken over, its worker probably died.
+    """
+    cur = db.conn.cursor()
+    if cur.execute("PRAGMA query_only").fetchone()[0]:
+        # nobody can save results, so every worker computes its own.
+        version = graph_version()
+        return None if _metrics is not None and _metrics.version == version else version
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        version, materialized, claimed = cur.execute(
+            """
+            SELECT
+                graph_version,
+                graph_metrics_version,
+                CASE WHEN graph_metrics_claimed_at > datetime('now', ?)
+                THEN graph_metrics_claim END
+            FROM state
+            """,
+            (f"-{ANALYTICS_CLAIM_TIMEOUT.total_seconds()} seconds",),
+        ).fetchone()
+        if version in (materialized, claimed):
+            version = None
+        else:
+            cur.execute(
+                "UPDATE state SET graph_metrics_claim = ?, graph_metrics_claimed_at = datetime('now')",
+                (version,),
+            )
+        cur.execute("COMMIT")
+    except sqlite3.OperationalError:
+        # e.g. the database was locked for too long; next time, then
+        if db.conn.in_transaction:
+            cur.execute("ROLLBACK")
+        return None
+    return version
+
+
+async def keep_fresh():
+    """Recompute the graph_metrics table whenever the graph changes. Runs forever."""
+    global _metrics
+    while True:
+        if _claim() is not None:
+            # computing happens in a thread so requests can still be served
+            # in the meantime.
+            _metrics = await asyncio.to_thread(Metrics.compute, load_graph())
+            _metrics.materialize()
+        await asyncio.sleep(ANALYTICS_REFRESH_INTERVAL.total_seconds())
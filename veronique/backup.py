@@ -0,0 +1,183 @@
+"""
+Online backups of the database, using SQLite's backup API.
+
+Backups are copied a few pages at a time from a separate connection, with a
+short pause in between, so writers are never locked out for long. If the
+database is written to while a copy is in progress, SQLite starts it over;
+when that happens too often, the rest is copied in a single step, which is
+guaranteed to finish. Either way, the result is a consistent snapshot.
+
+Snapshots are stored gzipped and timestamped in the backup directory (set
+with VERONIQUE_BACKUPS), of which only the newest BACKUP_KEEP are kept.
+
+    python -m veronique.backup create
+    python -m veronique.backup restore backups/veronique-20250101-120000.db.gz
+
+Restoring replaces the contents of the configured database (VERONIQUE_DB);
+the app should be stopped while doing that.
+"""
+
+import argparse
+import asyncio
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from veronique import db
+from veronique.constants import (
+    BACKUP_KEEP,
+    BACKUP_MAX_RESTARTS,
+    BACKUP_PAGES_PER_STEP,
+    BACKUP_STEP_PAUSE,
+)
+
+directory = Path(os.environ.get("VERONIQUE_BACKUPS", "backups"))
+PATTERN = "veronique-*.db.gz"
+
+_lock = asyncio.Lock()
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _isolated():
+    return db.path != ":memory:" and isinstance(db.conn, sqlite3.Connection)
+
+
+def copy(target_path):
+    """Copy the database to target_path, a few pages at a time."""
+    target = sqlite3.connect(target_path)
+    try:
+        if not _isolated():
+            # nothing else to connect to; copy everything at once.
+            db.conn.backup(target)
+        else:
+            _copy_in_steps(target)
+        # the copy is a single file, which can be opened read-only
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+
+
+def _copy_in_steps(target):
+    source = sqlite3.connect(
+        f"{Path(db.path).absolute().as_uri()}?mode=ro",
+        uri=True,
+    )
+    restarts = 0
+    remaining_before = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, remaining_before
+        if remaining_before is not None and remaining > remaining_before:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise _Restarted
+        remaining_before = remaining
+
+    try:
+        source.backup(
+            target,
+            pages=BACKUP_PAGES_PER_STEP,
+            progress=progress,
+            sleep=BACKUP_STEP_PAUSE.total_seconds(),
+        )
+    except _Restarted:
+        source.backup(target)
+    finally:
+        source.close()
+
+
+async def snapshot(target_path):
+    """Like copy(), but without blocking the event loop."""
+    if _isolated():
+        await asyncio.to_thread(copy, target_path)
+    else:
+        copy(target_path)
+
+
+def _compress(source_path, target_path):
+    partial = target_path.with_name(f"{target_path.name}.partial")
+    with open(source_path, "rb") as src, gzip.open(partial, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(partial, target_path)
+
+
+def backups():
+    """Return the paths of all stored backups, newest first."""
+    return sorted(directory.glob(PATTERN), reverse=True)
+
+
+def prune(keep=BACKUP_KEEP):
+    for path in backups()[keep:]:
+        path.unlink()
+
+
+async def create():
+    """Store a new compressed backup; return its path."""
+    async with _lock:
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"veronique-{datetime.now():%Y%m%d-%H%M%S}.db.gz"
+        with tempfile.TemporaryDirectory(dir=directory) as tmp:
+            copied = Path(tmp) / "backup.db"
+            await snapshot(copied)
+            await asyncio.to_thread(_compress, copied, path)
+        prune()
+        return path
+
+
+def restore(source_path, target_path=None):
+    """
+    Replace the contents of the database at target_path (by default the
+    configured one) with a backup, which may be gzipped.
+    """
+    source_path = Path(source_path)
+    with tempfile.TemporaryDirectory() as tmp:
+        if source_path.suffix == ".gz":
+            unpacked = Path(tmp) / "restore.db"
+            with gzip.open(source_path, "rb") as src, open(unpacked, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            source_path = unpacked
+        source = sqlite3.connect(source_path)
+        try:
+            (result,) = source.execute("PRAGMA integrity_check").fetchone()
+            if result != "ok":
+                raise ValueError(f"Backup is damaged: {result}")
+            target = sqlite3.connect(target_path or db.path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+
+
+def cli():
+    parser = argparse.ArgumentParser(prog="python -m veronique.backup")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("create", help="store a new backup")
+    commands.add_parser("list", help="list stored backups")
+    restore_parser = commands.add_parser("restore", help="restore a backup")
+    restore_parser.add_argument("path")
+    args = parser.parse_args()
+    if args.command == "create":
+        print(asyncio.run(create()))
+    elif args.command == "list":
+        for path in backups():
+            print(path)
+    else:
+        try:
+            restore(args.path)
+        except (ValueError, sqlite3.DatabaseError) as e:
+            print(f"Can't restore: {e}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
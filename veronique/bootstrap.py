@@ -11,8 +11,8 @@ def cli():
         sys.exit(1)
     with open("veronique_initial_pw", "w") as f:
         f.write("admin")
-    # running migrations:
     import veronique.db
+    veronique.db.migrate()
     import veronique.objects as O
     from veronique.context import context
 
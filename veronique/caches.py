@@ -0,0 +1,116 @@
+"""
+Named in-process caches of computed values.
+
+Every cache has a time to live and a maximum number of entries, evicting the
+least recently used ones first. Entries are tagged with what they were computed
+from, e.g. ("claim", 123) for data about claim 123, or ("user", 4) for anything
+depending on the permissions of user 4. Whatever changes something invalidates
+its tags, which drops only the entries affected by it:
+
+    @data.cached(key=lambda claim: claim.id, tags=lambda claim: [("claim", claim.id)])
+    def get_data(claim): ...
+
+    caches.invalidate(("claim", 123))
+
+Hits, misses, evictions and invalidations are counted per cache (and per
+worker process), and show up under /metrics.
+"""
+
+import functools
+from collections import OrderedDict
+from time import monotonic
+
+registry = {}  # name -> Cache
+MISSING = object()
+
+
+class Cache:
+    def __init__(self, name, *, ttl=None, max_size=None):
+        self.name = name
+        self.ttl = ttl.total_seconds() if ttl is not None else None
+        self.max_size = max_size
+        self._entries = OrderedDict()  # key -> (value, stored_at, tags)
+        self._keys = {}  # tag -> keys
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        registry[name] = self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value, or MISSING if there is none (or it expired)."""
+        if (entry := self._entries.get(key)) is None:
+            self.misses += 1
+            return MISSING
+        value, stored_at, _ = entry
+        if self.ttl is not None and monotonic() - stored_at > self.ttl:
+            self._drop(key)
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, tags=()):
+        self._drop(key)
+        tags = frozenset(tags)
+        self._entries[key] = value, monotonic(), tags
+        for tag in tags:
+            self._keys.setdefault(tag, set()).add(key)
+        while self.max_size is not None and len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def forget(self, key):
+        if self._drop(key):
+            self.invalidations += 1
+
+    def invalidate(self, *tags):
+        """Drop all entries tagged with any of the given tags."""
+        for tag in tags:
+            for key in self._keys.pop(tag, ()):
+                self.forget(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys.clear()
+
+    def _drop(self, key):
+        if (entry := self._entries.pop(key, None)) is None:
+            return False
+        for tag in entry[2]:
+            if (keys := self._keys.get(tag)) is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys[tag]
+        return True
+
+    def cached(self, *, key=None, tags=None):
+        """
+        Decorate a function to cache its results.
+
+        key and tags are called with the function's arguments; without key,
+        there is just one entry.
+        """
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                key_ = key(*args, **kwargs) if key is not None else None
+                if (result := self.get(key_)) is MISSING:
+                    result = fn(*args, **kwargs)
+                    self.set(key_, result, tags(*args, **kwargs) if tags is not None else ())
+                return result
+            wrapper.cache = self
+            return wrapper
+        return decorator
+
+
+def invalidate(*tags):
+    """Drop the entries of all caches that are tagged with any of the given tags."""
+    for cache in registry.values():
+        cache.invalidate(*tags)
+
+
+def clear():
+    for cache in registry.values():
+        cache.clear()
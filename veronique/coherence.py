@@ -0,0 +1,79 @@
+"""
+Keeps the caches of several worker processes consistent with each other.
+
+Every process caches models, claim data, inferable verbs (see caches) and
+settings. Its own writes update those caches directly, but writes by other
+processes only show up in the change log (see db.log_change). Before each
+request, sync() asks SQLite for the data_version, which only changes when
+another connection commits and costs next to nothing to check; when it did
+change, the cached entries affected by every change logged since the last
+check are dropped.
+"""
+
+import sqlite3
+
+import veronique.objects as O
+from veronique import caches, db, settings
+from veronique.constants import COHERENCE_MAX_CHANGES
+
+EVERYTHING = "*"  # table name of changes that can't be attributed to rows
+
+_data_version = None
+_seq = None
+
+
+def forget(table_name, key):
+    """Drop whatever is cached about one row (or setting)."""
+    if table_name == EVERYTHING:
+        forget_all()
+        return
+    if table_name == "settings":
+        settings.forget(key)
+        return
+    for model in O.Model.__subclasses__():
+        if model.table_name == table_name:
+            model.forget(int(key))
+
+
+def forget_all():
+    for model in O.Model.__subclasses__():
+        model._cache.clear()
+    caches.clear()
+    settings.forget_all()
+
+
+def sync():
+    """Forget everything that other processes changed since the last call."""
+    global _data_version, _seq
+    conn = db.conn
+    if not isinstance(conn, sqlite3.Connection):
+        # remote connections take care of this themselves
+        return
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if data_version == _data_version:
+        return
+    _data_version = data_version
+    if _seq is None:
+        # we can't know what changed before the first call
+        forget_all()
+        _seq = conn.execute("SELECT coalesce(max(seq), 0) FROM changes").fetchone()[0]
+        return
+    changes = conn.execute(
+        """
+        SELECT seq, table_name, key
+        FROM changes
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+        """,
+        (_seq, COHERENCE_MAX_CHANGES + 1),
+    ).fetchall()
+    if len(changes) > COHERENCE_MAX_CHANGES:
+        # cheaper to start over
+        forget_all()
+        _seq = conn.execute("SELECT max(seq) FROM changes").fetchone()[0]
+        return
+    for change in changes:
+        forget(change["table_name"], change["key"])
+    if changes:
+        _seq = changes[-1]["seq"]
@@ -4,6 +4,8 @@ SESSION_REFRESH_AFTER = timedelta(days=7)
 SESSION_MAX_AGE = timedelta(days=30)
 
 CLAIM_DATA_CACHE_TIME = timedelta(minutes=5)
+CLAIM_DATA_CACHE_SIZE = 50_000  # entries, i.e. (claim, user) pairs, shared by all users
+INFERABLES_CACHE_SIZE = 100  # users
 
 SEARCH_AVGDL_CACHE_TIME = timedelta(hours=1)
 SEARCH_AVGDL_FALLBACK = 15  # just some semi-realistic value
@@ -30,3 +32,58 @@ MAP_TILES_DEFAULT_ATTRIBUTION_LABEL = "OpenStreetMap"
 MAP_TILES_DEFAULT_PROVIDER_URL = "https://tile.openstreetmap.org/{z}/{x}/{y}.png"
 
 DEFAULT_SOURCE_TYPE = "T"
+
+ANALYTICS_PAGERANK_DAMPING = 0.85
+ANALYTICS_PAGERANK_TOLERANCE = 1e-6
+ANALYTICS_PAGERANK_MAX_ITERATIONS = 100
+ANALYTICS_LABEL_PROPAGATION_MAX_ITERATIONS = 20
+ANALYTICS_REFRESH_INTERVAL = timedelta(seconds=10)
+ANALYTICS_CLAIM_TIMEOUT = timedelta(minutes=10)  # then another worker takes over
+
+ORACLE_LANDMARKS = 16
+ORACLE_REFRESH_INTERVAL = timedelta(seconds=10)
+
+QUERY_CACHE_MAX_RESULT_ROWS = 10_000  # per query
+QUERY_CACHE_MAX_ROWS = 100_000  # in total
+
+DB_BUSY_TIMEOUT = timedelta(seconds=5)  # waiting for other writers
+
+SANDBOX_TIME_LIMIT = timedelta(seconds=10)  # doesn't hold up writers, see db.get_connection
+SANDBOX_STEP_LIMIT = 500_000_000  # SQLite VM instructions
+SANDBOX_PROGRESS_INTERVAL = 10_000  # VM instructions between budget checks
+SANDBOX_MAX_ROWS = 100_000
+SANDBOX_BATCH_SIZE = 1_000  # rows per batch when streaming
+SANDBOX_DISCONNECT_POLL_INTERVAL = timedelta(milliseconds=100)
+
+REMOTE_COMPRESS_MIN_SIZE = 1024  # bytes; smaller requests are sent as they are
+REMOTE_CHUNK_SIZE = 64 * 1024  # bytes read at once from streamed responses
+REMOTE_REVALIDATE_INTERVAL = timedelta(seconds=5)
+
+CHANGES_PAGE_SIZE = 1000  # entries per response of /changes
+COHERENCE_MAX_CHANGES = 1000  # more than that, and all caches are dropped
+
+BACKUP_PAGES_PER_STEP = 100  # database pages copied at once
+BACKUP_STEP_PAUSE = timedelta(milliseconds=5)  # lets writers in between steps
+BACKUP_MAX_RESTARTS = 3  # before copying the rest in one step
+BACKUP_KEEP = 10  # number of stored backups
+
+MIGRATION_CHUNK_SIZE = 10_000  # IDs per transaction in resumable migrations
+
+INSTRUMENTATION_DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+INSTRUMENTATION_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # statements per request
+INSTRUMENTATION_MAX_SHAPES = 1000  # distinct statements; more are counted as "(other)"
+SLOW_QUERY_DEFAULT_THRESHOLD = 100  # milliseconds; 0 turns the slow query log off
+SLOW_QUERY_LOG_SIZE = 200  # entries kept
+
+PROFILING_KEEP = 20  # profiles kept per worker
+PROFILING_MIN_INTERVAL = timedelta(seconds=1)  # between sampled profiles
+PROFILING_MAX_DURATION = timedelta(minutes=1)  # after that, a profile is given up on
+
+GENERATE_BATCH_SIZE = 50_000  # claims inserted per transaction
+IMPORT_BATCH_SIZE = 10_000  # records per transaction
+EXPORT_BATCH_SIZE = 1_000  # rows read at once when exporting the database
+
+GC_INTERVAL = timedelta(hours=1)  # between collections of orphans
+GC_CHUNK_SIZE = 10_000  # IDs (or index rows) looked at per transaction
+GC_PAUSE = timedelta(milliseconds=50)  # between chunks, when in the background
+GC_KEEP = 10  # reports kept per worker
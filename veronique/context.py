@@ -24,3 +24,5 @@ class context:
     user = Variable()
     payload = Variable()
     impersonator = Variable()
+    timing = Variable()
+    profile = Variable()
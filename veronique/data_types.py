@@ -4,15 +4,12 @@ import re
 import unicodedata
 from datetime import date as dt_date
 from datetime import timedelta
-from functools import partial
+from functools import cached_property, partial
 from html import escape
 from itertools import count
 from random import randint
 from urllib.parse import quote_plus
 
-import phonenumbers
-import pycountry
-from markdown_it import MarkdownIt
 from nh3 import clean as clean_html
 
 from veronique.autocomplete import AUTOCOMPLETES
@@ -507,8 +504,11 @@ class location(DataType):
 
 class text(DataType):
     can_turn_into = ("string", "source")
-    def __init__(self):
-        self.md = MarkdownIt("gfm-like")
+    @cached_property
+    def md(self):
+        # markdown_it takes a while to import and set up, so wait until it's needed
+        from markdown_it import MarkdownIt
+        return MarkdownIt("gfm-like")
 
     def _sub(self, match, fmt=None):
         import veronique.objects as O
@@ -596,6 +596,7 @@ class website(DataType):
 
 class phonenumber(DataType):
     def display_html(self, value, **_):
+        import phonenumbers
         if context.user.redact:
             value = "+49 1234 56789"
         # no region: values from database should be normalized:
@@ -630,6 +631,7 @@ class phonenumber(DataType):
         """
 
     def encode(self, value):
+        import phonenumbers
         pn = phonenumbers.parse(value, region=S.default_phone_region)
         return phonenumbers.format_number(pn, phonenumbers.PhoneNumberFormat.E164)
 
@@ -721,6 +723,7 @@ class mtgcolors(DataType):
 
 class alpha2(DataType):
     def display_html(self, value, **_):
+        import pycountry
         try:
             country = pycountry.countries.lookup(value.upper())
         except LookupError:
@@ -758,6 +761,7 @@ class alpha2(DataType):
             return ""
         value = args["value"]
 
+        import pycountry
         try:
             results = pycountry.countries.search_fuzzy(value)
         except LookupError:
@@ -4,12 +4,42 @@ import os
 import re
 import sqlite3
 import sys
+from time import perf_counter
 
+from veronique import instrumentation
+from veronique.constants import DB_BUSY_TIMEOUT, MIGRATION_CHUNK_SIZE
+from veronique.context import context
 from veronique.security import hash_password
 
-conn = sqlite3.connect(os.environ.get("VERONIQUE_DB", "veronique.db"))
-conn.row_factory = sqlite3.Row
-orig_isolation_level, conn.isolation_level = conn.isolation_level, None
+path = os.environ.get("VERONIQUE_DB", "veronique.db")
+
+
+def get_connection():
+    """Return the connection to the database, which is opened on first use."""
+    global conn
+    try:
+        return conn
+    except NameError:
+        conn = sqlite3.connect(
+            path,
+            timeout=DB_BUSY_TIMEOUT.total_seconds(),
+            factory=instrumentation.Connection,
+        )
+        conn.row_factory = sqlite3.Row
+        # readers (sandboxed queries, backups) don't block writers in WAL
+        # mode, nor the other way round. It's stored in the file, so this
+        # only does something the first time.
+        conn.execute("PRAGMA journal_mode = WAL")
+        if os.environ.get("VERONIQUE_READONLY"):
+            conn.execute("pragma query_only = ON;")
+        return conn
+
+
+def __getattr__(name):
+    # makes db.conn work before the connection is opened
+    if name == "conn":
+        return get_connection()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 DATA_LABELS = [
     ROOT,
@@ -23,36 +53,127 @@ DATA_LABELS = [
 ] = range(-1, -9, -1)
 
 
-try:
-    cur = conn.cursor()
-    row = cur.execute("SELECT version FROM state").fetchone()
-    version = row["version"]
-except sqlite3.OperationalError:
-    version = 0
-cur.close()
+MIGRATIONS = {}
+
 
+def migration(number, *, resumable=False):
+    """
+    Register a migration; they are applied in order by migrate().
 
-def migration(number):
+    A regular migration is called with a cursor and runs in one transaction.
+    A resumable one is a generator called with a cursor and the checkpoint it
+    last reached (None at first); it processes its data in chunks and yields
+    (checkpoint, done, total) after each one. Every chunk is committed along
+    with its checkpoint, so an interrupted migration continues where it left
+    off, and done/total are reported as progress.
+    """
     def deco(fn):
-        global version
-        if number >= version:
-            print("Running migration", fn.__name__)
+        fn.resumable = resumable
+        MIGRATIONS[number] = fn
+        return fn
+
+    return deco
+
+
+def id_ranges(cur, table, after=None, size=MIGRATION_CHUNK_SIZE, *, column="id"):
+    """Yield (first, last, last ID of the table) for chunks of a table's IDs."""
+    (last_id,) = cur.execute(f"SELECT coalesce(max({column}), 0) FROM {table}").fetchone()
+    for first in range((after or 0) + 1, last_id + 1, size):
+        yield first, min(first + size - 1, last_id), last_id
+
+
+def _regexp_replace(pattern, replacement, value):
+    if value is None:
+        return None
+    return re.sub(pattern, replacement, value)
+
+
+def _strip(value):
+    # unlike SQLite's trim(), this also removes non-ASCII whitespace
+    if value is None:
+        return None
+    return value.strip()
+
+
+def current_version(connection=None):
+    try:
+        return (connection or get_connection()).execute("SELECT version FROM state").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def pending(connection=None):
+    """Return the numbers of the migrations that haven't been applied yet."""
+    version = current_version(connection)
+    return [number for number in sorted(MIGRATIONS) if number >= version]
+
+
+def _run_resumable(cur, number, fn, report):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS migration_checkpoints
+        (
+            version INTEGER PRIMARY KEY,
+            checkpoint INTEGER NOT NULL
+        )
+    """)
+    row = cur.execute(
+        "SELECT checkpoint FROM migration_checkpoints WHERE version = ?",
+        (number,),
+    ).fetchone()
+    checkpoint = row[0] if row else None
+    if checkpoint is not None:
+        report(f"Resuming after {checkpoint}")
+    for checkpoint, done, total in fn(cur, checkpoint):
+        cur.execute(
+            "INSERT OR REPLACE INTO migration_checkpoints (version, checkpoint) VALUES (?, ?)",
+            (number, checkpoint),
+        )
+        cur.execute("COMMIT")
+        report(f"  {done:,} of {total:,}")
+        cur.execute("BEGIN IMMEDIATE")
+    cur.execute("DELETE FROM migration_checkpoints WHERE version = ?", (number,))
+
+
+def migrate(connection=None, *, report=print):
+    """Apply all pending migrations; return how long each of them took."""
+    connection = connection or get_connection()
+    connection.create_function("regexp_replace", 3, _regexp_replace, deterministic=True)
+    connection.create_function("strip", 1, _strip, deterministic=True)
+    isolation_level, connection.isolation_level = connection.isolation_level, None
+    query_only = connection.execute("PRAGMA query_only").fetchone()[0]
+    connection.execute("PRAGMA query_only = OFF")
+    timings = {}
+    try:
+        while True:
+            cur = connection.cursor()
+            # taking the write lock first means that of several processes
+            # starting at once, only one applies each migration.
+            cur.execute("BEGIN IMMEDIATE")
+            number = current_version(connection)
+            if number not in MIGRATIONS:
+                cur.execute("COMMIT")
+                break
+            fn = MIGRATIONS[number]
+            report(f"Running migration {fn.__name__}")
+            start = perf_counter()
             try:
-                cur = conn.cursor()
-                cur.execute("BEGIN")
-                fn(cur)
-                cur.execute("UPDATE state SET version = ?", (version + 1,))
+                if fn.resumable:
+                    _run_resumable(cur, number, fn, report)
+                else:
+                    fn(cur)
+                cur.execute("UPDATE state SET version = ?", (number + 1,))
                 cur.execute("COMMIT")
-                print("Migration successful")
-                version += 1
             except sqlite3.OperationalError as e:
-                print("Rolling back migration:", e)
+                report(f"Rolling back migration: {e}")
                 cur.execute("ROLLBACK")
                 sys.exit(1)
+            timings[fn.__name__] = perf_counter() - start
+            report("Migration successful")
             cur.close()
-        return fn
-
-    return deco
+    finally:
+        connection.execute(f"PRAGMA query_only = {query_only}")
+        connection.isolation_level = isolation_level
+    return timings
 
 
 @migration(0)
@@ -683,30 +804,32 @@ def delete_label_verb(cur):
     )
 
 
-@migration(23)
-def clean_up_choices(cur):
-    verbs = cur.execute(
-        "SELECT id, extra FROM verbs WHERE data_type LIKE 'choice%'"
-    ).fetchall()
-    for id, extra in verbs:
-        cur.execute(
+@migration(23, resumable=True)
+def clean_up_choices(cur, checkpoint):
+    if checkpoint is None:
+        verbs = cur.execute(
+            "SELECT id, extra FROM verbs WHERE data_type LIKE 'choice%'"
+        ).fetchall()
+        cur.executemany(
             "UPDATE verbs SET extra = ? WHERE id = ?",
-            (json.dumps([val.strip() for val in json.loads(extra)]), id),
+            (
+                (json.dumps([val.strip() for val in json.loads(extra)]), id)
+                for id, extra in verbs
+            ),
         )
-    claims = cur.execute(
-        """
-        SELECT c.id, c.value
-        FROM claims c
-        LEFT JOIN verbs v ON c.verb_id = v.id
-        WHERE v.data_type LIKE 'choice%'
-        """,
-    ).fetchall()
-    for id, value in claims:
-        if value:
-            cur.execute(
-                "UPDATE claims SET value = ? WHERE id = ?",
-                (value.strip(), id),
-            )
+    for first, last, last_id in id_ranges(cur, "claims", checkpoint):
+        cur.execute(
+            """
+            UPDATE claims
+            SET value = strip(value)
+            WHERE
+                id BETWEEN :first AND :last
+                AND value <> strip(value)
+                AND verb_id IN (SELECT id FROM verbs WHERE data_type LIKE 'choice%')
+            """,
+            {"first": first, "last": last},
+        )
+        yield last, last, last_id
 
 
 @migration(24)
@@ -717,23 +840,26 @@ def add_last_session_to_users(cur):
     """)
 
 
-@migration(25)
-def change_entity_reference_format(cur):
-    claims = cur.execute("""
-        SELECT c.id, c.value
-        FROM claims c
-        LEFT JOIN verbs v
-        ON c.verb_id = v.id
-        WHERE
-            v.data_type = 'text'
-            AND value LIKE '%<@%>%'
-    """).fetchall()
-    for id, value in claims:
-        if value:
-            cur.execute(
-                "UPDATE claims SET value = ? WHERE id = ?",
-                (re.sub(r'<@(\d+)>', r'[@\1]', value), id),
-            )
+@migration(25, resumable=True)
+def change_entity_reference_format(cur, checkpoint):
+    for first, last, last_id in id_ranges(cur, "claims", checkpoint):
+        cur.execute(
+            """
+            UPDATE claims
+            SET value = regexp_replace(:pattern, :replacement, value)
+            WHERE
+                id BETWEEN :first AND :last
+                AND value LIKE '%<@%>%'
+                AND verb_id IN (SELECT id FROM verbs WHERE data_type = 'text')
+            """,
+            {
+                "pattern": r"<@(\d+)>",
+                "replacement": r"[@\1]",
+                "first": first,
+                "last": last,
+            },
+        )
+        yield last, last, last_id
 
 
 @migration(26)
@@ -753,81 +879,303 @@ def add_sources(cur):
     """)
 
 
-@migration(27)
-def turn_validities_into_daterange(cur):
-    claims = cur.execute("""
-        SELECT c.id, c.value
-        FROM claims c
-        WHERE
-            c.verb_id = ?
-            OR c.verb_id = ?
-        """,
-        (VALID_UNTIL, VALID_FROM),
-    ).fetchall()
-    for id, value in claims:
-        assert "?" not in value.replace("-", "").rstrip("?")
-        try:
-            y, m, d = value.split("-")
-            if "?" in y:
-                y_min = y.replace("?", "0")
-                if y_min == "0000":
-                    # there's no year 0
-                    y_min = "0001"
-                y_max = y.replace("?", "9")
-            else:
-                y_min = y_max = y
-
-            if m == "??":
-                m_min = "01"
-                m_max = "12"
-            elif m == "1?":
-                m_min = "11"
-                m_max = "12"
-            elif m == "0?":
-                m_min = "01"
-                m_max = "09"
-            else:
-                m_min = m_max = m
-        except ValueError:
-            if len(value) == 4 and "-" not in value:  # pure year, was allowed at some point apparently
-                y_min = y_max = value
-                m_min, m_max = "01", "12"
-                d_min, d_max = "01", "31"
-            else:
-                raise
-
-        if d == "??":
-            d_min = "01"
-            if m_max in ("01", "03", "05", "07", "08", "10", "12"):
-                d_max = "31"
-            elif m_max == "02":
-                # yeah, technically we'd have to check if y_max is a leap eyear...
-                d_max = "28"
-            else:
-                d_max = "30"
-        elif d == "3?":
-            d_min = "30"
-            if m_max in ("01", "03", "05", "07", "08", "10", "12"):
-                d_max = "31"
-            else:
-                d_max = "30"
-        elif d == "0?":
-            d_min = "01"
-            d_max = "09"
+def _daterange(value):
+    assert "?" not in value.replace("-", "").rstrip("?")
+    try:
+        y, m, d = value.split("-")
+        if "?" in y:
+            y_min = y.replace("?", "0")
+            if y_min == "0000":
+                # there's no year 0
+                y_min = "0001"
+            y_max = y.replace("?", "9")
         else:
-            d_min = d.replace("?", "0")
-            d_max = d.replace("?", "9")
-        cur.execute(
+            y_min = y_max = y
+
+        if m == "??":
+            m_min = "01"
+            m_max = "12"
+        elif m == "1?":
+            m_min = "11"
+            m_max = "12"
+        elif m == "0?":
+            m_min = "01"
+            m_max = "09"
+        else:
+            m_min = m_max = m
+    except ValueError:
+        if len(value) == 4 and "-" not in value:  # pure year, was allowed at some point apparently
+            return f"{value}-01-01--{value}-12-31"
+        raise
+
+    if d == "??":
+        d_min = "01"
+        if m_max in ("01", "03", "05", "07", "08", "10", "12"):
+            d_max = "31"
+        elif m_max == "02":
+            # yeah, technically we'd have to check if y_max is a leap eyear...
+            d_max = "28"
+        else:
+            d_max = "30"
+    elif d == "3?":
+        d_min = "30"
+        if m_max in ("01", "03", "05", "07", "08", "10", "12"):
+            d_max = "31"
+        else:
+            d_max = "30"
+    elif d == "0?":
+        d_min = "01"
+        d_max = "09"
+    else:
+        d_min = d.replace("?", "0")
+        d_max = d.replace("?", "9")
+    return f"{y_min}-{m_min}-{d_min}--{y_max}-{m_max}-{d_max}"
+
+
+@migration(27, resumable=True)
+def turn_validities_into_daterange(cur, checkpoint):
+    for first, last, last_id in id_ranges(cur, "claims", checkpoint):
+        claims = cur.execute(
+            """
+            SELECT id, value
+            FROM claims
+            WHERE
+                id BETWEEN ? AND ?
+                AND verb_id IN (?, ?)
+            """,
+            (first, last, VALID_UNTIL, VALID_FROM),
+        ).fetchall()
+        cur.executemany(
             "UPDATE claims SET value = ? WHERE id = ?",
-            (f"{y_min}-{m_min}-{d_min}--{y_max}-{m_max}-{d_max}", id),
+            ((_daterange(value), id) for id, value in claims),
         )
+        yield last, last, last_id
     cur.execute(
         "UPDATE verbs SET data_type = 'daterange' WHERE id = ? OR id = ?",
         (VALID_FROM, VALID_UNTIL),
     )
 
 
-if os.environ.get("VERONIQUE_READONLY"):
-    conn.execute("pragma query_only = ON;")
+@migration(28)
+def add_graph_metrics(cur):
+    # graph_version is bumped by triggers whenever a link is created, removed
+    # or changed, so cached analytics can cheaply tell whether they're stale.
+    cur.execute("""
+        ALTER TABLE state
+        ADD graph_version INTEGER NOT NULL DEFAULT 0
+    """)
+    cur.execute("""
+        ALTER TABLE state
+        ADD graph_metrics_version INTEGER
+    """)
+    cur.execute("""
+        CREATE TRIGGER graph_version_insert
+        AFTER INSERT ON claims
+        WHEN NEW.object_id IS NOT NULL
+        BEGIN
+            UPDATE state SET graph_version = graph_version + 1;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER graph_version_delete
+        AFTER DELETE ON claims
+        WHEN OLD.object_id IS NOT NULL
+        BEGIN
+            UPDATE state SET graph_version = graph_version + 1;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER graph_version_update
+        AFTER UPDATE OF subject_id, verb_id, object_id ON claims
+        WHEN OLD.object_id IS NOT NULL OR NEW.object_id IS NOT NULL
+        BEGIN
+            UPDATE state SET graph_version = graph_version + 1;
+        END
+    """)
+    cur.execute("""
+        CREATE TABLE graph_metrics
+        (
+            claim_id INTEGER PRIMARY KEY,
+            degree INTEGER NOT NULL,
+            pagerank REAL NOT NULL,
+            component INTEGER NOT NULL,  -- smallest claim ID in the component
+            community INTEGER NOT NULL  -- claim ID whose label won
+        )
+    """)
+
+
+@migration(29)
+def add_cache_ttl_to_queries(cur):
+    # in seconds; NULL means results are cached until the next write
+    cur.execute("""
+        ALTER TABLE queries
+        ADD cache_ttl INTEGER
+    """)
+
+
+@migration(30)
+def add_revision(cur):
+    # unlike graph_version, this covers all (non-derived) data
+    cur.execute("""
+        ALTER TABLE state
+        ADD revision INTEGER NOT NULL DEFAULT 0
+    """)
+    for table in ("claims", "verbs", "users", "permissions", "queries", "settings"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            if (table, event) == ("users", "UPDATE"):
+                # logging in shouldn't count as a change
+                columns = [
+                    row["name"]
+                    for row in cur.execute("PRAGMA table_info(users)")
+                    if row["name"] != "last_session_at"
+                ]
+                event = f"UPDATE OF {', '.join(columns)}"
+            cur.execute(f"""
+                CREATE TRIGGER revision_{table}_{event.split()[0].lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE state SET revision = revision + 1;
+                END
+            """)
+
+
+def revision():
+    """Return a counter that's incremented by every change to the data."""
+    return get_connection().execute("SELECT revision FROM state").fetchone()[0]
+
+
+@migration(31)
+def add_changes(cur):
+    cur.execute("""
+        CREATE TABLE changes
+        (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            table_name TEXT NOT NULL,
+            key TEXT NOT NULL,  -- row ID, or key of a setting
+            operation TEXT NOT NULL,  -- insert, update, or delete
+            user_id INTEGER
+        )
+    """)
+
+
+def log_change(cur, table_name, key, operation):
+    """
+    Record a change in the change log, in the same transaction.
+
+    Permissions are part of their user, and derived data (search index,
+    graph metrics) isn't logged at all.
+    """
+    cur.execute(
+        """
+        INSERT INTO changes
+            (table_name, key, operation, user_id)
+        VALUES
+            (?, ?, ?, ?)
+        """,
+        (table_name, str(key), operation, context.user.id if context.user else None),
+    )
+
+
+def log_changes(cur, table_name, keys, operation):
+    """Record the same change to many rows, in the same transaction."""
+    user_id = context.user.id if context.user else None
+    cur.executemany(
+        """
+        INSERT INTO changes
+            (table_name, key, operation, user_id)
+        VALUES
+            (?, ?, ?, ?)
+        """,
+        [(table_name, str(key), operation, user_id) for key in keys],
+    )
+
+
+@migration(32)
+def add_slow_queries(cur):
+    cur.execute("""
+        CREATE TABLE slow_queries
+        (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            endpoint TEXT,
+            shape TEXT NOT NULL,  -- normalized SQL
+            parameters INTEGER,  -- number of bound values
+            milliseconds REAL NOT NULL,
+            plan TEXT  -- output of EXPLAIN QUERY PLAN
+        )
+    """)
+
+
+@migration(33)
+def add_external_keys(cur):
+    cur.execute("""
+        CREATE TABLE external_keys
+        (
+            source TEXT NOT NULL,  -- what was imported, e.g. a file name
+            key TEXT NOT NULL,
+            claim_id INTEGER NOT NULL,
+            pending INTEGER NOT NULL DEFAULT 1,  -- not indexed etc. yet
+            PRIMARY KEY (source, key)
+        )
+    """)
+
+
+@migration(34)
+def add_claim_indexes(cur):
+    # for finding everything about (or linking to) a claim, e.g. when deleting it
+    cur.execute("CREATE INDEX claims_subject_id ON claims (subject_id)")
+    cur.execute("CREATE INDEX claims_object_id ON claims (object_id)")
 
-conn.isolation_level = orig_isolation_level
+
+@migration(35)
+def add_external_keys_index(cur):
+    # for forgetting the keys of deleted claims
+    cur.execute("CREATE INDEX external_keys_claim_id ON external_keys (claim_id)")
+
+
+@migration(36)
+def ignore_categories_in_graph_version(cur):
+    # built-in verbs (categories, in particular) aren't part of the graph, so
+    # claims with them don't need to outdate analytics
+    for name in ("insert", "delete", "update"):
+        cur.execute(f"DROP TRIGGER graph_version_{name}")
+    cur.execute("""
+        CREATE TRIGGER graph_version_insert
+        AFTER INSERT ON claims
+        WHEN NEW.object_id IS NOT NULL AND NEW.verb_id >= 0
+        BEGIN
+            UPDATE state SET graph_version = graph_version + 1;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER graph_version_delete
+        AFTER DELETE ON claims
+        WHEN OLD.object_id IS NOT NULL AND OLD.verb_id >= 0
+        BEGIN
+            UPDATE state SET graph_version = graph_version + 1;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER graph_version_update
+        AFTER UPDATE OF subject_id, verb_id, object_id ON claims
+        WHEN (OLD.object_id IS NOT NULL AND OLD.verb_id >= 0)
+        OR (NEW.object_id IS NOT NULL AND NEW.verb_id >= 0)
+        BEGIN
+            UPDATE state SET graph_version = graph_version + 1;
+        END
+    """)
+
+
+@migration(37)
+def add_graph_metrics_claim(cur):
+    # the graph version a worker is computing metrics for, and since when; the
+    # other workers leave it to that one, unless it takes too long.
+    cur.execute("""
+        ALTER TABLE state
+        ADD graph_metrics_claim INTEGER
+    """)
+    cur.execute("""
+        ALTER TABLE state
+        ADD graph_metrics_claimed_at TEXT
+    """)
@@ -0,0 +1,328 @@
+"""
+Streaming exports of query results and of the whole database.
+
+Results arrive as batches of sqlite3.Row objects (see sandbox.Batch) and are
+turned into chunks of text one batch at a time, so memory use doesn't depend
+on the size of the result. Every format is an async generator that takes an
+async iterator of (columns, rows) batches, as produced by tabulate().
+
+The whole database is exported from a single read transaction (see
+sandbox.snapshot), so that it's consistent while writers go on. It is read in batches ordered by ID, each
+starting after the last ID of the previous one, which stays fast however far
+into a table it gets. Only what the user can read is exported.
+"""
+
+import asyncio
+import csv
+import io
+import json
+from xml.sax.saxutils import escape, quoteattr
+
+import veronique.objects as O
+from veronique.constants import EXPORT_BATCH_SIZE
+from veronique.data_types import TYPES
+from veronique.db import ROOT
+
+# column suffix -> (model, whether the column holds a comma-separated list)
+LABELLED_COLUMNS = {
+    "c": (O.Claim, False),
+    "cs": (O.Claim, True),
+    "v": (O.Verb, False),
+    "vs": (O.Verb, True),
+}
+
+
+def _ids(value, is_list):
+    if value is None:
+        return []
+    try:
+        if is_list:
+            return [int(part) for part in str(value).split(",")]
+        return [int(value)]
+    except ValueError:
+        return []
+
+
+def _add_labels(columns, rows):
+    """Add a <column>_label column after every _c/_v/_cs/_vs column."""
+    labelled = {}
+    for i, column in enumerate(columns):
+        prefix, _, type_ = column.rpartition("_")
+        if prefix and type_ in LABELLED_COLUMNS:
+            labelled[i] = LABELLED_COLUMNS[type_]
+    if not labelled:
+        return columns, rows
+    # one lookup per model and batch, instead of one per cell.
+    ids = {model: [] for model, _ in labelled.values()}
+    for row in rows:
+        for i, (model, is_list) in labelled.items():
+            ids[model].extend(_ids(row[i], is_list))
+    labels = {model: model.labels(model_ids) for model, model_ids in ids.items()}
+
+    new_columns = []
+    for i, column in enumerate(columns):
+        new_columns.append(column)
+        if i in labelled:
+            new_columns.append(f"{column}_label")
+    new_rows = []
+    for row in rows:
+        new_row = []
+        for i, value in enumerate(row):
+            new_row.append(value)
+            if i in labelled:
+                model, is_list = labelled[i]
+                new_row.append(
+                    ", ".join(labels[model].get(id, "") for id in _ids(value, is_list))
+                    or None
+                )
+        new_rows.append(new_row)
+    return new_columns, new_rows
+
+
+async def tabulate(batches, *, labels=False):
+    """Turn batches of rows into (columns, rows) batches, optionally with labels."""
+    async for rows in batches:
+        # even an empty batch has its columns, e.g. for the header of a CSV
+        columns = list(rows.columns)
+        rows = [tuple(row) for row in rows]
+        if labels:
+            columns, rows = _add_labels(columns, rows)
+        yield columns, rows
+
+
+def _json_default(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+async def to_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    async for columns, rows in batches:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+async def to_ndjson(batches):
+    async for columns, rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+            for row in rows
+        )
+
+
+async def to_columnar(batches):
+    """One JSON object per batch, mapping each column to a list of values."""
+    async for columns, rows in batches:
+        if not rows:
+            continue
+        yield json.dumps(
+            {column: list(values) for column, values in zip(columns, zip(*rows))},
+            default=_json_default,
+        ) + "\n"
+
+
+# format name -> (writer, content type, file extension)
+FORMATS = {
+    "csv": (to_csv, "text/csv; charset=utf-8", "csv"),
+    "ndjson": (to_ndjson, "application/x-ndjson", "ndjson"),
+    "columnar": (to_columnar, "application/x-ndjson", "columns.ndjson"),
+}
+
+
+def _keyset(conn, sql, params=(), batch_size=None):
+    """
+    Yield batches of rows of sql, which has to select an id column and end in
+    "AND <table>.id > ? ORDER BY <table>.id LIMIT ?".
+    """
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    after = -(2**63)  # IDs of built-in verbs are negative
+    while rows := conn.execute(sql, (*params, after, batch_size)).fetchall():
+        yield rows
+        after = rows[-1]["id"]
+
+
+def _in(ids):
+    # IDs come from the permissions table, and are always integers
+    return f"({','.join(str(int(id)) for id in ids)})"
+
+
+def _readable(user, column):
+    if user.readable_verbs is None:
+        return "1"
+    return f"{column} IN {_in(user.readable_verbs)}"
+
+
+def _claims(conn, user, condition="1"):
+    """Yield batches of claims whose verb, subject and object the user can read."""
+    yield from _keyset(
+        conn,
+        f"""
+        SELECT
+            c.id, c.subject_id, c.verb_id, c.value, c.object_id,
+            c.created_at, c.updated_at,
+            s.verb_id AS subject_verb_id,
+            o.verb_id AS object_verb_id,
+            v.data_type
+        FROM claims c
+        JOIN verbs v ON v.id = c.verb_id
+        LEFT JOIN claims s ON s.id = c.subject_id
+        LEFT JOIN claims o ON o.id = c.object_id
+        WHERE {_readable(user, "c.verb_id")}
+        AND (s.id IS NULL OR {_readable(user, "s.verb_id")})
+        AND (o.id IS NULL OR {_readable(user, "o.verb_id")})
+        AND {condition}
+        AND c.id > ? ORDER BY c.id LIMIT ?
+        """,
+    )
+
+
+def _decode(row):
+    try:
+        return TYPES[row["data_type"]].decode(row["value"])
+    except Exception:  # noqa: BLE001 (data types raise all kinds of things)
+        return row["value"]
+
+
+def _name(row, user):
+    """An entity's name, unless the user only gets to see IDs."""
+    return f"Claim #{row['id']}" if user.redact else row["value"]
+
+
+def _records(conn, user):
+    """Yield batches of dicts for verbs, then queries, then entities and claims."""
+    for rows in _keyset(
+        conn,
+        f"""
+        SELECT id, label, data_type FROM verbs
+        WHERE {_readable(user, "verbs.id")}
+        AND verbs.id > ? ORDER BY verbs.id LIMIT ?
+        """,
+    ):
+        yield [
+            {"type": "verb", "id": row["id"], "label": row["label"], "data_type": row["data_type"]}
+            for row in rows
+        ]
+    condition = "1" if user.viewable_queries is None else f"queries.id IN {_in(user.viewable_queries)}"
+    for rows in _keyset(
+        conn,
+        f"""
+        SELECT id, label, sql FROM queries
+        WHERE {condition}
+        AND queries.id > ? ORDER BY queries.id LIMIT ?
+        """,
+    ):
+        yield [
+            {
+                "type": "query",
+                "id": row["id"],
+                "label": row["label"],
+                # only admins get to see SQL
+                **({"sql": row["sql"]} if user.is_admin else {}),
+            }
+            for row in rows
+        ]
+    for rows in _claims(conn, user):
+        batch = []
+        for row in rows:
+            record = {"id": row["id"]}
+            if row["verb_id"] == ROOT:
+                record = {"type": "entity", **record, "name": _name(row, user)}
+            else:
+                record = {"type": "claim", **record, "subject": row["subject_id"], "verb": row["verb_id"]}
+                if row["object_id"] is not None:
+                    record["object"] = row["object_id"]
+                elif not user.redact:
+                    record["value"] = _decode(row)
+            record["created_at"] = row["created_at"]
+            record["updated_at"] = row["updated_at"]
+            batch.append(record)
+        yield batch
+
+
+def database_ndjson(conn, user):
+    for records in _records(conn, user):
+        yield "".join(json.dumps(record, default=_json_default) + "\n" for record in records)
+
+
+def _nodes(conn, user):
+    return _claims(conn, user, f"c.verb_id = {ROOT}")
+
+
+def _edges(conn, user):
+    """Links between entities, along with the labels of their verbs."""
+    labels = {
+        row["id"]: row["label"]
+        for row in conn.execute("SELECT id, label FROM verbs")
+    }
+    for rows in _claims(conn, user, f"s.verb_id = {ROOT} AND o.verb_id = {ROOT}"):
+        yield [(row, labels[row["verb_id"]]) for row in rows]
+
+
+def database_graphml(conn, user):
+    yield """<?xml version="1.0" encoding="UTF-8"?>
+<graphml xmlns="http://graphml.graphdrawing.org/xmlns">
+  <key id="label" for="node" attr.name="label" attr.type="string"/>
+  <key id="verb" for="edge" attr.name="verb" attr.type="string"/>
+  <key id="verb_id" for="edge" attr.name="verb_id" attr.type="int"/>
+  <graph id="veronique" edgedefault="directed">
+"""
+    for rows in _nodes(conn, user):
+        yield "".join(
+            f"""    <node id="{row["id"]}"><data key="label">{escape(_name(row, user) or "")}</data></node>\n"""
+            for row in rows
+        )
+    for edges in _edges(conn, user):
+        yield "".join(
+            f"""    <edge id="e{row["id"]}" source="{row["subject_id"]}" target="{row["object_id"]}">"""
+            f"""<data key="verb">{escape(label)}</data><data key="verb_id">{row["verb_id"]}</data></edge>\n"""
+            for row, label in edges
+        )
+    yield "  </graph>\n</graphml>\n"
+
+
+def database_gexf(conn, user):
+    yield """<?xml version="1.0" encoding="UTF-8"?>
+<gexf xmlns="http://gexf.net/1.3" version="1.3">
+  <graph defaultedgetype="directed">
+    <attributes class="edge">
+      <attribute id="verb_id" title="verb_id" type="integer"/>
+    </attributes>
+    <nodes>
+"""
+    for rows in _nodes(conn, user):
+        yield "".join(
+            f"""      <node id="{row["id"]}" label={quoteattr(_name(row, user) or "")}/>\n"""
+            for row in rows
+        )
+    yield "    </nodes>\n    <edges>\n"
+    for edges in _edges(conn, user):
+        yield "".join(
+            f"""      <edge id="{row["id"]}" source="{row["subject_id"]}" target="{row["object_id"]}" """
+            f"""label={quoteattr(label)}><attvalues><attvalue for="verb_id" value="{row["verb_id"]}"/>"""
+            """</attvalues></edge>\n"""
+            for row, label in edges
+        )
+    yield "    </edges>\n  </graph>\n</gexf>\n"
+
+
+async def in_thread(chunks):
+    """Iterate over a generator that reads from a snapshot without blocking the event loop."""
+    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+        yield chunk
+
+
+# format name -> (writer, content type, file extension); graph formats only
+# have entities and the links between them
+DATABASE_FORMATS = {
+    "ndjson": (database_ndjson, "application/x-ndjson", "ndjson"),
+    "graphml": (database_graphml, "application/graphml+xml", "graphml"),
+    "gexf": (database_gexf, "application/gexf+xml", "gexf"),
+}
@@ -0,0 +1,257 @@
+"""
+Fill a database with synthetic data, for measuring performance.
+
+    veronique-generate --claims 100000 [--seed 0]
+
+Entities are mostly people, with some places, companies and events; they come
+with the usual mix of claims: categories, birth dates, nicknames, links to each
+other (some with validity periods), notes mentioning other entities, comments
+and avatars. There's also an inferred verb and a few saved queries. The same
+seed always produces the same data.
+
+Claims are written directly with bulk inserts, bypassing the change log, so
+this is meant for a fresh database that no running instance is serving. A new
+database is created (with the admin password "admin") if needed.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from time import perf_counter
+
+from veronique.constants import GENERATE_BATCH_SIZE
+
+SYLLABLES = [
+    "an", "bel", "cor", "da", "el", "fin", "gar", "ha", "is", "jo", "ka", "lin",
+    "mar", "no", "or", "pe", "quin", "ro", "sa", "tor", "ul", "va", "wen", "xa",
+    "yo", "zed", "mi", "lu", "ste", "ria",
+]
+CATEGORIES = {"human": 90, "place": 5, "company": 3, "event": 2}  # relative frequency
+PIXEL = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4"
+    "2mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+WORDS = [
+    "met", "at", "the", "conference", "in", "lives", "near", "works", "with",
+    "likes", "cooking", "and", "hiking", "owes", "money", "to", "old", "friend",
+    "of", "talked", "about", "moving", "soon", "birthday", "party", "with",
+]
+QUERIES = {
+    "Birthdays this month": """
+        SELECT c.subject_id AS claim_id, c.value
+        FROM claims c
+        WHERE c.verb_id = {birth_date} AND substr(c.value, 6, 2) = strftime('%m', 'now')
+    """,
+    "Most linked entities": """
+        SELECT c.object_id AS claim_id, count(*) AS links
+        FROM claims c
+        WHERE c.object_id IS NOT NULL AND c.verb_id >= 0  -- no categories
+        GROUP BY c.object_id
+        ORDER BY links DESC
+        LIMIT 50
+    """,
+    "Current employees": """
+        SELECT c.subject_id AS claim_id, c.object_id AS company
+        FROM claims c
+        WHERE c.verb_id = {works_at}
+        AND NOT EXISTS (
+            SELECT 1 FROM claims v
+            WHERE v.subject_id = c.id AND v.verb_id = {valid_until}
+        )
+    """,
+}
+
+
+def _name(rng, parts):
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+
+def _date(rng, first_year, last_year, unknown=0.1):
+    year = rng.randint(first_year, last_year)
+    if rng.random() < unknown:
+        return f"{year}-??-??"
+    return f"{year}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}"
+
+
+def _range(rng, first_year, last_year):
+    start = _date(rng, first_year, last_year, unknown=0)
+    return f"{start}--{start}"
+
+
+class Generator:
+    def __init__(self, cur, seed, verbs, categories):
+        self.cur = cur
+        self.rng = random.Random(seed)
+        self.verbs = verbs
+        self.categories = categories
+        self.next_id = cur.execute("SELECT coalesce(max(id), 0) + 1 FROM claims").fetchone()[0]
+        self.claims = []
+        self.index = []
+        self.written = 0
+        self.entities = {category: [] for category in CATEGORIES}
+
+    def claim(self, subject_id, verb_id, value=None, object_id=None):
+        claim_id = self.next_id
+        self.next_id += 1
+        self.claims.append((claim_id, subject_id, verb_id, value, object_id))
+        return claim_id
+
+    def entity(self, name):
+        claim_id = self.claim(None, self.verbs["root"], name)
+        self.index.append((claim_id, name))
+        return claim_id
+
+    def flush(self):
+        from veronique.search import ngrams
+
+        self.cur.executemany(
+            """
+            INSERT INTO claims
+                (id, subject_id, verb_id, value, object_id, owner_id)
+            VALUES
+                (?, ?, ?, ?, ?, 0)
+            """,
+            self.claims,
+        )
+        self.cur.executemany(
+            "INSERT INTO inverted_index (table_name, id, ngram) VALUES ('claims', ?, ?)",
+            ((claim_id, ngram) for claim_id, name in self.index for ngram in ngrams(name)),
+        )
+        self.cur.executemany(
+            "INSERT INTO forward_index (table_name, id, length) VALUES ('claims', ?, ?)",
+            ((claim_id, len(list(ngrams(name)))) for claim_id, name in self.index),
+        )
+        self.cur.connection.commit()
+        self.written += len(self.claims)
+        self.claims.clear()
+        self.index.clear()
+
+    def pick(self, category):
+        if candidates := self.entities[category]:
+            return self.rng.choice(candidates)
+        return None
+
+    def add_entity(self):
+        rng = self.rng
+        v = self.verbs
+        category = rng.choices(list(CATEGORIES), weights=CATEGORIES.values())[0]
+        if category == "human":
+            name = f"{_name(rng, 2)} {_name(rng, rng.randint(2, 3))}"
+        else:
+            name = f"{_name(rng, rng.randint(2, 4))} {category.capitalize()}"
+        entity = self.entity(name)
+        self.claim(entity, v["category"], object_id=self.categories[category])
+        if category == "human":
+            self.claim(entity, v["birth_date"], _date(rng, 1920, 2020))
+            if rng.random() < 0.3:
+                self.claim(entity, v["nickname"], _name(rng, 2))
+            for _ in range(rng.choice([0, 0, 1, 2])):
+                if parent := self.pick("human"):
+                    self.claim(entity, v["child_of"], object_id=parent)
+            if rng.random() < 0.3 and (partner := self.pick("human")):
+                self.claim(entity, v["partner_of"], object_id=partner)
+            if rng.random() < 0.7 and (place := self.pick("place")):
+                self.claim(entity, v["lives_in"], object_id=place)
+            if rng.random() < 0.6 and (company := self.pick("company")):
+                job = self.claim(entity, v["works_at"], object_id=company)
+                if rng.random() < 0.5:
+                    self.claim(job, v["valid_from"], _range(rng, 1990, 2015))
+                    if rng.random() < 0.5:
+                        self.claim(job, v["valid_until"], _range(rng, 2016, 2025))
+            if rng.random() < 0.05:
+                self.claim(entity, v["avatar"], PIXEL)
+        if rng.random() < 0.3:
+            words = rng.choices(WORDS, k=rng.randint(5, 30))
+            for _ in range(rng.randint(0, 2)):
+                if other := self.pick("human"):
+                    words.insert(rng.randrange(len(words) + 1), f"[@{other}]")
+            self.claim(entity, v["notes"], " ".join(words).capitalize() + ".")
+        if rng.random() < 0.1:
+            self.claim(entity, v["comment"], " ".join(rng.choices(WORDS, k=8)))
+        self.entities[category].append(entity)
+
+    def run(self, claims, report):
+        start = perf_counter()
+        target = self.written + claims
+        while self.written + len(self.claims) < target:
+            self.add_entity()
+            if len(self.claims) >= GENERATE_BATCH_SIZE:
+                self.flush()
+                elapsed = perf_counter() - start
+                report(f"{self.written:,} claims ({self.written / elapsed:,.0f}/s)")
+        self.flush()
+
+
+def generate(claims, *, seed=0, report=print):
+    """Add about the given number of claims to the database."""
+    import veronique.objects as O
+    from veronique import db
+    from veronique.context import context
+
+    db.migrate(report=lambda message: None)
+    context.user = O.User(0)
+    # labels get a suffix when this is run more than once
+    runs = db.conn.execute(
+        "SELECT count(*) FROM queries WHERE label LIKE 'Most linked entities%'",
+    ).fetchone()[0]
+    suffix = f" {runs + 1}" if runs else ""
+    types = O.TYPES
+    verbs = {
+        "root": db.ROOT,
+        "category": db.IS_A,
+        "avatar": db.AVATAR,
+        "comment": db.COMMENT,
+        "valid_from": db.VALID_FROM,
+        "valid_until": db.VALID_UNTIL,
+    }
+    for key, label, data_type in [
+        ("birth_date", "birth date", "date"),
+        ("nickname", "nickname", "string"),
+        ("child_of", "child of", "directed_link"),
+        ("partner_of", "partner of", "undirected_link"),
+        ("lives_in", "lives in", "directed_link"),
+        ("works_at", "works at", "directed_link"),
+        ("notes", "notes", "text"),
+    ]:
+        verbs[key] = O.Verb.new(f"{label}{suffix}", data_type=types[data_type]).id
+    O.Verb.new(
+        f"sibling of{suffix}",
+        data_type=types["inferred"],
+        extra=json.dumps({
+            "g1s": "this", "g1v": str(verbs["child_of"]), "g1o": "A",
+            "g2s": "that", "g2v": str(verbs["child_of"]), "g2o": "A",
+        }),
+    )
+    categories = {
+        category: O.Claim.new_entity(f"{category}{suffix}").id
+        for category in CATEGORIES
+    }
+    generator = Generator(db.conn.cursor(), seed, verbs, categories)
+    generator.run(claims, report)
+    for label, sql in QUERIES.items():
+        O.Query.new(f"{label}{suffix}", sql.format(**verbs))
+    return generator.written
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        prog="veronique-generate",
+        description="Fill the database with synthetic data.",
+    )
+    parser.add_argument("--claims", type=int, default=100_000, help="roughly how many claims to add")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    from veronique import db
+
+    if not os.path.exists(db.path):
+        with open("veronique_initial_pw", "w") as f:
+            f.write("admin")
+    start = perf_counter()
+    written = generate(args.claims, seed=args.seed, report=lambda message: print(message, file=sys.stderr))
+    print(f"Added {written:,} claims in {perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    cli()
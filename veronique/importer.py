@@ -0,0 +1,345 @@
+"""
+Import entities and claims from a CSV or JSONL file.
+
+    veronique-import people.jsonl [--source people]
+
+Every record (a line of JSONL, or a row of CSV with these columns) is either an
+entity:
+
+    {"key": "ada", "name": "Ada Lovelace"}
+
+or a claim, with a value or an object depending on the verb:
+
+    {"subject": "ada", "verb": "birth date", "value": "1815-12-10"}
+    {"key": "job", "subject": "ada", "verb": "works at", "object": "engines"}
+    {"subject": "job", "verb": "valid from", "value": "1842-01-01--1843-12-31"}
+
+Subjects and objects refer to the keys of earlier records (of this import, or
+of an earlier one from the same source), or to existing claims as "#123". Verbs
+are given by label or ID. Values are written the way they are stored (as in an
+export), and mentions in text values can refer to keys as well, as [@ada].
+Records without a key get one derived from their content.
+
+The file is read as a stream and written in batches of one transaction each;
+the search index, mentions and the change log are brought up to date in a
+single pass at the end. Keys are remembered per source, so importing the same
+file again only adds what's new, and an interrupted import can simply be
+started again.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import re
+import sys
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+
+from veronique.constants import IMPORT_BATCH_SIZE
+
+MENTION = re.compile(r"\[@([^\]\s]+)\]")
+MAX_PARAMETERS = 500  # per IN (...)
+
+
+def read(path):
+    """
+    Yield (line number, record) for every record in a CSV or JSONL file.
+
+    JSONL records are yielded as they are, to be parsed by the importer, so
+    that a broken line is reported instead of ending the import.
+    """
+    path = Path(path)
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.suffix == ".csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, {k: v for k, v in row.items() if k and v}
+        else:
+            for number, line in enumerate(f, start=1):
+                if line.strip():
+                    yield number, line
+
+
+def _derived_key(*parts):
+    return "~" + hashlib.sha1(json.dumps(parts).encode()).hexdigest()
+
+
+def _chunks(items, size=MAX_PARAMETERS):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class Importer:
+    def __init__(self, source, report):
+        from veronique import db
+
+        self.conn = db.conn
+        self.cur = self.conn.cursor()
+        self.source = source
+        self.report = report
+        self.verbs = {}  # label or ID -> (ID, data type)
+        # lowest ID wins when labels are ambiguous
+        for row in self.cur.execute("SELECT id, label, data_type FROM verbs ORDER BY id DESC"):
+            self.verbs[row["label"]] = self.verbs[str(row["id"])] = (row["id"], row["data_type"])
+        self.stats = dict.fromkeys(("records", "entities", "claims", "skipped", "errors"), 0)
+
+    def error(self, where, message):
+        self.stats["errors"] += 1
+        self.report(f"{where}: {message}")
+
+    def parse(self, record):
+        """Return (key, subject, verb ID, value, object) of a record."""
+        from veronique.data_types import TYPES
+        from veronique.db import ROOT
+
+        if isinstance(record, str):
+            try:
+                record = json.loads(record)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"not valid JSON ({e.msg})") from None
+        if not isinstance(record, dict):
+            raise TypeError("not an object")
+        if "name" in record:
+            name = str(record["name"])
+            return str(record.get("key") or _derived_key(name)), None, ROOT, name, None
+        if missing := {"subject", "verb"} - record.keys():
+            raise ValueError(f"missing {', '.join(sorted(missing))}")
+        if str(record["verb"]) not in self.verbs:
+            raise ValueError(f"unknown verb {record['verb']!r}")
+        verb_id, data_type = self.verbs[str(record["verb"])]
+        subject = str(record["subject"])
+        value = object_ = None
+        if data_type.endswith("directed_link"):
+            if "object" not in record:
+                raise ValueError(f"{record['verb']!r} needs an object")
+            object_ = str(record["object"])
+        elif data_type == "inferred" or verb_id == ROOT:
+            raise ValueError(f"{record['verb']!r} can't be claimed")
+        elif "value" not in record:
+            raise ValueError(f"{record['verb']!r} needs a value")
+        else:
+            value = record["value"]
+            if not isinstance(value, str):
+                value = json.dumps(value)
+            try:
+                TYPES[data_type].decode(value)
+            except Exception as e:  # noqa: BLE001 (data types raise all kinds of things)
+                raise ValueError(f"invalid value for {record['verb']!r} ({e})") from None
+            if data_type == "text":
+                value = TYPES[data_type].encode(value)
+        key = record.get("key") or _derived_key(subject, verb_id, value, object_)
+        return str(key), subject, verb_id, value, object_
+
+    def lookup(self, keys):
+        """Return {key: claim ID} for those of the keys that exist."""
+        keys = set(keys)
+        found = {}
+        ids = {key: int(key[1:]) for key in keys if key.startswith("#") and key[1:].isdigit()}
+        for chunk in _chunks(ids.values()):
+            for row in self.cur.execute(
+                f"SELECT id FROM claims WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ):
+                found[f"#{row['id']}"] = row["id"]
+        # keys of claims that were deleted since don't count
+        for chunk in _chunks(keys - ids.keys()):
+            for row in self.cur.execute(
+                f"""
+                SELECT k.key, k.claim_id
+                FROM external_keys k
+                JOIN claims c ON c.id = k.claim_id
+                WHERE k.source = ? AND k.key IN ({",".join("?" * len(chunk))})
+                """,
+                (self.source, *chunk),
+            ):
+                found[row["key"]] = row["claim_id"]
+        return found
+
+    def write(self, batch):
+        parsed = []
+        for number, record in batch:
+            try:
+                parsed.append((number, *self.parse(record)))
+            except (TypeError, ValueError) as e:
+                self.error(f"line {number}", e)
+        references = {
+            ref
+            for _, key, subject, _, _, object_ in parsed
+            for ref in (key, subject, object_)
+            if ref is not None
+        }
+        self.cur.execute("BEGIN IMMEDIATE")
+        try:
+            known = self.lookup(references)
+            next_id = self.cur.execute("SELECT coalesce(max(id), 0) + 1 FROM claims").fetchone()[0]
+            claims = []
+            keys = []
+            for number, key, subject, verb_id, value, object_ in parsed:
+                if key in known:
+                    self.stats["skipped"] += 1
+                    continue
+                unknown = [ref for ref in (subject, object_) if ref is not None and ref not in known]
+                if unknown:
+                    self.error(f"line {number}", f"unknown key {unknown[0]!r}")
+                    continue
+                claims.append((next_id, known.get(subject), verb_id, value, known.get(object_)))
+                keys.append((self.source, key, next_id))
+                known[key] = next_id
+                next_id += 1
+                self.stats["entities" if subject is None else "claims"] += 1
+            self.cur.executemany(
+                """
+                INSERT INTO claims
+                    (id, subject_id, verb_id, value, object_id, owner_id)
+                VALUES
+                    (?, ?, ?, ?, ?, 0)
+                """,
+                claims,
+            )
+            self.cur.executemany(
+                """
+                INSERT OR REPLACE INTO external_keys
+                    (source, key, claim_id, pending)
+                VALUES
+                    (?, ?, ?, 1)
+                """,
+                keys,
+            )
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.stats["records"] += len(batch)
+
+    def _pending(self, condition, params=()):
+        """Yield chunks of (ID, value) of claims imported since the last finish()."""
+        cur = self.conn.cursor()
+        cur.execute(
+            f"""
+            SELECT c.id, c.value
+            FROM external_keys k
+            JOIN claims c ON c.id = k.claim_id
+            WHERE k.source = ? AND k.pending AND {condition}
+            """,
+            (self.source, *params),
+        )
+        while rows := cur.fetchmany(IMPORT_BATCH_SIZE):
+            yield rows
+
+    def _mention(self, claim_id, known, match):
+        key = match.group(1)
+        if key.isdigit():
+            return match.group(0)
+        if key not in known:
+            self.error(f"claim {claim_id}", f"unknown key {key!r} in mention")
+            return match.group(0)
+        return f"[@{known[key]}]"
+
+    def finish(self):
+        """Update everything that was deferred, for all pending claims."""
+        from veronique.db import ROOT
+        from veronique.search import ngrams
+
+        self.cur.execute("BEGIN IMMEDIATE")
+        try:
+            for rows in self._pending(
+                "c.value LIKE '%[@%' AND c.verb_id IN (SELECT id FROM verbs WHERE data_type = 'text')",
+            ):
+                known = self.lookup(
+                    key
+                    for row in rows
+                    for key in MENTION.findall(row["value"])
+                    if not key.isdigit()
+                )
+                updates = []
+                for row in rows:
+                    value = MENTION.sub(partial(self._mention, row["id"], known), row["value"])
+                    if value != row["value"]:
+                        updates.append((value, row["id"]))
+                self.cur.executemany("UPDATE claims SET value = ? WHERE id = ?", updates)
+            for rows in self._pending("c.verb_id = ?", (ROOT,)):
+                grams = {row["id"]: list(ngrams(row["value"])) for row in rows}
+                self.cur.executemany(
+                    "INSERT INTO inverted_index (table_name, id, ngram) VALUES ('claims', ?, ?)",
+                    ((claim_id, ngram) for claim_id, ngram_list in grams.items() for ngram in ngram_list),
+                )
+                self.cur.executemany(
+                    "INSERT INTO forward_index (table_name, id, length) VALUES ('claims', ?, ?)",
+                    ((claim_id, len(ngram_list)) for claim_id, ngram_list in grams.items()),
+                )
+            self.cur.execute(
+                """
+                INSERT INTO changes
+                    (table_name, key, operation, user_id)
+                SELECT 'claims', CAST(claim_id AS TEXT), 'insert', 0
+                FROM external_keys
+                WHERE source = ? AND pending
+                ORDER BY claim_id
+                """,
+                (self.source,),
+            )
+            self.cur.execute(
+                "UPDATE external_keys SET pending = 0 WHERE source = ? AND pending",
+                (self.source,),
+            )
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def run(self, records):
+        start = perf_counter()
+        batch = []
+        for number, record in records:
+            batch.append((number, record))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                self.write(batch)
+                batch.clear()
+                elapsed = perf_counter() - start
+                self.report(f"{self.stats['records']:,} records ({self.stats['records'] / elapsed:,.0f}/s)")
+        if batch:
+            self.write(batch)
+        self.finish()
+        self.stats["seconds"] = perf_counter() - start
+
+
+def import_file(path, *, source=None, report=print):
+    """
+    Import a CSV or JSONL file, and return what was done.
+
+    The result counts records, new entities and claims, records that had been
+    imported before ("skipped"), and errors, and has the time it took.
+    """
+    from veronique import coherence
+
+    importer = Importer(source or Path(path).stem, report)
+    importer.run(read(path))
+    coherence.forget_all()
+    return importer.stats
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        prog="veronique-import",
+        description="Import entities and claims from a CSV or JSONL file.",
+    )
+    parser.add_argument("file", type=Path, help="a .csv file, or JSONL with any other extension")
+    parser.add_argument("--source", help="what the keys in the file belong to (default: the file name)")
+    args = parser.parse_args()
+    from veronique import db
+
+    db.migrate(report=lambda message: print(message, file=sys.stderr))
+    stats = import_file(args.file, source=args.source, report=lambda message: print(message, file=sys.stderr))
+    print(
+        f"{stats['records']:,} records in {stats['seconds']:.1f}s"
+        f" ({stats['records'] / max(stats['seconds'], 1e-9):,.0f}/s):"
+        f" {stats['entities']:,} entities and {stats['claims']:,} claims added,"
+        f" {stats['skipped']:,} already there, {stats['errors']:,} errors."
+    )
+
+
+if __name__ == "__main__":
+    cli()
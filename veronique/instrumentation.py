@@ -0,0 +1,372 @@
+"""
+Measures the SQL that is run, and which requests it's run for.
+
+The database connection uses Connection below, whose cursors time every
+statement: executing it, and fetching its rows with fetchone(), fetchmany() or
+fetchall() (iterating over a cursor directly isn't timed). Statements are
+aggregated by their shape, i.e. their SQL with literals replaced by ? and
+whitespace collapsed, and attributed to the current request through
+context.timing. After each request, its total duration and SQL statistics are
+added to per-endpoint histograms.
+
+Statements that take longer than the slow query threshold are logged to the
+slow_queries table together with their query plan, which is captured right
+away; the table only keeps the most recent ones.
+
+All numbers are kept in memory, per worker process.
+"""
+
+import re
+import sqlite3
+from bisect import bisect_left
+from datetime import datetime, timezone
+from functools import lru_cache
+from time import perf_counter
+
+from veronique import caches
+from veronique.constants import (
+    INSTRUMENTATION_DURATION_BUCKETS,
+    INSTRUMENTATION_MAX_SHAPES,
+    INSTRUMENTATION_QUERY_BUCKETS,
+    SLOW_QUERY_LOG_SIZE,
+)
+from veronique.context import context
+
+OTHER = "(other)"
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+@lru_cache(maxsize=4096)
+def normalize(sql):
+    """Return the shape of a statement, which is the same for all its variants."""
+    sql = _COMMENTS.sub(" ", sql)
+    sql = _STRINGS.sub("?", sql)
+    sql = _NUMBERS.sub("?", sql)
+    sql = _LISTS.sub("(...)", sql)
+    return " ".join(sql.split())
+
+
+class Shape:
+    __slots__ = ("count", "rows", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+
+class Timing:
+    """What a single request spent, in total and on SQL."""
+
+    __slots__ = ("endpoint", "queries", "slow_threshold", "sql_seconds", "start")
+
+    def __init__(self, endpoint, slow_threshold):
+        self.start = perf_counter()
+        self.endpoint = endpoint
+        self.slow_threshold = slow_threshold
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+    @property
+    def seconds(self):
+        return perf_counter() - self.start
+
+    def header(self):
+        """The value of the Server-Timing header for this request."""
+        return (
+            f'sql;dur={self.sql_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f"total;dur={self.seconds * 1000:.1f}"
+        )
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Yield (upper bound, number of observations up to it), like Prometheus does."""
+        total = 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls into."""
+        for bound, total in self.cumulative():
+            if total >= q * self.count:
+                return bound
+        return float("inf")
+
+
+class Endpoint:
+    __slots__ = ("duration", "queries", "sql_seconds")
+
+    def __init__(self):
+        self.duration = Histogram(INSTRUMENTATION_DURATION_BUCKETS)
+        self.queries = Histogram(INSTRUMENTATION_QUERY_BUCKETS)
+        self.sql_seconds = Histogram(INSTRUMENTATION_DURATION_BUCKETS)
+
+
+shapes = {}
+endpoints = {}
+
+
+_slow = []
+
+
+def _record(sql, seconds, executed, rows=0):
+    shape = normalize(sql)
+    stats = shapes.get(shape)
+    if stats is None:
+        if len(shapes) >= INSTRUMENTATION_MAX_SHAPES:
+            # e.g. many different saved queries; don't grow without bounds
+            shape = OTHER
+        stats = shapes.setdefault(shape, Shape())
+    stats.seconds += seconds
+    stats.rows += rows
+    if executed:
+        stats.count += 1
+    if (timing := context.timing) is not None:
+        timing.sql_seconds += seconds
+        if executed:
+            timing.queries += 1
+    return timing
+
+
+class Cursor(sqlite3.Cursor):
+    sql = None
+
+    def _measured(self, seconds, executed, rows=0):
+        self.seconds += seconds
+        timing = _record(self.sql, seconds, executed, rows)
+        if (
+            timing is not None
+            and timing.slow_threshold
+            and not self.logged
+            and self.seconds * 1000 > timing.slow_threshold
+        ):
+            self.logged = True
+            _slow.append((
+                datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                timing.endpoint,
+                normalize(self.sql),
+                None if self.parameters is None else len(self.parameters),
+                self.seconds * 1000,
+                self._plan(),
+            ))
+
+    def _plan(self):
+        """Return what EXPLAIN QUERY PLAN says about the current statement, as an indented tree."""
+        if self.parameters is None:
+            return None
+        try:
+            rows = self.connection.cursor(sqlite3.Cursor).execute(
+                f"EXPLAIN QUERY PLAN {self.sql}",
+                self.parameters,
+            ).fetchall()
+        except sqlite3.Error:
+            return None
+        depths = {0: -1}
+        lines = []
+        for id, parent, _, detail in rows:
+            depths[id] = depths.get(parent, -1) + 1
+            lines.append("  " * depths[id] + detail)
+        return "\n".join(lines)
+
+    def _start(self, sql, parameters):
+        self.sql = sql
+        self.parameters = parameters
+        self.seconds = 0.0
+        self.logged = False
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        start = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._measured(perf_counter() - start, executed=True)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql, None)
+        start = perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._measured(perf_counter() - start, executed=True)
+
+    def executescript(self, sql_script):
+        self._start(sql_script, None)
+        start = perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._measured(perf_counter() - start, executed=True)
+            # there's nothing to fetch from a script
+            self.sql = None
+
+    def fetchone(self):
+        start = perf_counter()
+        row = super().fetchone()
+        if self.sql is not None:
+            self._measured(perf_counter() - start, executed=False, rows=row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self.sql is not None:
+            self._measured(perf_counter() - start, executed=False, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        start = perf_counter()
+        rows = super().fetchall()
+        if self.sql is not None:
+            self._measured(perf_counter() - start, executed=False, rows=len(rows))
+        return rows
+
+
+class Connection(sqlite3.Connection):
+    """A connection whose statements are measured; use as factory for sqlite3.connect()."""
+
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def start_request(endpoint, slow_threshold=0):
+    """
+    Start measuring a request.
+
+    Statements taking longer than slow_threshold milliseconds (if it's not 0)
+    are kept, along with their query plan, until log_slow_queries() is called.
+    """
+    context.timing = Timing(endpoint, slow_threshold)
+
+
+def finish_request():
+    """Add the current request to the statistics; return its Server-Timing header."""
+    if (timing := context.timing) is None:
+        return None
+    stats = endpoints.get(timing.endpoint)
+    if stats is None:
+        stats = endpoints[timing.endpoint] = Endpoint()
+    stats.duration.observe(timing.seconds)
+    stats.queries.observe(timing.queries)
+    stats.sql_seconds.observe(timing.sql_seconds)
+    return timing.header()
+
+
+def log_slow_queries(conn):
+    """Write the slow statements kept so far to the slow_queries table."""
+    global _slow
+    if not _slow or conn.in_transaction:
+        # don't commit anything that isn't ours
+        return
+    entries, _slow = _slow, []
+    cur = conn.cursor(sqlite3.Cursor)
+    try:
+        cur.executemany(
+            """
+            INSERT INTO slow_queries
+                (created_at, endpoint, shape, parameters, milliseconds, plan)
+            VALUES
+                (?, ?, ?, ?, ?, ?)
+            """,
+            entries,
+        )
+        cur.execute(
+            "DELETE FROM slow_queries WHERE id <= (SELECT max(id) FROM slow_queries) - ?",
+            (SLOW_QUERY_LOG_SIZE,),
+        )
+        conn.commit()
+    except sqlite3.OperationalError:
+        # e.g. a read-only database
+        conn.rollback()
+
+
+def _label(value):
+    value = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return f'"{value}"'
+
+
+def _histogram(lines, name, help, histograms):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} histogram")
+    for endpoint, histogram in histograms:
+        label = f"endpoint={_label(endpoint)}"
+        for bound, total in histogram.cumulative():
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f'{name}_bucket{{{label},le="{le}"}} {total}')
+        lines.append(f"{name}_sum{{{label}}} {histogram.sum:g}")
+        lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+
+def prometheus():
+    """Render all statistics in the Prometheus text format."""
+    lines = []
+    items = sorted(endpoints.items())
+    _histogram(
+        lines,
+        "veronique_request_duration_seconds",
+        "Time taken to handle requests.",
+        [(endpoint, stats.duration) for endpoint, stats in items],
+    )
+    _histogram(
+        lines,
+        "veronique_request_sql_queries",
+        "SQL statements executed per request.",
+        [(endpoint, stats.queries) for endpoint, stats in items],
+    )
+    _histogram(
+        lines,
+        "veronique_request_sql_duration_seconds",
+        "Time spent on SQL per request.",
+        [(endpoint, stats.sql_seconds) for endpoint, stats in items],
+    )
+    for name, help, attr in [
+        ("veronique_sql_statements_total", "SQL statements executed, by shape.", "count"),
+        ("veronique_sql_duration_seconds_total", "Time spent on SQL statements, by shape.", "seconds"),
+        ("veronique_sql_rows_total", "Rows fetched, by shape.", "rows"),
+    ]:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} counter")
+        for shape, stats in sorted(shapes.items()):
+            lines.append(f"{name}{{shape={_label(shape)}}} {getattr(stats, attr):g}")
+    for stat, help in [
+        ("hits", "Lookups answered from a cache."),
+        ("misses", "Lookups that had to compute the value."),
+        ("evictions", "Entries dropped to stay within a cache's size."),
+        ("invalidations", "Entries dropped because what they were computed from changed."),
+    ]:
+        name = f"veronique_cache_{stat}_total"
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} counter")
+        for cache_name, cache in sorted(caches.registry.items()):
+            lines.append(f"{name}{{cache={_label(cache_name)}}} {getattr(cache, stat)}")
+    lines.append("# HELP veronique_cache_entries Entries currently in a cache.")
+    lines.append("# TYPE veronique_cache_entries gauge")
+    for cache_name, cache in sorted(caches.registry.items()):
+        lines.append(f"veronique_cache_entries{{cache={_label(cache_name)}}} {len(cache)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,61 @@
+"""
+Apply pending migrations without starting the app.
+
+    veronique-migrate            # apply them, reporting progress
+    veronique-migrate --dry-run  # time them on a copy of the database
+
+The app applies pending migrations itself when it starts, but on a big
+database that can take a while; running them beforehand shows progress, and
+an interrupted run can simply be started again.
+"""
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+from veronique import backup, db
+
+
+def dry_run():
+    if db.pending()[0] <= 10:
+        # that migration consumes veronique_initial_pw
+        print("Can't do a dry run on a new database.", file=sys.stderr)
+        sys.exit(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "dry-run.db"
+        backup.copy(path)
+        copy = sqlite3.connect(path)
+        copy.row_factory = sqlite3.Row
+        try:
+            timings = db.migrate(copy)
+        finally:
+            copy.close()
+    print()
+    for name, seconds in timings.items():
+        print(f"{name:<45} {seconds:8.3f}s")
+    print(f"{'total':<45} {sum(timings.values()):8.3f}s")
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        prog="veronique-migrate",
+        description="Apply pending migrations to the database.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="apply them to a copy of the database and report how long they take",
+    )
+    args = parser.parse_args()
+    if not db.pending():
+        print("Database is up to date.")
+    elif args.dry_run:
+        dry_run()
+    else:
+        db.migrate()
+
+
+if __name__ == "__main__":
+    cli()
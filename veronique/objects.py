@@ -1,12 +1,16 @@
 import json
-import re
 from datetime import date, datetime, timedelta
-from functools import cache, cached_property
+from functools import cached_property
 from html import escape
 from itertools import combinations, count
 
-from veronique import db
-from veronique.constants import CLAIM_DATA_CACHE_TIME, SESSION_MAX_AGE
+from veronique import caches, db, query_cache, sandbox
+from veronique.constants import (
+    CLAIM_DATA_CACHE_SIZE,
+    CLAIM_DATA_CACHE_TIME,
+    INFERABLES_CACHE_SIZE,
+    SESSION_MAX_AGE,
+)
 from veronique.context import context
 from veronique.data_types import TYPES
 from veronique.db import (
@@ -22,11 +26,20 @@ from veronique.db import (
 from veronique.nomnidate import NonOmniscientDate
 from veronique.search import find, update_index_for_doc
 from veronique.security import hash_password, sign
-from veronique.utils import timed_cache
 
 SELF = object()
 UNSET = object()
 
+# Tags are ("claim", id) for the data of a claim, ("user", id) for anything
+# depending on a user's permissions, and ("verbs",) for anything depending on
+# the set of verbs.
+claim_data_cache = caches.Cache("claim data", ttl=CLAIM_DATA_CACHE_TIME, max_size=CLAIM_DATA_CACHE_SIZE)
+inferables_cache = caches.Cache("inferables", max_size=INFERABLES_CACHE_SIZE)
+
+
+def _user_id():
+    return context.user.id if context.user else None
+
 
 class lazy:
     def __init__(self, name):
@@ -72,6 +85,11 @@ class Model:
         for field in cls.fields:
             setattr(cls, field, lazy(field))
 
+    @classmethod
+    def forget(cls, id):
+        """Drop everything cached about an instance, e.g. after a change elsewhere."""
+        cls._cache.pop(id, None)
+
     @classmethod
     def all(cls, *, order_by="id ASC", page_no=0, page_size=20):
         cur = db.conn.cursor()
@@ -145,14 +163,41 @@ class Verb(Model):
             ),
         )
         verb_id = cur.lastrowid
-        update_index_for_doc(cur, "verbs", cur.lastrowid, label)
+        update_index_for_doc(cur, "verbs", verb_id, label)
+        db.log_change(cur, "verbs", verb_id, "insert")
         db.conn.commit()
-        if data_type.name == "inferred":
-            cls.get_inferables.cache_clear()
+        caches.invalidate(("verbs",))
         return Verb(verb_id)
 
     @classmethod
-    @cache
+    def labels(cls, ids):
+        """Return {verb_id: label} for many verbs at once."""
+        ids = set(ids)
+        if not ids:
+            return {}
+        cur = db.conn.cursor()
+        return {
+            row["id"]: (
+                row["label"]
+                if context.user.can("read", "verb", row["id"])
+                else "(unknown verb)"
+            )
+            for row in cur.execute(
+                f"SELECT id, label FROM verbs WHERE id IN ({','.join('?' * len(ids))})",
+                tuple(ids),
+            )
+        }
+
+    @classmethod
+    def forget(cls, id):
+        super().forget(id)
+        caches.invalidate(("verbs",))
+
+    @classmethod
+    @inferables_cache.cached(
+        key=lambda cls: _user_id(),
+        tags=lambda cls: [("verbs",), ("user", _user_id())],
+    )
     def get_inferables(cls):
         result = []
         for inferable in cls.all(data_type="inferred"):
@@ -257,7 +302,9 @@ class Verb(Model):
             """,
             (self.extra, self.id),
         )
+        db.log_change(cur, "verbs", self.id, "update")
         db.conn.commit()
+        caches.invalidate(("verbs",))
 
     def rename(self, name):
         cur = db.conn.cursor()
@@ -269,8 +316,10 @@ class Verb(Model):
             """,
             (name, self.id),
         )
+        db.log_change(cur, "verbs", self.id, "update")
         db.conn.commit()
         self.label = name
+        caches.invalidate(("verbs",))
 
     def delete(self):
         if self.id < 0:
@@ -281,9 +330,11 @@ class Verb(Model):
             "DELETE FROM permissions WHERE object = ? AND permission LIKE '%-verb'",
             (self.id,),
         )
+        db.log_change(cur, "verbs", self.id, "delete")
         db.conn.commit()
         # evict deleted verb from cache:
         self._cache.pop(self.id)
+        caches.invalidate(("verbs",))
 
     def __str__(self):
         return f"{self}"
@@ -309,11 +360,22 @@ class Claim(Model):
     )
     table_name = "claims"
 
+    @classmethod
+    def forget(cls, id):
+        # the claim might be data of its (old or new) subject
+        subject_ids = {id}
+        if (claim := cls._cache.get(id)) and (subject := getattr(claim, "_subject", None)):
+            subject_ids.add(subject.id)
+        row = db.conn.execute("SELECT subject_id FROM claims WHERE id = ?", (id,)).fetchone()
+        if row and row["subject_id"]:
+            subject_ids.add(row["subject_id"])
+        super().forget(id)
+        caches.invalidate(*(("claim", subject_id) for subject_id in subject_ids))
+
     @classmethod
     def bulk_populate(cls, ids, deep=False):
-        ids = [id for id in ids if id not in cls._cache or not cls._cache[id]._populated]
-        if not ids:
-            return
+        """Load the given claims in one go; with deep, their data too."""
+        unpopulated = [id for id in ids if id not in cls._cache or not cls._cache[id]._populated]
         cur = db.conn.cursor()
         for row in cur.execute(
             f"""
@@ -328,33 +390,70 @@ class Claim(Model):
                 owner_id
             FROM
                 claims
-            WHERE id IN ({",".join("?"*len(ids))})
+            WHERE id IN ({",".join("?"*len(unpopulated))})
             """,
-            tuple(ids),
-        ).fetchall():
+            tuple(unpopulated),
+        ).fetchall() if unpopulated else ():
             instance = cls(row["id"])
             instance.populate(row)
             instance._populated = True
 
-        if deep:
+        if deep and ids:
             data_claims = {}
             data_ids = []
-
+            if (verb_ids := context.user.readable_verbs) is not None:
+                cond = f"AND verb_id IN ({','.join(str(verb_id) for verb_id in verb_ids)})"
+            else:
+                cond = ""
             for row in cur.execute(
                 f"""
                 SELECT
                     id, subject_id
                 FROM claims c
-                WHERE subject_id IN ({",".join("?"*len(ids))})
+                WHERE subject_id IN (SELECT value FROM json_each(?))
+                {cond}
                 """,
-                tuple(ids),
+                (json.dumps(ids),),
             ):
                 claim = cls(row["id"])
                 data_claims.setdefault(row["subject_id"], []).append(claim)
                 data_ids.append(row["id"])
             cls.bulk_populate(data_ids, deep=False)
-            for claim_id, data in data_claims.items():
-                cls(claim_id).get_data(data)
+            # the same as get_data() would find, so it doesn't have to look
+            for claim_id in ids:
+                cls(claim_id).get_data(data_claims.get(claim_id, []))
+
+    @classmethod
+    def labels(cls, ids):
+        """
+        Return {claim_id: label} for many claims at once.
+
+        Labels are the same as f"{claim:label}" would produce, but without
+        populating every claim (and its data) one by one.
+        """
+        ids = set(ids)
+        if not ids:
+            return {}
+        cur = db.conn.cursor()
+        labels = {}
+        for row in cur.execute(
+            f"""
+            SELECT
+                id,
+                verb_id,
+                value
+            FROM claims
+            WHERE id IN ({",".join("?"*len(ids))})
+            """,
+            tuple(ids),
+        ):
+            if not context.user.can("read", "verb", row["verb_id"]):
+                labels[row["id"]] = "(unknown claim)"
+            elif row["verb_id"] == ROOT and not context.user.redact:
+                labels[row["id"]] = row["value"]
+            else:
+                labels[row["id"]] = f"Claim #{row['id']}"
+        return labels
 
     def populate(self, row=None):
         cur = db.conn.cursor()
@@ -665,15 +764,66 @@ class Claim(Model):
             yield cls(row["id"])
 
     def delete(self):
+        """Delete the claim, along with everything about it or linking to it."""
+        Claim.delete_many([self.id])
+
+    @classmethod
+    def delete_many(cls, ids):
+        """
+        Delete claims along with everything about them or linking to them (and
+        so on), in one transaction. Return the IDs of all deleted claims.
+        """
+        ids = list(ids)
+        if not ids:
+            return []
         cur = db.conn.cursor()
-        cur.execute("DELETE FROM claims WHERE id = ?", (self.id,))
-        cur.execute("DELETE FROM forward_index WHERE table_name = 'claims' AND id = ?", (self.id,))
-        cur.execute("DELETE FROM inverted_index WHERE table_name = 'claims' AND id = ?", (self.id,))
-        # evict deleted claim from cache:
-        db.conn.commit()
-        self._cache.pop(self.id)
-        if self.subject and hasattr(Claim.get_data.__wrapped__, "_cached"):
-            Claim.get_data.__wrapped__._cached.pop(self.subject.id, None)
+        try:
+            rows = cls._delete(cur, ids)
+            db.conn.commit()
+        except BaseException:
+            db.conn.rollback()
+            raise
+        cls._forget_deleted(rows)
+        return [row["id"] for row in rows]
+
+    @classmethod
+    def _delete(cls, cur, ids):
+        """Like delete_many(), without committing; return (id, subject_id) rows."""
+        rows = cur.execute(
+            f"""
+            WITH RECURSIVE doomed(id) AS (
+                SELECT id FROM claims WHERE id IN ({",".join("?" * len(ids))})
+                UNION
+                SELECT c.id FROM claims c
+                JOIN doomed d ON c.subject_id = d.id OR c.object_id = d.id
+            )
+            SELECT c.id, c.subject_id FROM doomed JOIN claims c USING (id)
+            """,
+            ids,
+        ).fetchall()
+        deleted = [row["id"] for row in rows]
+        for chunk in range(0, len(deleted), 500):
+            in_chunk = deleted[chunk:chunk + 500]
+            placeholders = ",".join("?" * len(in_chunk))
+            cur.execute(f"DELETE FROM claims WHERE id IN ({placeholders})", in_chunk)
+            for table in ("forward_index", "inverted_index"):
+                cur.execute(
+                    f"DELETE FROM {table} WHERE table_name = 'claims' AND id IN ({placeholders})",
+                    in_chunk,
+                )
+            # IDs get reused, so a later import mustn't find these
+            cur.execute(f"DELETE FROM external_keys WHERE claim_id IN ({placeholders})", in_chunk)
+        db.log_changes(cur, "claims", deleted, "delete")
+        return rows
+
+    @classmethod
+    def _forget_deleted(cls, rows):
+        for row in rows:
+            cls._cache.pop(row["id"], None)
+        caches.invalidate(
+            *(("claim", row["id"]) for row in rows),
+            *(("claim", row["subject_id"]) for row in rows if row["subject_id"] is not None),
+        )
 
     def set_value(self, value):
         cur = db.conn.cursor()
@@ -703,10 +853,14 @@ class Claim(Model):
             )
             if self.is_entity:
                 update_index_for_doc(cur, "claims", self.id, value.encode())
+        db.log_change(cur, "claims", self.id, "update")
         db.conn.commit()
         self.populate()
+        if self.subject:
+            caches.invalidate(("claim", self.subject.id))
 
     def set_subject(self, subject):
+        old_subject = self.subject
         cur = db.conn.cursor()
         cur.execute(
             """
@@ -719,8 +873,14 @@ class Claim(Model):
                 self.id,
             ),
         )
+        db.log_change(cur, "claims", self.id, "update")
         db.conn.commit()
         self.populate()
+        # the claim moved from the data of one subject to that of another
+        forgotten = [("claim", subject.id)]
+        if old_subject:
+            forgotten.append(("claim", old_subject.id))
+        caches.invalidate(*forgotten)
 
     def set_verb(self, verb):
         cur = db.conn.cursor()
@@ -735,48 +895,81 @@ class Claim(Model):
                 self.id,
             ),
         )
+        db.log_change(cur, "claims", self.id, "update")
         db.conn.commit()
         self.populate()
+        if self.subject:
+            caches.invalidate(("claim", self.subject.id))
 
     @classmethod
     def new(cls, subject, verb, value_or_object):
-        cur = db.conn.cursor()
-        if verb.id in DATA_LABELS:
-            fn = subject.get_data.__wrapped__
-            if hasattr(fn, "_cached"):
-                delattr(fn, "_cached")
-            if verb.id == AVATAR:
-                cur.execute(
-                    """
-                        DELETE FROM claims
-                        WHERE subject_id = ? AND verb_id = ?
-                    """,
-                    (subject.id, verb.id),
-                )
-        if verb.data_type.name.endswith("directed_link"):
+        return cls.new_many([subject], verb, value_or_object)[0]
+
+    @classmethod
+    def new_many(cls, claims, verb, value_or_object, *, incoming=False):
+        """
+        Make the same claim about many claims at once, and return the new ones.
+
+        With incoming=True, value_or_object (which must be a claim then) is the
+        subject of all new claims, and the given claims are their objects.
+        Everything happens in one transaction.
+        """
+        if not claims:
+            return []
+        if incoming:
+            rows = [(value_or_object.id, verb.id, None, claim.id) for claim in claims]
+        elif verb.data_type.name.endswith("directed_link"):
             # "entity"
-            cur.execute(
-                """
-                    INSERT INTO claims
-                        (subject_id, verb_id, object_id, owner_id)
-                    VALUES
-                        (?, ?, ?, ?)
-                """,
-                (subject.id, verb.id, value_or_object.id, context.user.id),
-            )
+            rows = [(claim.id, verb.id, None, value_or_object.id) for claim in claims]
         else:
-            cur.execute(
-                """
-                INSERT INTO claims
-                    (subject_id, verb_id, value, owner_id)
-                VALUES
-                    (?, ?, ?, ?)
-                """,
-                (subject.id, verb.id, value_or_object.encode(), context.user.id),
-            )
-
+            value = value_or_object.encode()
+            rows = [(claim.id, verb.id, value, None) for claim in claims]
+        subject_ids = {subject_id for subject_id, *_ in rows}
+        cur = db.conn.cursor()
+        if verb.id == AVATAR:
+            # there can only be one
+            old_ids = []
+            in_order = list(subject_ids)
+            for chunk in range(0, len(in_order), 500):
+                in_chunk = in_order[chunk:chunk + 500]
+                old_ids.extend(
+                    row["id"]
+                    for row in cur.execute(
+                        f"""
+                        SELECT id FROM claims
+                        WHERE verb_id = ? AND subject_id IN ({",".join("?" * len(in_chunk))})
+                        """,
+                        (verb.id, *in_chunk),
+                    ).fetchall()
+                )
+            for chunk in range(0, len(old_ids), 500):
+                in_chunk = old_ids[chunk:chunk + 500]
+                placeholders = ",".join("?" * len(in_chunk))
+                cur.execute(f"DELETE FROM claims WHERE id IN ({placeholders})", in_chunk)
+                cur.execute(f"DELETE FROM external_keys WHERE claim_id IN ({placeholders})", in_chunk)
+            if old_ids:
+                db.log_changes(cur, "claims", old_ids, "delete")
+                for old_id in old_ids:
+                    cls._cache.pop(old_id, None)
+        insert = """
+            INSERT INTO claims
+                (id, subject_id, verb_id, value, object_id, owner_id)
+            VALUES
+                (?, ?, ?, ?, ?, ?)
+        """
+        # the first insert takes the write lock, so nobody else can take the
+        # IDs following it
+        cur.execute(insert, (None, *rows[0], context.user.id))
+        first_id = cur.lastrowid
+        new_ids = range(first_id, first_id + len(rows))
+        cur.executemany(
+            insert,
+            [(new_id, *row, context.user.id) for new_id, row in zip(new_ids[1:], rows[1:])],
+        )
+        db.log_changes(cur, "claims", new_ids, "insert")
         db.conn.commit()
-        return Claim(cur.lastrowid)
+        caches.invalidate(*(("claim", subject_id) for subject_id in subject_ids))
+        return [Claim(new_id) for new_id in new_ids]
 
     @classmethod
     def new_entity(cls, name):
@@ -787,10 +980,14 @@ class Claim(Model):
         )
         new_id = cur.lastrowid
         update_index_for_doc(cur, "claims", new_id, name)
+        db.log_change(cur, "claims", new_id, "insert")
         db.conn.commit()
         return Claim(new_id)
 
-    @timed_cache(CLAIM_DATA_CACHE_TIME, key=lambda self, *_, **__: self.id)
+    @claim_data_cache.cached(
+        key=lambda self, *_, **__: (self.id, _user_id()),
+        tags=lambda self, *_, **__: [("claim", self.id), ("user", _user_id())],
+    )
     def get_data(self, claims=None):
         data = {}
         if claims is None:
@@ -1043,7 +1240,36 @@ class Claim(Model):
     def __str__(self):
         return f"{self}"
 
-    def graph_elements(self, verbs=None):
+    @classmethod
+    def prefetch_graph(cls, claims):
+        """
+        Load claims, their data, their outgoing links and the links' data in a
+        few statements; return {claim_id: links}, for graph_elements().
+        """
+        ids = [claim.id for claim in claims]
+        cls.bulk_populate(ids, deep=True)
+        if (verb_ids := context.user.readable_verbs) is not None:
+            cond = f"AND c.verb_id IN ({','.join(str(verb_id) for verb_id in verb_ids)})"
+        else:
+            cond = ""
+        links = {}
+        for row in db.conn.execute(
+            f"""
+            SELECT c.id, c.subject_id
+            FROM claims c
+            JOIN verbs v ON c.verb_id = v.id
+            WHERE c.subject_id IN (SELECT value FROM json_each(?))
+            AND v.data_type LIKE '%directed_link'
+            {cond}
+            """,
+            (json.dumps(ids),),
+        ).fetchall():
+            links.setdefault(row["subject_id"], []).append(cls(row["id"]))
+        cls.bulk_populate([link.id for claim_links in links.values() for link in claim_links], deep=True)
+        return links
+
+    def graph_elements(self, verbs=None, links=None):
+        """Return this claim's node and edges; links can be prefetched, see prefetch_graph()."""
         data = self.get_data()
         node = {
             "label": f"{self:label}".replace('"', "'"),
@@ -1051,7 +1277,9 @@ class Claim(Model):
             "cat": data[IS_A][0].object.id if data.get(IS_A) else None,
         }
         edges = []
-        for link in self.outgoing_claims(page_size=999):
+        if links is None:
+            links = self.outgoing_claims(page_size=999)
+        for link in links:
             if not link.verb.data_type.name.endswith("directed_link"):
                 continue
             if verbs and link.verb not in verbs:
@@ -1074,35 +1302,87 @@ class Claim(Model):
         return node, edges
 
     def merge(self, other):
+        """
+        Merge other into this claim, and delete it.
+
+        Everything about, linking to or mentioning other is moved over, links
+        between the two of them are deleted (they would link this claim to
+        itself), and links that are now duplicates are collapsed, along with
+        everything about, linking to or mentioning them. It all happens in one
+        transaction.
+        """
+        if self.id == other.id:
+            return
         cur = db.conn.cursor()
+        try:
+            moved = Claim._move(cur, other.id, self.id)
+            moved_ids = {row["id"] for row in moved}
+            loops = [
+                row["id"]
+                for row in cur.execute(
+                    "SELECT id FROM claims WHERE subject_id = ? AND object_id = ?",
+                    (self.id, self.id),
+                ).fetchall()
+                if row["id"] in moved_ids
+            ]
+            deleted = Claim._delete(cur, loops) if loops else []
+            # links both of them had are there twice now; keep the oldest
+            duplicates = cur.execute(
+                """
+                SELECT id, keep FROM (
+                    SELECT
+                        id,
+                        min(id) OVER (PARTITION BY subject_id, verb_id, object_id) AS keep
+                    FROM claims
+                    WHERE object_id IS NOT NULL AND (subject_id = ? OR object_id = ?)
+                )
+                WHERE id <> keep
+                """,
+                (self.id, self.id),
+            ).fetchall()
+            for row in duplicates:
+                moved.extend(Claim._move(cur, row["id"], row["keep"]))
+            # nothing refers to them any more, so this only deletes them
+            cur.execute("UPDATE external_keys SET claim_id = ? WHERE claim_id = ?", (self.id, other.id))
+            deleted.extend(Claim._delete(cur, [other.id, *(row["id"] for row in duplicates)]))
+            db.conn.commit()
+        except BaseException:
+            db.conn.rollback()
+            raise
+        # the moved claims (and with them, the data of their old subjects)
+        # changed, and so did the data of self and of the collapsed links
+        forgotten = {
+            self.id,
+            *(row["id"] for row in moved),
+            *(row["subject_id"] for row in moved if row["subject_id"] is not None),
+            *(row["keep"] for row in duplicates),
+        }
+        for claim_id in forgotten:
+            Claim._cache.pop(claim_id, None)
+        caches.invalidate(*(("claim", claim_id) for claim_id in forgotten))
+        Claim._forget_deleted(deleted)
+
+    @staticmethod
+    def _move(cur, from_id, to_id):
+        """
+        Make everything about, linking to or mentioning one claim be about
+        (etc.) another one instead, without committing. Return the (id,
+        subject_id) rows of the changed claims, from before the change.
+        """
+        mention = f"[@{from_id}]"
+        mention_pattern = f"%{mention}%"
+        moved = cur.execute(
+            "SELECT id, subject_id FROM claims WHERE subject_id = ? OR object_id = ? OR value LIKE ?",
+            (from_id, from_id, mention_pattern),
+        ).fetchall()
+        db.log_changes(cur, "claims", sorted(row["id"] for row in moved), "update")
+        cur.execute("UPDATE claims SET subject_id = ? WHERE subject_id = ?", (to_id, from_id))
+        cur.execute("UPDATE claims SET object_id = ? WHERE object_id = ?", (to_id, from_id))
         cur.execute(
-            """
-            UPDATE claims
-            SET subject_id=?
-            WHERE subject_id = ?
-            """,
-            (self.id, other.id),
-        )
-        cur.execute(
-            """
-            UPDATE claims
-            SET object_id=?
-            WHERE object_id = ?
-            """,
-            (self.id, other.id),
-        )
-        for mention in other.incoming_mentions(page_size=999):
-            value = mention.object
-            value.value = re.sub(rf"<@{other.id}>", f"<@{self.id}>", value.value)
-            mention.set_value(value)
-        cur.execute(
-            """
-            DELETE claims
-            WHERE id = ?
-            """,
-            (other.id,),
+            "UPDATE claims SET value = replace(value, ?, ?) WHERE value LIKE ?",
+            (mention, f"[@{to_id}]", mention_pattern),
         )
-        db.conn.commit()
+        return moved
 
 
 class Query(Model):
@@ -1110,6 +1390,7 @@ class Query(Model):
     fields = (
         "label",
         "sql",
+        "cache_ttl",
     )
 
     def populate(self):
@@ -1117,7 +1398,7 @@ class Query(Model):
         row = cur.execute(
             """
                 SELECT
-                    id, label, sql
+                    id, label, sql, cache_ttl
                 FROM queries
                 WHERE id = ?
             """,
@@ -1127,6 +1408,12 @@ class Query(Model):
             raise ValueError("No Query with this ID found")
         self.label = row["label"]
         self.sql = row["sql"]
+        self.cache_ttl = row["cache_ttl"]
+
+    @classmethod
+    def forget(cls, id):
+        super().forget(id)
+        query_cache.forget(id)
 
     @classmethod
     def all(cls, *, order_by="id ASC", page_no=0, page_size=20):
@@ -1150,11 +1437,15 @@ class Query(Model):
             yield cls(row["id"])
 
     @classmethod
-    def new(cls, label, sql):
+    def new(cls, label, sql, cache_ttl=None):
         cur = db.conn.cursor()
-        cur.execute("INSERT INTO queries (label, sql) VALUES (?, ?)", (label, sql))
+        cur.execute(
+            "INSERT INTO queries (label, sql, cache_ttl) VALUES (?, ?, ?)",
+            (label, sql, cache_ttl),
+        )
         q_id = cur.lastrowid
         update_index_for_doc(cur, "queries", q_id, label)
+        db.log_change(cur, "queries", q_id, "insert")
         db.conn.commit()
         return cls(q_id)
 
@@ -1168,6 +1459,7 @@ class Query(Model):
             """,
             (label, self.id),
         )
+        db.log_change(cur, "queries", self.id, "update")
         db.conn.commit()
         self.label = label
 
@@ -1194,30 +1486,40 @@ class Query(Model):
                 hx-swap="outerHTML"
             ><strong>{self.label}</strong></a>"""
 
-    def run(self, page_no, page_size):
-        cur = db.conn.cursor()
-        cur.execute(
-            f"""
-            {self.sql}
-            LIMIT {page_size}
-            OFFSET {page_no * page_size}
-            """
-        )
-        return cur.fetchall()
+    async def run(self, page_no, page_size, request=None):
+        async def execute(limit, offset):
+            return await sandbox.run(
+                f"""
+                {self.sql}
+                LIMIT {limit}
+                OFFSET {offset}
+                """,
+                max_rows=limit,
+                request=request,
+            )
 
-    def update(self, sql, label):
+        return await query_cache.get_page(self, page_no, page_size, execute)
+
+    def stream(self, request=None, conn=None):
+        """Yield the complete result in batches of rows, bypassing the cache."""
+        return sandbox.stream(self.sql, request=request, conn=conn)
+
+    def update(self, sql, label, cache_ttl=None):
         cur = db.conn.cursor()
         cur.execute(
             """
             UPDATE queries
-            SET label=?, sql=?
+            SET label=?, sql=?, cache_ttl=?
             WHERE id=?
             """,
-            (label, sql, self.id),
+            (label, sql, cache_ttl, self.id),
         )
+        db.log_change(cur, "queries", self.id, "update")
         db.conn.commit()
+        query_cache.forget(self.id)
         self.sql = sql
         self.label = label
+        self.cache_ttl = cache_ttl
 
     def delete(self):
         cur = db.conn.cursor()
@@ -1226,9 +1528,11 @@ class Query(Model):
             "DELETE FROM permissions WHERE object = ? AND permission = 'view-query'",
             (self.id,),
         )
+        db.log_change(cur, "queries", self.id, "delete")
         db.conn.commit()
         # evict deleted query from cache:
         self._cache.pop(self.id)
+        query_cache.forget(self.id)
 
 
     def __str__(self):
@@ -1248,6 +1552,11 @@ class User(Model):
         "last_session_at",
     )
 
+    @classmethod
+    def forget(cls, id):
+        super().forget(id)
+        caches.invalidate(("user", id))
+
     def populate(self):
         cur = db.conn.cursor()
         row = cur.execute(
@@ -1327,6 +1636,7 @@ class User(Model):
                 "INSERT INTO permissions (user_id, permission, object) VALUES (?, ?, ?)",
                 (u_id, "view-query", viewable_query),
             )
+        db.log_change(cur, "users", u_id, "insert")
         db.conn.commit()
         return cls(u_id)
 
@@ -1370,8 +1680,10 @@ class User(Model):
                         "INSERT INTO permissions (user_id, permission, object) VALUES (?, ?, ?)",
                         (self.id, "view-query", viewable_query),
                     )
+        db.log_change(cur, "users", self.id, "update")
         db.conn.commit()
         self.populate()
+        caches.invalidate(("user", self.id))
 
     def __format__(self, fmt):
         if not fmt:
@@ -1411,6 +1723,7 @@ class User(Model):
             "UPDATE users SET generation = generation + 1 WHERE id = ?",
             (self.id,),
         )
+        db.log_change(cur, "users", self.id, "update")
         db.conn.commit()
         self.populate()
 
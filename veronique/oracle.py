@@ -0,0 +1,180 @@
+"""
+Landmark-based distance oracle for the link graph.
+
+A handful of landmarks (hubs, and at least one per larger connected component)
+store their BFS distance to every node. By the triangle inequality, for any
+landmark L, |d(L, a) - d(L, b)| <= d(a, b) <= d(L, a) + d(L, b), which gives
+instant distance estimates, and a lower bound that makes for a very good A*
+heuristic (this is known as ALT: A*, landmarks, triangle inequality).
+
+The oracle is rebuilt in the background whenever links change. Path search
+always uses the current graph; a stale oracle is simply not used as heuristic.
+"""
+
+import asyncio
+import heapq
+from array import array
+
+from veronique import analytics
+from veronique.constants import ORACLE_LANDMARKS, ORACLE_REFRESH_INTERVAL
+
+UNREACHABLE = 0xFFFF
+
+_oracle = None
+
+
+def bfs(graph, start):
+    """Return hop distances from start to every node (UNREACHABLE if none)."""
+    distances = array("H", [UNREACHABLE]) * len(graph)
+    distances[start] = 0
+    frontier = [start]
+    depth = 0
+    while frontier and depth < UNREACHABLE - 1:
+        depth += 1
+        next_frontier = []
+        for i in frontier:
+            for j in graph.neighbours(i):
+                if distances[j] == UNREACHABLE:
+                    distances[j] = depth
+                    next_frontier.append(j)
+        frontier = next_frontier
+    return distances
+
+
+class DistanceOracle:
+    def __init__(self, graph, landmark_count=ORACLE_LANDMARKS):
+        self.graph = graph
+        self.version = graph.version
+        self.landmarks = self._pick_landmarks(landmark_count)
+        self.distances = [bfs(graph, landmark) for landmark in self.landmarks]
+
+    def _pick_landmarks(self, count):
+        graph = self.graph
+        degree = analytics.degree_centrality(graph)
+        by_degree = sorted(range(len(graph)), key=lambda i: -degree[i])
+        # First the biggest hub of every component (biggest components first),
+        # so that we can tell that two claims aren't connected at all, then
+        # fill up with the remaining hubs.
+        components = {}
+        for i, component in enumerate(analytics.connected_components(graph)):
+            components.setdefault(component, []).append(i)
+        landmarks = []
+        for members in sorted(components.values(), key=len, reverse=True):
+            if len(landmarks) >= count // 2 or len(members) < 3:
+                break
+            landmarks.append(max(members, key=lambda i: degree[i]))
+        for i in by_degree:
+            if len(landmarks) >= count:
+                break
+            if i not in landmarks:
+                landmarks.append(i)
+        return landmarks
+
+    def lower_bound(self, a, b):
+        """Lower bound on the distance between node indices a and b."""
+        best = 0
+        for distances in self.distances:
+            d_a, d_b = distances[a], distances[b]
+            if (d_a == UNREACHABLE) != (d_b == UNREACHABLE):
+                return UNREACHABLE  # different components
+            if d_a != UNREACHABLE and abs(d_a - d_b) > best:
+                best = abs(d_a - d_b)
+        return best
+
+    def estimate(self, a_id, b_id):
+        """
+        Return (lower, upper) bounds on the distance between two claims.
+
+        Either bound is None if it's unknown; (None, None) means that the
+        claims are definitely not connected.
+        """
+        graph = self.graph
+        if a_id not in graph.index or b_id not in graph.index:
+            return None, None
+        a, b = graph.index[a_id], graph.index[b_id]
+        if a == b:
+            return 0, 0
+        lower = self.lower_bound(a, b)
+        if lower == UNREACHABLE:
+            return None, None
+        upper = min(
+            (
+                distances[a] + distances[b]
+                for distances in self.distances
+                if distances[a] != UNREACHABLE
+            ),
+            default=None,
+        )
+        return lower, upper
+
+
+def find_path(a_id, b_id, *, verbs=None):
+    """
+    Find a shortest path between two claims, as a list of claim IDs.
+
+    Only links whose verb is in verbs are followed (if verbs is given).
+    Returns None if there is no such path.
+    """
+    graph = analytics.load_graph()
+    if _oracle is not None and _oracle.version == graph.version:
+        return shortest_path(graph, a_id, b_id, verbs=verbs, oracle=_oracle)
+    return shortest_path(graph, a_id, b_id, verbs=verbs)
+
+
+def shortest_path(graph, a_id, b_id, *, verbs=None, oracle=None):
+    """A* search on graph, using the oracle's lower bounds as heuristic."""
+    if a_id not in graph.index or b_id not in graph.index:
+        return None
+    if oracle is not None:
+        heuristic = oracle.lower_bound
+    else:
+        def heuristic(_a, _b):
+            return 0
+    start, target = graph.index[a_id], graph.index[b_id]
+    if heuristic(start, target) == UNREACHABLE:
+        return None
+    indptr, indices, link_verbs = graph.indptr, graph.indices, graph.verbs
+    parents = {start: None}
+    best = {start: 0}
+    heap = [(heuristic(start, target), 0, start)]
+    while heap:
+        _, dist, node = heapq.heappop(heap)
+        if node == target:
+            path = []
+            while node is not None:
+                path.append(graph.ids[node])
+                node = parents[node]
+            return path[::-1]
+        if dist > best[node]:
+            continue
+        for k in range(indptr[node], indptr[node + 1]):
+            if verbs is not None and link_verbs[k] not in verbs:
+                continue
+            neighbour = indices[k]
+            if dist + 1 < best.get(neighbour, UNREACHABLE):
+                best[neighbour] = dist + 1
+                parents[neighbour] = node
+                heapq.heappush(
+                    heap,
+                    (dist + 1 + heuristic(neighbour, target), dist + 1, neighbour),
+                )
+    return None
+
+
+def get():
+    """Return the current oracle, if it's up to date."""
+    if _oracle is not None and _oracle.version == analytics.graph_version():
+        return _oracle
+    return None
+
+
+async def keep_fresh():
+    """Rebuild the oracle whenever the graph changes. Runs forever."""
+    global _oracle
+    while True:
+        graph = analytics.load_graph()
+        if _oracle is None or _oracle.version != graph.version:
+            # The BFS runs happen in a thread so requests can still be served
+            # in the meantime.
+            _oracle = await asyncio.to_thread(DistanceOracle, graph)
+        await asyncio.sleep(ORACLE_REFRESH_INTERVAL.total_seconds())
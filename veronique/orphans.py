@@ -0,0 +1,129 @@
+"""
+Garbage collection of orphaned rows.
+
+Deleting a claim deletes everything about it (see Claim.delete_many), but
+databases from before that was the case, or ones that were changed by hand,
+can still have orphans: claims about or linking to claims that no longer
+exist, and rows of the search index or external keys of things that are gone.
+Claims using a deleted verb aren't orphans; deleting a verb keeps them.
+
+collect() goes through the tables a chunk at a time, each chunk in its own
+short transaction, so it can run while Véronique is in use; the app does so
+in the background every GC_INTERVAL. It can also be run by hand:
+
+    python -m veronique.orphans
+"""
+
+import asyncio
+import sqlite3
+from collections import deque
+from datetime import datetime
+from time import perf_counter
+
+from veronique import db
+from veronique.constants import GC_CHUNK_SIZE, GC_INTERVAL, GC_KEEP, GC_PAUSE
+
+reports = deque(maxlen=GC_KEEP)  # newest last
+_lock = asyncio.Lock()
+
+ORPHANED_CLAIMS = """
+    SELECT c.id
+    FROM claims c
+    LEFT JOIN claims s ON s.id = c.subject_id
+    LEFT JOIN claims o ON o.id = c.object_id
+    WHERE c.id BETWEEN ? AND ?
+    AND (
+        (c.subject_id IS NOT NULL AND s.id IS NULL)
+        OR (c.object_id IS NOT NULL AND o.id IS NULL)
+    )
+"""
+STALE_INDEX_ROWS = """
+    DELETE FROM {table}
+    WHERE rowid BETWEEN ? AND ?
+    AND NOT CASE table_name
+        WHEN 'claims' THEN EXISTS (
+            SELECT 1 FROM claims c WHERE c.id = {table}.id AND c.verb_id = {root}
+        )
+        WHEN 'verbs' THEN EXISTS (SELECT 1 FROM verbs v WHERE v.id = {table}.id)
+        WHEN 'queries' THEN EXISTS (SELECT 1 FROM queries q WHERE q.id = {table}.id)
+        ELSE 0
+    END
+"""
+
+
+def collect(*, chunk_size=None):
+    """
+    Remove orphans, one chunk after the other; yields after every chunk.
+
+    The report of what was removed is in reports[-1] once it's done.
+    """
+    import veronique.objects as O
+
+    chunk_size = chunk_size or GC_CHUNK_SIZE
+    start = perf_counter()
+    report = {
+        "started_at": datetime.now().isoformat(sep=" ", timespec="seconds"),
+        "claims": 0,
+        "index_rows": 0,
+        "external_keys": 0,
+    }
+    cur = db.conn.cursor()
+    for first, last, _ in db.id_ranges(cur, "claims", size=chunk_size):
+        orphans = [row["id"] for row in cur.execute(ORPHANED_CLAIMS, (first, last)).fetchall()]
+        report["claims"] += len(O.Claim.delete_many(orphans))
+        yield
+    for table in ("inverted_index", "forward_index"):
+        sql = STALE_INDEX_ROWS.format(table=table, root=db.ROOT)
+        for first, last, _ in db.id_ranges(cur, table, size=chunk_size, column="rowid"):
+            report["index_rows"] += cur.execute(sql, (first, last)).rowcount
+            db.conn.commit()
+            yield
+    report["external_keys"] = cur.execute(
+        "DELETE FROM external_keys WHERE claim_id NOT IN (SELECT id FROM claims)",
+    ).rowcount
+    db.conn.commit()
+    report["seconds"] = perf_counter() - start
+    reports.append(report)
+
+
+def running():
+    return _lock.locked()
+
+
+async def collect_in_background():
+    """
+    Collect orphans, pausing between chunks so requests can be handled in the
+    meantime. Does nothing if a collection is already running.
+    """
+    if running():
+        return
+    async with _lock:
+        try:
+            for _ in collect():
+                await asyncio.sleep(GC_PAUSE.total_seconds())
+        except sqlite3.OperationalError:
+            # e.g. the database was locked for too long; next time, then
+            db.conn.rollback()
+
+
+async def keep_clean():
+    """Collect orphans every GC_INTERVAL. Runs forever."""
+    if db.conn.execute("PRAGMA query_only").fetchone()[0]:
+        return
+    while True:
+        await asyncio.sleep(GC_INTERVAL.total_seconds())
+        await collect_in_background()
+
+
+def cli():
+    for _ in collect():
+        pass
+    report = reports[-1]
+    print(
+        f"Removed {report['claims']:,} orphaned claims, {report['index_rows']:,} stale index rows"
+        f" and {report['external_keys']:,} stale external keys in {report['seconds']:.1f}s."
+    )
+
+
+if __name__ == "__main__":
+    cli()
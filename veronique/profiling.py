@@ -0,0 +1,124 @@
+"""
+Profiles single requests, for finding out why a page is slow.
+
+Admins can have any of their requests profiled by adding ?profile=1 to it, or
+by sending an X-Profile header. In addition, a share of all requests to one
+endpoint can be profiled (see the profiling settings); at most one of those
+per PROFILING_MIN_INTERVAL, which bounds the overhead.
+
+The profiler (cProfile) is started once the request is authenticated and
+stopped when the response is ready, so it covers the handler including the
+rendering of the page. Since it profiles the whole worker in the meantime,
+requests that are handled concurrently show up too, which is also why only
+one request is profiled at a time. The last PROFILING_KEEP profiles are kept
+in the memory of the worker process.
+"""
+
+import cProfile
+import io
+import itertools
+import marshal
+import pstats
+import random
+from collections import deque
+from datetime import datetime
+from time import monotonic, perf_counter
+
+from veronique.constants import (
+    PROFILING_KEEP,
+    PROFILING_MAX_DURATION,
+    PROFILING_MIN_INTERVAL,
+)
+from veronique.context import context
+
+profiles = deque(maxlen=PROFILING_KEEP)
+_ids = itertools.count(1)
+_current = None
+_last_sample = float("-inf")
+
+
+class Profile:
+    def __init__(self, endpoint, path, sampled):
+        self.id = next(_ids)
+        self.created_at = datetime.now()
+        self.endpoint = endpoint
+        self.path = path
+        self.sampled = sampled
+        self.seconds = None
+        self.profiler = cProfile.Profile()
+        self._start = perf_counter()
+
+    def stats(self, stream=None):
+        return pstats.Stats(self.profiler, stream=stream)
+
+    def dump(self):
+        """Return the profile in the format of pstats.Stats.dump_stats()."""
+        return marshal.dumps(self.stats().stats)
+
+    def report(self, sort="cumulative", limit=None):
+        out = io.StringIO()
+        self.stats(out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+def _wanted(request, endpoint, sample_endpoint, sample_rate):
+    """Return whether to profile a request, and whether it's a sample."""
+    global _last_sample
+    user = context.user
+    if (
+        user is not None
+        and user.is_admin
+        and (request.args.get("profile") or request.headers.get("X-Profile"))
+    ):
+        return True, False
+    if (
+        sample_rate
+        and endpoint == sample_endpoint
+        and monotonic() - _last_sample > PROFILING_MIN_INTERVAL.total_seconds()
+        and random.random() * 100 < sample_rate
+    ):
+        _last_sample = monotonic()
+        return True, True
+    return False, False
+
+
+def start(request, endpoint, sample_endpoint="", sample_rate=0):
+    """
+    Start profiling the current request, if it's wanted.
+
+    sample_rate is the percentage of requests to sample_endpoint to profile.
+    """
+    global _current
+    context.profile = None
+    if _current is not None:
+        if perf_counter() - _current._start < PROFILING_MAX_DURATION.total_seconds():
+            return
+        # its request never finished, e.g. because the client went away
+        _current.profiler.disable()
+        _current = None
+    wanted, sampled = _wanted(request, endpoint, sample_endpoint, sample_rate)
+    if not wanted:
+        return
+    _current = Profile(endpoint, request.path, sampled)
+    context.profile = _current
+    _current.profiler.enable()
+
+
+def finish():
+    """Stop profiling the current request; return its profile, if there is one."""
+    global _current
+    if (profile := context.profile) is None or profile is not _current:
+        return None
+    profile.profiler.disable()
+    profile.seconds = perf_counter() - profile._start
+    context.profile = None
+    _current = None
+    profiles.append(profile)
+    return profile
+
+
+def get(profile_id):
+    for profile in profiles:
+        if profile.id == profile_id:
+            return profile
+    return None
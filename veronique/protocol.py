@@ -0,0 +1,108 @@
+"""
+Wire format of /queries/remote (see also remote.py for the client).
+
+A request is a JSON object, optionally gzip-compressed (with a
+"Content-Encoding: gzip" header). The original form {"q": sql, "p": params}
+runs one statement and gets a JSON list of rows back. The batched form
+
+    {"batch": [{"q": sql, "p": params}, {"q": sql, "many": [params, ...]}]}
+
+runs several statements, or one statement once per set of parameters, in a
+single round trip. Its response is streamed as newline-delimited JSON
+messages, gzip-compressed if the client accepts that:
+
+    {"i": 0, "columns": [...], "rows": [[...], ...]}  (any number per result)
+    {"i": 1, "error": "..."}                          (ends the response)
+    {"done": true, "revision": 123}
+
+Results are numbered in order, with a "many" statement producing one result
+per set of parameters. Empty results don't produce any messages. The revision
+(see db.revision) lets clients know whether their cached data is still valid.
+
+Writes go to /queries/remote/write instead, with the same (batched) request
+format. They're executed in one transaction on the main connection, and the
+response is a JSON object {"results": [{"lastrowid": ..., "rowcount": ...}],
+"revision": ...}. /queries/remote/revision returns just the revision, and
+/queries/remote/snapshot returns a (gzipped) copy of the whole database.
+"""
+
+import gzip
+import json
+import sqlite3
+import zlib
+
+from veronique import db, sandbox
+
+
+def decode(body, content_encoding=None):
+    if content_encoding == "gzip":
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def encode(payload, *, compress=False):
+    """Return (body, headers) for a request with this payload."""
+    body = json.dumps(payload).encode()
+    if not compress:
+        return body, {"Content-Type": "application/json"}
+    return gzip.compress(body), {
+        "Content-Type": "application/json",
+        "Content-Encoding": "gzip",
+    }
+
+
+def statements(payload):
+    for statement in payload["batch"]:
+        if "many" in statement:
+            for params in statement["many"]:
+                yield statement["q"], params
+        else:
+            yield statement["q"], statement.get("p", {})
+
+
+def _json_default(value):
+    if isinstance(value, bytes):
+        return value.hex()
+    return str(value)
+
+
+async def run_batch(payload, request=None):
+    """Yield the response messages for a batched request."""
+    for i, (sql, params) in enumerate(statements(payload)):
+        try:
+            async for rows in sandbox.stream(sql, params, request=request):
+                if not rows:
+                    continue
+                yield {
+                    "i": i,
+                    "columns": rows.columns,
+                    "rows": [tuple(row) for row in rows],
+                }
+        except (sqlite3.Warning, sqlite3.OperationalError, sqlite3.ProgrammingError) as e:
+            yield {"i": i, "error": e.args[0]}
+            return
+    yield {"done": True, "revision": db.revision()}
+
+
+class Encoder:
+    """Turns response messages (or raw data) into possibly gzipped chunks."""
+
+    def __init__(self, compress):
+        # wbits=31 makes zlib write a gzip header and trailer
+        self.compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(self, message):
+        return self.compress(
+            (json.dumps(message, default=_json_default) + "\n").encode()
+        )
+
+    def compress(self, data):
+        if self.compressor is None:
+            return data
+        # flush after every chunk, so the client can start working on it.
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.compressor is None:
+            return b""
+        return self.compressor.flush()
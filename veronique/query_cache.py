@@ -0,0 +1,94 @@
+"""
+Result cache for saved queries.
+
+A query is executed once (up to QUERY_CACHE_MAX_RESULT_ROWS rows), and every
+page is then served from that result. Entries are keyed on the query ID and
+the hash of its SQL, and are only valid for the data they were computed on:
+any change to it (see db.revision()) invalidates them. Housekeeping writes,
+like logging slow queries or sessions, don't. Queries with a cache_ttl
+instead keep their result for that long, no matter what changes in the
+meantime (useful for expensive analytical queries).
+
+Memory is bounded by the total number of cached rows, evicting the least
+recently used results first.
+"""
+
+from collections import OrderedDict
+from hashlib import sha256
+from time import monotonic
+
+from veronique import db
+from veronique.constants import QUERY_CACHE_MAX_RESULT_ROWS, QUERY_CACHE_MAX_ROWS
+
+_cache = OrderedDict()
+_total_rows = 0
+
+
+class Entry:
+    def __init__(self, rows, version):
+        self.rows = rows
+        self.version = version
+        self.created_at = monotonic()
+        # if there were more rows than we're willing to cache, only pages
+        # within the cached rows can be served from here.
+        self.complete = len(rows) <= QUERY_CACHE_MAX_RESULT_ROWS
+        if not self.complete:
+            self.rows = rows[:QUERY_CACHE_MAX_RESULT_ROWS]
+
+    def is_valid(self, version, ttl):
+        if ttl:
+            return monotonic() - self.created_at < ttl
+        return self.version == version
+
+    @property
+    def age(self):
+        return monotonic() - self.created_at
+
+
+def _key(query):
+    return query.id, sha256(query.sql.encode()).hexdigest()
+
+
+def _store(key, entry):
+    global _total_rows
+    forget(key[0])
+    _cache[key] = entry
+    _total_rows += len(entry.rows)
+    while _total_rows > QUERY_CACHE_MAX_ROWS and len(_cache) > 1:
+        _, evicted = _cache.popitem(last=False)
+        _total_rows -= len(evicted.rows)
+
+
+def lookup(query):
+    """Return the valid cache entry for this query, if there is one."""
+    key = _key(query)
+    entry = _cache.get(key)
+    if entry is None or not entry.is_valid(db.revision(), query.cache_ttl):
+        return None
+    _cache.move_to_end(key)
+    return entry
+
+
+async def get_page(query, page_no, page_size, execute):
+    """
+    Return one page of the query's result.
+
+    await execute(limit, offset) runs the query and returns the rows; it's
+    called at most once.
+    """
+    start, end = page_no * page_size, (page_no + 1) * page_size
+    entry = lookup(query)
+    if entry is None:
+        version = db.revision()
+        entry = Entry(await execute(QUERY_CACHE_MAX_RESULT_ROWS + 1, 0), version)
+        _store(_key(query), entry)
+    if entry.complete or end <= len(entry.rows):
+        return entry.rows[start:end]
+    return await execute(page_size, start)
+
+
+def forget(query_id):
+    """Drop all cached results for this query."""
+    global _total_rows
+    for key in [key for key in _cache if key[0] == query_id]:
+        _total_rows -= len(_cache.pop(key).rows)
@@ -1,28 +1,317 @@
+"""
+Run the models against a remote instance instead of a local database file.
+
+    with remote.connect(host, token) as conn:
+        ...
+
+Reads and writes are sent to the server as they happen (see protocol.py).
+With cache=True, results of reads are kept locally until the server's
+revision changes, which is checked at most every REMOTE_REVALIDATE_INTERVAL.
+With snapshot=<path>, a copy of the whole database is downloaded to that path
+(or reused, if it's still current) and all reads are served from it; writes
+are forwarded to the server and applied to the copy as well. If the server
+can't be reached, an existing snapshot is used as is (read-only, naturally).
+"""
+
+import json
+import os
+import re
+import sqlite3
 from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic
 
 import requests
 
 import veronique.objects as O
-from veronique import db
+from veronique import coherence, db, protocol
+from veronique.constants import (
+    REMOTE_CHUNK_SIZE,
+    REMOTE_COMPRESS_MIN_SIZE,
+    REMOTE_REVALIDATE_INTERVAL,
+)
 from veronique.context import context
 
+WRITE_STATEMENT = re.compile(
+    r"\s*((INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER|VACUUM|REINDEX|ANALYZE)\b|PRAGMA\b[^;]*=)",
+    re.IGNORECASE,
+)
+# one common table expression, up to its opening parenthesis:
+# [WITH [RECURSIVE]] name [(columns)] AS [[NOT] MATERIALIZED] (
+CTE = re.compile(
+    r"\s*(WITH\s+(RECURSIVE\s+)?|,)[^(]*?(\([^)]*\)\s*)?AS\s+(NOT\s+)?(MATERIALIZED\s+)?\(",
+    re.IGNORECASE,
+)
+QUOTES = {"'": "'", '"': '"', "`": "`", "[": "]"}
+
+
+def is_write(sql):
+    """Whether sql changes anything, also behind a WITH clause."""
+    pos = 0
+    while (match := CTE.match(sql, pos)) is not None:
+        pos = _closing_parenthesis(sql, match.end())
+    return WRITE_STATEMENT.match(sql, pos) is not None
+
+
+def _closing_parenthesis(sql, pos):
+    """Return the position after the parenthesis closing the one before pos."""
+    depth = 1
+    while pos < len(sql) and depth:
+        char = sql[pos]
+        if char in QUOTES:
+            pos = sql.find(QUOTES[char], pos + 1)
+            if pos == -1:
+                return len(sql)
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        pos += 1
+    return pos
+
 
 class RemoteConnection:
-    def __init__(self, host, token):
+    def __init__(self, host, token, *, cache=False):
         self.host = host
         self.token = token
+        # a session keeps connections alive between requests
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Digest {self.token}"
+        self.cache = {} if cache else None
+        self.revision = None
+        self.checked_at = None
+        self.lastrowid = None
+        self.rowcount = -1
 
     def cursor(self):
         return self
 
     def execute(self, query, params=None):
-        r = requests.post(
-            f"{self.host}/queries/remote",
-            json={"q": query, "p": params or {}},
-            headers={"Authorization": f"Digest {self.token}"},
+        if is_write(query):
+            self._write([{"q": query, "p": params or {}}])
+            return Fetchable([])
+        if self.cache is None:
+            (result,) = self.execute_batch([(query, params)])
+            return result
+        self.revalidate()
+        key = query, json.dumps(params, sort_keys=True)
+        if key not in self.cache:
+            (self.cache[key],) = self.execute_batch([(query, params)])
+        return self.cache[key]
+
+    def executemany(self, query, param_sets):
+        if not is_write(query):
+            raise sqlite3.ProgrammingError("executemany() can only execute DML statements.")
+        self._write([{"q": query, "many": list(param_sets)}])
+
+    def execute_many(self, query, param_sets):
+        """Run one query once per set of parameters; return one result each."""
+        param_sets = list(param_sets)
+        if not param_sets:
+            return []
+        return self._request(
+            [{"q": query, "many": param_sets}],
+            len(param_sets),
         )
+
+    def execute_batch(self, statements):
+        """Run several (query, params) pairs in one round trip."""
+        statements = [{"q": query, "p": params or {}} for query, params in statements]
+        return self._request(statements, len(statements))
+
+    def commit(self):
+        # writes are committed on the server as soon as they are sent.
+        pass
+
+    def rollback(self):
+        pass
+
+    def _post(self, path, payload, **kwargs):
+        body, headers = protocol.encode(
+            payload,
+            compress=len(json.dumps(payload)) >= REMOTE_COMPRESS_MIN_SIZE,
+        )
+        r = self.session.post(
+            f"{self.host}/queries/{path}",
+            data=body,
+            headers=headers,
+            **kwargs,
+        )
+        if r.status_code == 400:
+            raise sqlite3.OperationalError(r.text)
         r.raise_for_status()
-        return Fetchable(r.json())
+        return r
+
+    def _request(self, batch, n_results):
+        r = self._post("remote", {"batch": batch}, stream=True)
+        results = [[] for _ in range(n_results)]
+        done = False
+        for line in r.iter_lines(chunk_size=REMOTE_CHUNK_SIZE):
+            if not line:
+                continue
+            message = json.loads(line)
+            if "error" in message:
+                raise sqlite3.OperationalError(message["error"])
+            if message.get("done"):
+                done = True
+                self._observe(message["revision"])
+                break
+            columns = message["columns"]
+            results[message["i"]].extend(
+                Row(zip(columns, row)) for row in message["rows"]
+            )
+        if not done:
+            raise ConnectionError("Incomplete response from remote")
+        return [Fetchable(rows) for rows in results]
+
+    def _write(self, batch):
+        response = self._post("remote/write", {"batch": batch}).json()
+        last = response["results"][-1] if response["results"] else {}
+        self.lastrowid = last.get("lastrowid")
+        self.rowcount = sum(result["rowcount"] for result in response["results"])
+        # our own write; cached results are outdated, but there's no need to
+        # forget the models (they update themselves).
+        if self.cache is not None:
+            self.cache.clear()
+        self.revision = response["revision"]
+
+    def _observe(self, revision):
+        self.checked_at = monotonic()
+        changed = self.revision is not None and revision != self.revision
+        if changed and self.cache is not None:
+            self.cache.clear()
+            coherence.forget_all()
+        self.revision = revision
+
+    def fetch_revision(self):
+        r = self.session.get(f"{self.host}/queries/remote/revision")
+        r.raise_for_status()
+        return r.json()["revision"]
+
+    def revalidate(self):
+        """Make sure cached data isn't older than REMOTE_REVALIDATE_INTERVAL."""
+        if (
+            self.checked_at is None
+            or monotonic() - self.checked_at > REMOTE_REVALIDATE_INTERVAL.total_seconds()
+        ):
+            self._observe(self.fetch_revision())
+
+    def changes(self, since=0):
+        """
+        Yield the entries of the change log after sequence number since.
+
+        Every entry is a dict with seq, created_at, table_name, key (the row
+        ID, or the key of a setting), operation (insert, update or delete) and
+        user_id. Remember the last seq to continue from there next time.
+        """
+        while True:
+            r = self.session.get(f"{self.host}/changes", params={"since": since})
+            r.raise_for_status()
+            page = r.json()
+            yield from page["changes"]
+            since = page["next"]
+            if not page["more"]:
+                return
+
+    def download_snapshot(self, path):
+        """Save a copy of the remote database to path; return its revision."""
+        r = self.session.get(f"{self.host}/queries/remote/snapshot", stream=True)
+        r.raise_for_status()
+        with open(path, "wb") as f:
+            f.writelines(r.iter_content(REMOTE_CHUNK_SIZE))
+        return int(r.headers["X-Revision"])
+
+    def close(self):
+        self.session.close()
+
+
+class SnapshotConnection:
+    """Serves reads from a local copy of the remote database."""
+
+    def __init__(self, remote, path):
+        self.remote = remote
+        self.path = Path(path)
+        self.local = None
+        self.checked_at = None
+        self.lastrowid = None
+        self.rowcount = -1
+        if self.path.exists():
+            self._open()
+        self.refresh()
+
+    def _open(self):
+        self.local = sqlite3.connect(self.path)
+        self.local.row_factory = sqlite3.Row
+
+    @property
+    def revision(self):
+        return self.local.execute("SELECT revision FROM state").fetchone()[0]
+
+    def refresh(self):
+        """Download a new snapshot if the remote database changed."""
+        try:
+            revision = self.remote.fetch_revision()
+        except requests.ConnectionError:
+            if self.local is None:
+                raise
+            # offline; keep using what we have
+            return
+        self.checked_at = monotonic()
+        if self.local is not None and revision == self.revision:
+            return
+        tmp_path = self.path.with_name(f"{self.path.name}.download")
+        self.remote.download_snapshot(tmp_path)
+        if self.local is not None:
+            self.local.close()
+            coherence.forget_all()
+        os.replace(tmp_path, self.path)
+        self._open()
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params=None):
+        if is_write(query):
+            self.remote.execute(query, params)
+            self.lastrowid = self.remote.lastrowid
+            self.rowcount = self.remote.rowcount
+            try:
+                self.local.execute(query, params or ())
+            except sqlite3.Error:
+                # our copy has diverged; get a new one on the next read.
+                self.checked_at = None
+            return Fetchable([])
+        if (
+            self.checked_at is None
+            or monotonic() - self.checked_at > REMOTE_REVALIDATE_INTERVAL.total_seconds()
+        ):
+            self.refresh()
+        return self.local.execute(query, params or ())
+
+    def executemany(self, query, param_sets):
+        param_sets = list(param_sets)
+        self.remote.executemany(query, param_sets)
+        self.local.executemany(query, param_sets)
+
+    def commit(self):
+        self.local.commit()
+
+    def rollback(self):
+        # this can't undo anything on the server, but a diverged copy gets
+        # replaced on the next read.
+        self.local.rollback()
+
+    def close(self):
+        self.local.close()
+
+
+class Row(dict):
+    """A result row that, like sqlite3.Row, can be indexed by position too."""
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.values())[key]
+        return super().__getitem__(key)
 
 
 class Fetchable:
@@ -40,8 +329,9 @@ class Fetchable:
 
 
 @contextmanager
-def connect(host, token):
-    conn = RemoteConnection(host, token)
+def connect(host, token, *, cache=False, snapshot=None):
+    remote = RemoteConnection(host, token, cache=cache)
+    conn = remote if snapshot is None else SnapshotConnection(remote, snapshot)
     orig_conn = db.conn
     try:
         db.conn = conn
@@ -50,3 +340,6 @@ def connect(host, token):
     finally:
         db.conn = orig_conn
         del context.user
+        if conn is not remote:
+            conn.close()
+        remote.close()
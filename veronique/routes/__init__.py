@@ -1,7 +1,12 @@
 from .autocomplete import autocomplete as autocomplete
+from .backups import backups as backups
+from .changes import changes as changes
 from .claims import claims as claims
+from .exports import exports as exports
 from .index import index as index
+from .metrics import metrics as metrics
 from .network import network as network
+from .profiles import profiles as profiles
 from .queries import queries as queries
 from .search import search as search
 from .settings import settings as settings
@@ -0,0 +1,75 @@
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from sanic import Blueprint, redirect
+from sanic.response import file_stream
+
+from veronique import backup, protocol
+from veronique.constants import REMOTE_CHUNK_SIZE
+from veronique.utils import admin_only, page
+
+backups = Blueprint("backups", url_prefix="/backups")
+
+
+@backups.get("/")
+@admin_only
+@page
+async def list_backups(request):
+    parts = [
+        "<article><header><h3>Backups</h3></header>",
+        '<form method="POST"><fieldset role="group">',
+        '<a href="/backups/snapshot" role="button" class="secondary">Download current state</a>',
+        '<input type="submit" value="Back up now">',
+        "</fieldset></form>",
+        "<table>",
+        '<thead><tr><th scope="col">Backup</th><th scope="col">Size</th></tr></thead>',
+        "<tbody>",
+    ]
+    for path in backup.backups():
+        size = path.stat().st_size
+        parts.append(
+            f'<tr><td><a href="/backups/{path.name}">{path.name}</a></td>'
+            f"<td>{size / 1024:,.0f} KiB</td></tr>"
+        )
+    parts.append("</tbody></table></article>")
+    return "Backups", "".join(parts)
+
+
+@backups.post("/")
+@admin_only
+async def create_backup(request):
+    await backup.create()
+    return redirect("/backups")
+
+
+@backups.get("/snapshot")
+@admin_only
+async def download_snapshot(request):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "snapshot.db"
+        await backup.snapshot(path)
+        encoder = protocol.Encoder(compress=True)
+        response = await request.respond(
+            content_type="application/gzip",
+            headers={
+                "Content-Disposition": (
+                    f'attachment; filename="veronique-{datetime.now():%Y%m%d-%H%M%S}.db.gz"'
+                ),
+            },
+        )
+        # a local temporary file; reading it doesn't block for long
+        with open(path, "rb") as f:  # noqa: ASYNC230
+            while chunk := f.read(REMOTE_CHUNK_SIZE):
+                await response.send(encoder.compress(chunk))
+        await response.send(encoder.finish())
+        await response.eof()
+
+
+@backups.get("/<name>")
+@admin_only
+async def download_backup(request, name):
+    for path in backup.backups():
+        if path.name == name:
+            return await file_stream(path, mime_type="application/gzip", filename=name)
+    return redirect("/backups?err=No such backup.")
@@ -0,0 +1,31 @@
+from sanic import Blueprint, json
+
+from veronique import db
+from veronique.constants import CHANGES_PAGE_SIZE
+from veronique.utils import admin_only
+
+changes = Blueprint("changes", url_prefix="/changes")
+
+
+@changes.get("/")
+@admin_only
+async def list_changes(request):
+    since = int(request.args.get("since", 0))
+    limit = min(int(request.args.get("limit", CHANGES_PAGE_SIZE)), CHANGES_PAGE_SIZE)
+    rows = db.conn.execute(
+        """
+        SELECT seq, created_at, table_name, key, operation, user_id
+        FROM changes
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+        """,
+        (since, limit + 1),
+    ).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return json({
+        "changes": [dict(row) for row in rows],
+        "next": rows[-1]["seq"] if rows else since,
+        "more": more,
+    })
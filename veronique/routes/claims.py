@@ -154,44 +154,44 @@ async def new_claim_form_verb_input(request):
 
 @claims.post("/new/<claim_ids>/<direction:incoming|outgoing>")
 async def new_claims(request, claim_ids: list[int], direction: str):
-    for claim_id in claim_ids.split(","):
-        claim = O.Claim(int(claim_id))
-        form = D(request.form)
-        if not (
-            context.user.can("read", "verb", claim.verb.id)
-            and context.user.can("write", "verb", int(form["verb"]))
-        ):
+    claims = [O.Claim(int(claim_id)) for claim_id in claim_ids.split(",")]
+    O.Claim.bulk_populate([claim.id for claim in claims])
+    form = D(request.form)
+    if not (
+        context.user.can("write", "verb", int(form["verb"]))
+        and all(
+            context.user.can("read", "verb", verb_id)
+            for verb_id in {claim.verb.id for claim in claims}
+        )
+    ):
+        return HTTPResponse(
+            body="403 Forbidden",
+            status=403,
+        )
+    if "value" in request.files:
+        f = request.files["value"][0]
+        form["value"] = f"data:{f.type};base64,{base64.b64encode(f.body).decode()}"
+    verb = O.Verb(int(form["verb"]))
+    value = form.get("value")
+    if verb.data_type.name.endswith("directed_link"):
+        value = O.Claim(int(value))
+        if not context.user.can("read", "verb", value.verb.id):
             return HTTPResponse(
                 body="403 Forbidden",
                 status=403,
             )
-        if "value" in request.files:
-            f = request.files["value"][0]
-            form["value"] = f"data:{f.type};base64,{base64.b64encode(f.body).decode()}"
-        verb = O.Verb(int(form["verb"]))
-        value = form.get("value")
-        if verb.data_type.name.endswith("directed_link"):
-            value = O.Claim(int(value))
-            if not context.user.can("read", "verb", value.verb.id):
-                return HTTPResponse(
-                    body="403 Forbidden",
-                    status=403,
-                )
-        elif verb.data_type.name == "inferred":
-            return HTTPResponse(
-                body="400 Bad Request",
-                status=400,
-            )
-        else:
-            try:
-                value = O.Plain.from_form(verb, form)
-            except ValueError:
-                return redirect(f"/claims/{claim_id}")
-        if direction == "incoming":
-            O.Claim.new(value, verb, claim)
-        else:
-            O.Claim.new(claim, verb, value)
-    return redirect(f"/claims/{claim_id}")
+    elif verb.data_type.name == "inferred" or direction == "incoming":
+        return HTTPResponse(
+            body="400 Bad Request",
+            status=400,
+        )
+    else:
+        try:
+            value = O.Plain.from_form(verb, form)
+        except ValueError:
+            return redirect(f"/claims/{claims[0].id}")
+    O.Claim.new_many(claims, verb, value, incoming=direction == "incoming")
+    return redirect(f"/claims/{claims[-1].id}")
 
 
 @claims.get("/<claim_id>/edit")
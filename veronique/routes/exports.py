@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from sanic import Blueprint, HTTPResponse
+
+from veronique import export, sandbox
+from veronique.context import context
+from veronique.utils import page
+
+exports = Blueprint("exports", url_prefix="/export")
+
+
+@exports.get("/")
+@page
+async def export_page(request):
+    links = "".join(
+        f'<a href="/export/{fmt}" role="button" class="secondary">{fmt}</a> '
+        for fmt in export.DATABASE_FORMATS
+    )
+    return "Export", f"""
+        <article>
+            <header><h3>Export</h3></header>
+            <p>
+                Download everything you can see: verbs, queries, entities and
+                claims as NDJSON, or entities and the links between them as a
+                graph (GraphML or GEXF).
+            </p>
+            {links}
+        </article>
+    """
+
+
+@exports.get("/<fmt:str>")
+async def export_database(request, fmt: str):
+    if fmt not in export.DATABASE_FORMATS:
+        return HTTPResponse(
+            body=f"Unknown format: {fmt}",
+            status=400,
+        )
+    writer, content_type, extension = export.DATABASE_FORMATS[fmt]
+    with sandbox.snapshot() as conn:
+        response = await request.respond(
+            content_type=content_type,
+            headers={
+                "Content-Disposition": (
+                    f'attachment; filename="veronique-{datetime.now():%Y%m%d-%H%M%S}.{extension}"'
+                ),
+            },
+        )
+        async for chunk in export.in_thread(writer(conn, context.user)):
+            await response.send(chunk)
+        await response.eof()
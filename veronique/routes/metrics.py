@@ -0,0 +1,98 @@
+from html import escape
+
+from sanic import Blueprint, text
+
+from veronique import caches, instrumentation
+from veronique.utils import admin_only, page
+
+metrics = Blueprint("metrics", url_prefix="/metrics")
+
+
+@metrics.get("/")
+@admin_only
+async def prometheus(request):
+    return text(
+        instrumentation.prometheus(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@metrics.get("/sql")
+@admin_only
+@page
+async def sql_statistics(request):
+    parts = [
+        "<article><header><h3>Endpoints</h3></header>",
+        "<table>",
+        "<thead><tr>",
+        '<th scope="col">Endpoint</th>',
+        '<th scope="col">Requests</th>',
+        '<th scope="col">Mean time</th>',
+        '<th scope="col">p95 time ≤</th>',
+        '<th scope="col">Mean SQL time</th>',
+        '<th scope="col">Mean queries</th>',
+        '<th scope="col">p95 queries ≤</th>',
+        "</tr></thead><tbody>",
+    ]
+    for endpoint, stats in sorted(
+        instrumentation.endpoints.items(),
+        key=lambda item: item[1].duration.sum,
+        reverse=True,
+    ):
+        n = stats.duration.count
+        parts.append(
+            f"<tr><td>{escape(endpoint)}</td><td>{n:,}</td>"
+            f"<td>{stats.duration.sum / n * 1000:,.1f} ms</td>"
+            f"<td>{stats.duration.quantile(0.95) * 1000:,.0f} ms</td>"
+            f"<td>{stats.sql_seconds.sum / n * 1000:,.1f} ms</td>"
+            f"<td>{stats.queries.sum / n:,.1f}</td>"
+            f"<td>{stats.queries.quantile(0.95):,}</td></tr>"
+        )
+    parts.extend([
+        "</tbody></table></article>",
+        "<article><header><h3>Statements</h3></header>",
+        "<table>",
+        "<thead><tr>",
+        '<th scope="col">Statement</th>',
+        '<th scope="col">Count</th>',
+        '<th scope="col">Total time</th>',
+        '<th scope="col">Mean time</th>',
+        '<th scope="col">Rows</th>',
+        "</tr></thead><tbody>",
+    ])
+    for shape, stats in sorted(
+        instrumentation.shapes.items(),
+        key=lambda item: item[1].seconds,
+        reverse=True,
+    ):
+        mean = stats.seconds / stats.count if stats.count else 0
+        parts.append(
+            f"<tr><td><code>{escape(shape)}</code></td><td>{stats.count:,}</td>"
+            f"<td>{stats.seconds * 1000:,.1f} ms</td>"
+            f"<td>{mean * 1000:,.2f} ms</td>"
+            f"<td>{stats.rows:,}</td></tr>"
+        )
+    parts.extend([
+        "</tbody></table></article>",
+        "<article><header><h3>Caches</h3></header>",
+        "<table>",
+        "<thead><tr>",
+        '<th scope="col">Cache</th>',
+        '<th scope="col">Entries</th>',
+        '<th scope="col">Hit rate</th>',
+        '<th scope="col">Hits</th>',
+        '<th scope="col">Misses</th>',
+        '<th scope="col">Evictions</th>',
+        '<th scope="col">Invalidations</th>',
+        "</tr></thead><tbody>",
+    ])
+    for name, cache in sorted(caches.registry.items()):
+        lookups = cache.hits + cache.misses
+        hit_rate = f"{cache.hits / lookups:.0%}" if lookups else "-"
+        parts.append(
+            f"<tr><td>{escape(name)}</td><td>{len(cache):,}</td><td>{hit_rate}</td>"
+            f"<td>{cache.hits:,}</td><td>{cache.misses:,}</td>"
+            f"<td>{cache.evictions:,}</td><td>{cache.invalidations:,}</td></tr>"
+        )
+    parts.append("</tbody></table></article>")
+    return "SQL statistics", "".join(parts)
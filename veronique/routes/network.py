@@ -1,12 +1,13 @@
 import math
 import random
-from collections import Counter, defaultdict, deque
+import sqlite3
+from collections import Counter, defaultdict
 from itertools import combinations, cycle
-from time import monotonic
 
-from sanic import Blueprint, HTTPResponse, redirect
+from sanic import Blueprint, HTTPResponse
 
 import veronique.objects as O
+from veronique import analytics, oracle
 from veronique.context import context
 from veronique.db import IS_A, ROOT
 from veronique.utils import page
@@ -29,7 +30,15 @@ async def show_network(request):
         verbs = [O.Verb(verb_id) for verb_id in ids]
     else:
         verbs = all_verbs
+    size_by = request.args.get("size", "links")
+    color_by = request.args.get("color", "category")
+    if size_by in ("degree", "pagerank") or color_by in ("community", "component"):
+        metrics = analytics.metrics()
+    else:
+        metrics = None
     colormap = None
+    connections = None
+    links = None
     if "query" in request.args:
         query_id = int(request.args.get("query"))
         if not context.user.can("view", "query", query_id):
@@ -38,10 +47,14 @@ async def show_network(request):
                 status=403,
             )
         query = O.Query(query_id)
-        result = query.run(
-            page_no=0,
-            page_size=9999,
-        )
+        try:
+            result = await query.run(
+                page_no=0,
+                page_size=9999,
+                request=request,
+            )
+        except sqlite3.OperationalError as e:
+            return query.label, f"""<article class="error"><strong>Error:</strong> {e.args[0]}</article>"""
         claims = (
             O.Claim(row[request.args.get("col" if "col" in request.args else "node_c")])
             for row in result
@@ -55,43 +68,35 @@ async def show_network(request):
         for claim_id in claim_ids:
             colormap[str(claim_id)] = 1
         claims = set()
-        t_start = monotonic()
+        connections = []
         for a_id, b_id in combinations(claim_ids, 2):
-            a = O.Claim(a_id)
-            queue = deque([(a, [])])
-            results = None
-            while queue and not results:
-                t, p = queue.popleft()
-                for link in t.all_links(page_size=999):
-                    r_id = link.subject.id if link.subject.id != t.id else link.object.id
-                    if r_id in (pe.id for pe in p):
-                        continue
-                    r = O.Claim(r_id)
-                    p_ = [*p, r]
-                    if r_id == b_id:
-                        results = p_
-                    else:
-                        queue.append((r, p_))
-                if monotonic() - t_start > 5:
-                    return redirect("/")
-
-            if results:
-                claims.add(a)
-                claims.update(results)
+            path = oracle.find_path(a_id, b_id, verbs=context.user.readable_verbs)
+            a, b = O.Claim(a_id), O.Claim(b_id)
+            if path:
+                claims.update(O.Claim(claim_id) for claim_id in path)
+                connections.append(f"{a:label} – {b:label}: {len(path) - 1} step{'s' if len(path) != 2 else ''}")
+            else:
+                connections.append(f"{a:label} – {b:label}: not connected")
     else:
         query_id = None
-        claims = (
-            c
-            for c in O.Claim.all_labelled(page_size=9999)
-            if categories is None
-            or ({cat.object for cat in c.get_data().get(IS_A, set())} & categories)
-        )
+        claims = list(O.Claim.all_labelled(page_size=9999))
+        # load everything up front, the category filter needs the data too
+        links = O.Claim.prefetch_graph(claims)
+        if categories is not None:
+            claims = [
+                c
+                for c in claims
+                if {cat.object for cat in c.get_data().get(IS_A, set())} & categories
+            ]
         title = "Network"
+    if links is None:
+        claims = list(claims)
+        links = O.Claim.prefetch_graph(claims)
     nodes_seen, edges_seen = set(), set()
     all_nodes, all_edges = [], []
     link_count = Counter()
     for c in claims:
-        node, edges = c.graph_elements(verbs=verbs)
+        node, edges = c.graph_elements(verbs=verbs, links=links.get(c.id, []))
         if node["id"] not in nodes_seen:
             all_nodes.append(node)
             nodes_seen.add(node["id"])
@@ -164,8 +169,49 @@ async def show_network(request):
         }
       </ul>
     </details>
+    <select
+        name="size"
+        hx-get="/network"
+        hx-include="#networkform"
+        hx-swap="outerHTML"
+        hx-target="#container"
+        hx-select="#container"
+        hx-push-url="true"
+    >
+      {
+            "".join(
+                f'<option value="{value}"{" selected" if value == size_by else ""}>Size by {label}</option>'
+                for value, label in (
+                    ("links", "visible links"),
+                    ("degree", "degree"),
+                    ("pagerank", "PageRank"),
+                )
+            )
+        }
+    </select>
+    <select
+        name="color"
+        hx-get="/network"
+        hx-include="#networkform"
+        hx-swap="outerHTML"
+        hx-target="#container"
+        hx-select="#container"
+        hx-push-url="true"
+    >
+      {
+            "".join(
+                f'<option value="{value}"{" selected" if value == color_by else ""}>Color by {label}</option>'
+                for value, label in (
+                    ("category", "category"),
+                    ("community", "community"),
+                    ("component", "connected component"),
+                )
+            )
+        }
+    </select>
     </fieldset>
     </form>
+    {f'<small>{"<br>".join(connections)}</small>' if connections else ""}
     <button id="playpause" onclick="handlePlayPause()" style="position: fixed; z-index: 2;">■</button>
     <div id="cy"></div>
     <script>
@@ -192,7 +238,23 @@ async def show_network(request):
     )
     colors = defaultdict(cycle(["red", "green", "blue", "orange", "purple"]).__next__)
     for node in all_nodes:
-        parts.append(f'graph.addNode("{node["id"]}", {{label: "{node["label"]}", x: {random.random()}, y: {random.random()}, size: {round(math.log(link_count[node["id"]] + 1)) + 2}, color: "{colors[node["cat"] if not colormap else colormap[node["id"]]]}"{maybe_force_labels}}});\n')
+        claim_id = int(node["id"])
+        if size_by == "degree":
+            weight = metrics.degree.get(claim_id, 0)
+        elif size_by == "pagerank":
+            # relative to the average node, which has a rank of 1/n
+            weight = 2 * metrics.pagerank.get(claim_id, 0) * len(metrics.pagerank)
+        else:
+            weight = link_count[node["id"]]
+        if colormap:
+            color = colormap[node["id"]]
+        elif color_by == "community":
+            color = metrics.community.get(claim_id)
+        elif color_by == "component":
+            color = metrics.component.get(claim_id)
+        else:
+            color = node["cat"]
+        parts.append(f'graph.addNode("{node["id"]}", {{label: "{node["label"]}", x: {random.random()}, y: {random.random()}, size: {round(math.log(weight + 1)) + 2}, color: "{colors[color]}"{maybe_force_labels}}});\n')
 
     for edge in all_edges:
         parts.append(f'graph.addEdge("{edge["source"]}", "{edge["target"]}", {{label: "{edge["label"]}", size: 1, color: "grey", type: "{edge["type"]}"}});\n')
@@ -0,0 +1,85 @@
+from html import escape
+
+from sanic import Blueprint, raw, redirect
+
+from veronique import profiling
+from veronique.utils import admin_only, page
+
+profiles = Blueprint("profiles", url_prefix="/profiles")
+
+SORT_KEYS = {
+    "cumulative": "Cumulative time",
+    "tottime": "Own time",
+    "ncalls": "Calls",
+}
+
+
+@profiles.get("/")
+@admin_only
+@page
+async def list_profiles(request):
+    parts = [
+        "<article><header><h3>Profiles</h3></header>",
+        "<p>Add <code>?profile=1</code> to any URL to profile that request.</p>",
+        "<table>",
+        "<thead><tr>",
+        '<th scope="col">Time</th>',
+        '<th scope="col">Request</th>',
+        '<th scope="col">Duration</th>',
+        '<th scope="col"></th>',
+        "</tr></thead><tbody>",
+    ]
+    for profile in reversed(profiling.profiles):
+        parts.append(
+            f"<tr><td>{profile.created_at:%Y-%m-%d %H:%M:%S}</td>"
+            f'<td><a href="/profiles/{profile.id}">{escape(profile.path)}</a>'
+            f"{' <small>(sampled)</small>' if profile.sampled else ''}</td>"
+            f"<td>{profile.seconds * 1000:,.1f} ms</td>"
+            f'<td><a href="/profiles/{profile.id}/download">pstats</a></td></tr>'
+        )
+    parts.append("</tbody></table></article>")
+    return "Profiles", "".join(parts)
+
+
+@profiles.get("/<profile_id:int>")
+@admin_only
+@page
+async def view_profile(request, profile_id):
+    if (profile := profiling.get(profile_id)) is None:
+        return redirect("/profiles?err=This profile is no longer kept.")
+    sort = request.args.get("sort", "cumulative")
+    if sort not in SORT_KEYS:
+        sort = "cumulative"
+    links = " ".join(
+        f'<a href="/profiles/{profile.id}?sort={key}" role="button"'
+        f'{"" if key == sort else " class=secondary"}>{label}</a>'
+        for key, label in SORT_KEYS.items()
+    )
+    return f"Profile of {profile.path}", f"""
+        <article>
+            <header><h3>{escape(profile.path)}</h3></header>
+            <p>
+                Endpoint <code>{escape(profile.endpoint)}</code>,
+                {profile.seconds * 1000:,.1f} ms,
+                {profile.created_at:%Y-%m-%d %H:%M:%S}.
+                <a href="/profiles/{profile.id}/download">Download</a> (for
+                <code>pstats</code>, snakeviz etc.)
+            </p>
+            <p>{links}</p>
+            <pre>{escape(profile.report(sort, 60))}</pre>
+        </article>
+    """
+
+
+@profiles.get("/<profile_id:int>/download")
+@admin_only
+async def download_profile(request, profile_id):
+    if (profile := profiling.get(profile_id)) is None:
+        return redirect("/profiles?err=This profile is no longer kept.")
+    return raw(
+        profile.dump(),
+        content_type="application/octet-stream",
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{profile.id}.pstats"',
+        },
+    )
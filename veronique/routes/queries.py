@@ -1,9 +1,20 @@
 import sqlite3
+import tempfile
+from pathlib import Path
 
 from sanic import Blueprint, HTTPResponse, json
 
 import veronique.objects as O
-from veronique import db
+from veronique import (
+    backup,
+    coherence,
+    db,
+    export,
+    protocol,
+    query_cache,
+    sandbox,
+)
+from veronique.constants import REMOTE_CHUNK_SIZE
 from veronique.context import context
 from veronique.data_types import TYPES
 from veronique.settings import settings as S
@@ -37,6 +48,24 @@ async def list_queries(request):
     return "Queries", "".join(parts)
 
 
+def _cache_ttl_input(cache_ttl=None):
+    value = f' value="{cache_ttl // 60}"' if cache_ttl else ""
+    return f"""
+        <label>
+        <input type="number" name="cache_ttl" min=1 placeholder="Cache results for (minutes)"{value}>
+        <small>Optional. Results are normally reused until anything changes.
+        If set, they are reused for this many minutes instead, even if data
+        changes in the meantime. Useful for expensive queries.</small>
+        </label>
+    """
+
+
+def _cache_ttl_from_form(form):
+    if form.get("cache_ttl"):
+        return int(form["cache_ttl"]) * 60
+    return None
+
+
 def _queries_textarea(value=None):
     return f"""
         <div>
@@ -68,6 +97,7 @@ async def new_query_form(request):
         >
             <input name="label" placeholder="label"></input>
             {_queries_textarea()}
+            {_cache_ttl_input()}
             <div role="group">
             <button
                 class="secondary"
@@ -96,6 +126,7 @@ async def edit_query_form(request, query_id: int):
         >
             <input name="label" placeholder="label" value="{query.label}"></input>
             {_queries_textarea(query.sql)}
+            {_cache_ttl_input(query.cache_ttl)}
             <div role="group">
             <button
                 class="secondary"
@@ -163,12 +194,9 @@ async def preview_query(request):
     form = D(request.form)
     res = None
     try:
-        cur = db.conn.cursor()
-        res = cur.execute(form["sql"] + " LIMIT 10").fetchall()
+        res = await sandbox.run(form["sql"] + " LIMIT 10", request=request)
     except (sqlite3.Warning, sqlite3.OperationalError) as e:
         return f"""<article class="error"><strong>Error:</strong> {e.args[0]}</article>"""
-    finally:
-        db.conn.rollback()
     return display_query_result(res)
 
 
@@ -180,6 +208,7 @@ async def new_query(request):
     query = O.Query.new(
         form["label"],
         form["sql"],
+        cache_ttl=_cache_ttl_from_form(form),
     )
     return f"""
         <meta http-equiv="refresh" content="0; url=/queries/{query.id}">
@@ -192,7 +221,11 @@ async def new_query(request):
 async def edit_query(request, query_id: int):
     query = O.Query(query_id)
     form = D(request.form)
-    query.update(label=form["label"], sql=form["sql"])
+    query.update(
+        label=form["label"],
+        sql=form["sql"],
+        cache_ttl=_cache_ttl_from_form(form),
+    )
     return f"""
         <meta http-equiv="refresh" content="0; url=/queries/{query_id}">
     """
@@ -208,18 +241,31 @@ async def view_query(request, query_id: int):
         )
     page_no = int(request.args.get("page", 1))
     query = O.Query(query_id)
-    result = query.run(
-        page_no=page_no - 1,
-        page_size=S.page_size + 1,  # so we know if there would be more results
-    )
+    try:
+        result = await query.run(
+            page_no=page_no - 1,
+            page_size=S.page_size + 1,  # so we know if there would be more results
+            request=request,
+        )
+    except sqlite3.OperationalError as e:
+        return query.label, f"""<article class="error"><strong>Error:</strong> {e.args[0]}</article>"""
     if len(result) > S.page_size:
         more_results = True
         result = result[:-1]
     else:
         more_results = False
+    cache_info = ""
+    if context.user.is_admin and query.cache_ttl and (entry := query_cache.lookup(query)):
+        cache_info = f"""<small class="dim">Cached result from {round(entry.age / 60)} minutes ago (kept for {query.cache_ttl // 60} minutes)</small>"""
+    export_links = " · ".join(
+        f'<a href="/queries/{query_id}/export?format={fmt}&labels=1">{fmt}</a>'
+        for fmt in export.FORMATS
+    )
     return query.label, f"""
         <article><header>
         {query:heading}</header>{display_query_result(result, query_id=query_id)}
+        {cache_info}
+        <small>Export: {export_links}</small>
         {
             pagination(
                 f"/queries/{query_id}",
@@ -231,6 +277,57 @@ async def view_query(request, query_id: int):
     """
 
 
+@queries.get("/<query_id>/export")
+async def export_query(request, query_id: int):
+    if not context.user.can("view", "query", query_id):
+        return HTTPResponse(
+            body="403 Forbidden",
+            status=403,
+        )
+    fmt = request.args.get("format", "csv")
+    if fmt not in export.FORMATS:
+        return HTTPResponse(
+            body=f"Unknown format: {fmt}",
+            status=400,
+        )
+    writer, content_type, extension = export.FORMATS[fmt]
+    query = O.Query(query_id)
+    # on a connection of its own, so a slow download doesn't keep a pooled
+    # one busy
+    with sandbox.snapshot() as conn:
+        chunks = writer(
+            export.tabulate(
+                query.stream(request=request, conn=conn),
+                labels=bool(request.args.get("labels")),
+            )
+        )
+        # get the first chunk before sending headers, so that broken queries
+        # still get a proper error response.
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = ""
+        except sqlite3.OperationalError as e:
+            return HTTPResponse(
+                body=e.args[0],
+                status=400,
+            )
+        response = await request.respond(
+            content_type=content_type,
+            headers={
+                "Content-Disposition": f'attachment; filename="query-{query_id}.{extension}"',
+            },
+        )
+        await response.send(first)
+        try:
+            async for chunk in chunks:
+                await response.send(chunk)
+        except sqlite3.OperationalError as e:
+            # too late for an error status; at least make the problem visible.
+            await response.send(f"\nError: {e.args[0]}\n")
+        await response.eof()
+
+
 @queries.delete("/<query_id>")
 @fragment
 async def delete_query(request, query_id: int):
@@ -249,17 +346,86 @@ async def delete_query(request, query_id: int):
 @queries.post("/remote")
 @admin_only
 async def remote_query(request):
-    query = request.json["q"]
-    params = request.json.get("p", {})
+    payload = protocol.decode(request.body, request.headers.get("content-encoding"))
+    if "batch" in payload:
+        encoder = protocol.Encoder(
+            compress="gzip" in request.headers.get("accept-encoding", ""),
+        )
+        headers = {"Content-Encoding": "gzip"} if encoder.compressor else {}
+        response = await request.respond(
+            content_type="application/x-ndjson",
+            headers=headers,
+        )
+        async for message in protocol.run_batch(payload, request=request):
+            await response.send(encoder.encode(message))
+        await response.send(encoder.finish())
+        await response.eof()
+        return
+    query = payload["q"]
+    params = payload.get("p", {})
     try:
-        cur = db.conn.cursor()
-        res = cur.execute(query, params).fetchall()
+        res = await sandbox.run(query, params, request=request)
     except (sqlite3.Warning, sqlite3.OperationalError, sqlite3.ProgrammingError) as e:
         print("E:", e.args[0], "for", query, "with", params)
         return HTTPResponse(
             body=e.args[0],
             status=400,
         )
-    finally:
-        db.conn.rollback()
     return json([dict(row) for row in res])
+
+
+@queries.post("/remote/write")
+@admin_only
+async def remote_write(request):
+    payload = protocol.decode(request.body, request.headers.get("content-encoding"))
+    results = []
+    cur = db.conn.cursor()
+    try:
+        for sql, params in protocol.statements(payload):
+            cur.execute(sql, params)
+            results.append({"lastrowid": cur.lastrowid, "rowcount": cur.rowcount})
+        # arbitrary SQL could have changed anything, so all workers (this
+        # one included) have to forget everything
+        db.log_change(cur, coherence.EVERYTHING, coherence.EVERYTHING, "update")
+        db.conn.commit()
+    except (sqlite3.Warning, sqlite3.Error) as e:
+        db.conn.rollback()
+        return HTTPResponse(
+            body=e.args[0],
+            status=400,
+        )
+    coherence.forget_all()
+    return json({"results": results, "revision": db.revision()})
+
+
+@queries.get("/remote/revision")
+@admin_only
+async def remote_revision(request):
+    return json({"revision": db.revision()})
+
+
+@queries.get("/remote/snapshot")
+@admin_only
+async def remote_snapshot(request):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "snapshot.db"
+        await backup.snapshot(path)
+        snapshot = sqlite3.connect(path)
+        revision = snapshot.execute("SELECT revision FROM state").fetchone()[0]
+        snapshot.close()
+        encoder = protocol.Encoder(
+            compress="gzip" in request.headers.get("accept-encoding", ""),
+        )
+        headers = {"X-Revision": str(revision)}
+        if encoder.compressor:
+            headers["Content-Encoding"] = "gzip"
+        response = await request.respond(
+            content_type="application/vnd.sqlite3",
+            headers=headers,
+        )
+        # a local temporary file; reading it doesn't block for long
+        with open(path, "rb") as f:  # noqa: ASYNC230
+            while chunk := f.read(REMOTE_CHUNK_SIZE):
+                await response.send(encoder.compress(chunk))
+        await response.send(encoder.finish())
+        await response.eof()
@@ -1,8 +1,8 @@
 from sanic import Blueprint
 
 import veronique.objects as O
+from veronique import db
 from veronique.context import context
-from veronique.db import conn
 from veronique.search import find, rebuild_search_index
 from veronique.settings import settings as S
 from veronique.utils import D, admin_only, fragment, page, pagination
@@ -15,7 +15,7 @@ search = Blueprint("search", url_prefix="/search")
 async def perform_search(request):
     page_no = int(request.args.get("page", 1))
     query = D(request.args).get("q", "")
-    cur = conn.cursor()
+    cur = db.conn.cursor()
     hits = find(
         cur, query, page_size=S.page_size + 1, page_no=page_no - 1
     )
@@ -48,6 +48,6 @@ async def perform_search(request):
 @admin_only
 @fragment
 async def rebuild_search(request):
-    cur = conn.cursor()
+    cur = db.conn.cursor()
     rebuild_search_index(cur)
     return "<em>successfully rebuilt</em>"
@@ -1,7 +1,10 @@
 from base64 import b64encode
+from html import escape
 
 from sanic import Blueprint, redirect
 
+from veronique import db, orphans
+from veronique.constants import SLOW_QUERY_LOG_SIZE
 from veronique.context import context
 from veronique.security import sign
 from veronique.settings import settings as S
@@ -79,6 +82,26 @@ async def settings_form(request):
                     <small>This is the <em>n</em> in n-gram. We use character n-grams.</small>
                     </label>
                 </fieldset>
+                <h4>Performance</h4>
+                <fieldset class="grid">
+                    <label>
+                    Slow query threshold (ms)
+                    <input type="number" step="any" min=0 name="slow_query_threshold" value="{S.slow_query_threshold:g}"{d}>
+                    <small>Statements taking longer than this are logged, along with their query plan. 0 turns this off.</small>
+                    </label>
+                </fieldset>
+                <fieldset class="grid">
+                    <label>
+                    Profiled endpoint
+                    <input type="text" name="profiling_endpoint" placeholder="/claims/<claim_id:int>" value="{S.profiling_endpoint}"{d}>
+                    <small>As shown in the SQL statistics.</small>
+                    </label>
+                    <label>
+                    Profiled share of its requests (%)
+                    <input type="number" step="any" min=0 max=100 name="profiling_rate" value="{S.profiling_rate:g}"{d}>
+                    <small>At most one request per second is profiled.</small>
+                    </label>
+                </fieldset>
                 <h4>Maps</h4>
                 <fieldset class="grid">
                     <label>
@@ -114,6 +137,11 @@ async def settings_form(request):
                 <fieldset>
                 <a href="#" role="button" hx-swap="outerHTML" hx-post="/search/rebuild">Rebuild search index</a>
                 <a href="#" role="button" hx-swap="outerHTML" hx-post="/settings/generate-token">Issue API token</a>
+                <a href="/backups" role="button">Backups</a>
+                <a href="/metrics/sql" role="button">SQL statistics</a>
+                <a href="/settings/slow-queries" role="button">Slow queries</a>
+                <a href="/settings/orphans" role="button">Orphans</a>
+                <a href="/profiles" role="button">Profiles</a>
                 </fieldset>
                 ''' if context.user.is_admin else ""}
 
@@ -126,25 +154,105 @@ async def settings_form(request):
 @settings.post("/")
 async def save_settings(request):
     form = D(request.form)
-    S.page_size = form.get("page_size")
-    S.default_phone_region = form.get("default_phone_region")
-    S.index_days_ahead = form.get("index_days_ahead")
-    S.index_days_back = form.get("index_days_back")
-    S.index_type = form.get("index_type")
-    S.index_recent_events_mod = form.get("index_recent_events_mod")
-    S.default_source_type = form.get("default_source_type")
+    names = [
+        "page_size",
+        "default_phone_region",
+        "index_days_ahead",
+        "index_days_back",
+        "index_type",
+        "index_recent_events_mod",
+        "default_source_type",
+    ]
     if context.user.is_admin:
-        S.app_name = form.get("app_name")
-        S.search_k_1 = form.get("search_k_1")
-        S.search_b = form.get("search_b")
-        S.search_n = form.get("search_n")
-        S.map_tile_attribution_link = form.get("map_tile_attribution_link")
-        S.map_tile_attribution_label = form.get("map_tile_attribution_label")
-        S.map_tile_url = form.get("map_tile_url")
-        S.location_link_template = form.get("location_link_template")
+        names.extend([
+            "app_name",
+            "search_k_1",
+            "search_b",
+            "search_n",
+            "map_tile_attribution_link",
+            "map_tile_attribution_label",
+            "map_tile_url",
+            "location_link_template",
+            "slow_query_threshold",
+            "profiling_endpoint",
+            "profiling_rate",
+        ])
+    S.update({name: form.get(name) for name in names})
     return redirect("/")
 
 
+@settings.get("/slow-queries")
+@admin_only
+@page
+async def slow_queries(request):
+    parts = [
+        "<article><header><h3>Slow queries</h3></header>",
+        f"<p>The last {SLOW_QUERY_LOG_SIZE} statements that took longer than",
+        f" {S.slow_query_threshold:g} ms, newest first.</p>",
+        "<table>",
+        "<thead><tr>",
+        '<th scope="col">Time</th>',
+        '<th scope="col">Endpoint</th>',
+        '<th scope="col">Duration</th>',
+        '<th scope="col">Statement</th>',
+        "</tr></thead><tbody>",
+    ]
+    for row in db.conn.execute(
+        "SELECT * FROM slow_queries ORDER BY id DESC",
+    ).fetchall():
+        parameters = "" if row["parameters"] is None else f"<br><small>{row['parameters']} parameters</small>"
+        plan = f"<pre>{escape(row['plan'])}</pre>" if row["plan"] else ""
+        parts.append(
+            f"<tr><td>{row['created_at']}</td><td>{escape(row['endpoint'] or '')}</td>"
+            f"<td>{row['milliseconds']:,.1f} ms</td>"
+            f"<td><code>{escape(row['shape'])}</code>{parameters}{plan}</td></tr>"
+        )
+    parts.append("</tbody></table></article>")
+    return "Slow queries", "".join(parts)
+
+
+@settings.get("/orphans")
+@admin_only
+@page
+async def orphans_page(request):
+    parts = [
+        "<article><header><h3>Orphans</h3></header>",
+        "<p>Claims about or linking to claims that no longer exist, and rows of",
+        " the search index or external keys of things that are gone, are",
+        " removed in the background every",
+        f" {orphans.GC_INTERVAL.total_seconds() / 3600:g} hours. The last",
+        f" {orphans.GC_KEEP} collections of this worker, newest first:</p>",
+        "<table>",
+        "<thead><tr>",
+        '<th scope="col">Started</th>',
+        '<th scope="col">Claims</th>',
+        '<th scope="col">Index rows</th>',
+        '<th scope="col">External keys</th>',
+        '<th scope="col">Duration</th>',
+        "</tr></thead><tbody>",
+    ]
+    for report in reversed(orphans.reports):
+        parts.append(
+            f"<tr><td>{report['started_at']}</td><td>{report['claims']:,}</td>"
+            f"<td>{report['index_rows']:,}</td><td>{report['external_keys']:,}</td>"
+            f"<td>{report['seconds']:,.1f} s</td></tr>"
+        )
+    parts.append("</tbody></table>")
+    parts.append(
+        "<p>A collection is running.</p>" if orphans.running() else
+        '<form method="POST"><input type="submit" value="Collect now"></form>'
+    )
+    parts.append("</article>")
+    return "Orphans", "".join(parts)
+
+
+@settings.post("/orphans")
+@admin_only
+async def collect_orphans(request):
+    request.app.add_task(orphans.collect_in_background())
+    return redirect("/settings/orphans")
+
+
 @settings.post("/generate-token")
 @admin_only
 @fragment
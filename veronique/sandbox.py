@@ -0,0 +1,302 @@
+"""
+Execution of user-supplied SQL (saved queries, previews, remote access).
+
+Such SQL runs on separate read-only connections, so a runaway query can
+neither write anything nor hold up the main connection. Every execution has a
+budget that's checked from SQLite's progress handler: a wall-clock limit, a
+limit on the number of VM instructions, and a flag that is set when the
+client goes away. Results are capped at a maximum number of rows, unless they
+are streamed. A stream has one budget for all of its batches, so it can't
+keep a pooled connection busy for long. Streams on a connection of their own
+(see snapshot()) have no such limit; there, the budget applies to each batch.
+
+When there's no file to open a second connection to (an in-memory database,
+or while connected to a remote instance), queries run on the main connection
+instead, with the same budget but without cancellation on disconnect.
+"""
+
+import asyncio
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from time import monotonic
+
+from veronique import db, instrumentation
+from veronique.constants import (
+    DB_BUSY_TIMEOUT,
+    SANDBOX_BATCH_SIZE,
+    SANDBOX_DISCONNECT_POLL_INTERVAL,
+    SANDBOX_MAX_ROWS,
+    SANDBOX_PROGRESS_INTERVAL,
+    SANDBOX_STEP_LIMIT,
+    SANDBOX_TIME_LIMIT,
+)
+
+_idle = []
+
+
+class QueryError(sqlite3.OperationalError):
+    """A query was stopped because it went over its budget."""
+
+
+class Budget:
+    def __init__(
+        self,
+        *,
+        time_limit=SANDBOX_TIME_LIMIT,
+        step_limit=SANDBOX_STEP_LIMIT,
+    ):
+        self.time_limit = time_limit
+        self.step_limit = step_limit
+        self.deadline = monotonic() + time_limit.total_seconds()
+        self.steps = 0
+        self.cancelled = False
+        self.reason = None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def __call__(self):
+        # called by SQLite every SANDBOX_PROGRESS_INTERVAL instructions; a
+        # truthy return value aborts the query.
+        self.steps += SANDBOX_PROGRESS_INTERVAL
+        if self.cancelled:
+            self.reason = "Query was cancelled"
+        elif self.steps > self.step_limit:
+            self.reason = f"Query exceeded its budget of {self.step_limit:,} steps"
+        elif monotonic() > self.deadline:
+            self.reason = (
+                f"Query took longer than {self.time_limit.total_seconds():g} seconds"
+            )
+        return self.reason is not None
+
+
+def _isolated():
+    return db.path != ":memory:" and isinstance(db.conn, sqlite3.Connection)
+
+
+def _connect():
+    conn = sqlite3.connect(
+        f"{Path(db.path).absolute().as_uri()}?mode=ro",
+        uri=True,
+        timeout=DB_BUSY_TIMEOUT.total_seconds(),
+        check_same_thread=False,
+        factory=instrumentation.Connection,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def _acquire():
+    return _idle.pop() if _idle else _connect()
+
+
+def _release(conn):
+    conn.rollback()
+    _idle.append(conn)
+
+
+@contextmanager
+def _main_connection():
+    query_only = db.conn.execute("PRAGMA query_only").fetchone()[0]
+    db.conn.execute("PRAGMA query_only = ON")
+    try:
+        yield db.conn
+    finally:
+        db.conn.rollback()
+        db.conn.execute(f"PRAGMA query_only = {query_only}")
+
+
+@contextmanager
+def snapshot():
+    """
+    Yield a read-only connection of its own, inside a single read transaction.
+
+    Everything read from it is consistent, as of when it was opened, and
+    writers can go on in the meantime (in WAL mode). An in-memory database
+    can't be opened twice, so it's copied instead.
+    """
+    if _isolated():
+        conn = _connect()
+        conn.execute("BEGIN")
+        # the transaction only starts seeing a snapshot with its first read
+        conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+    else:
+        conn = sqlite3.connect(":memory:", check_same_thread=False)
+        db.conn.backup(conn)
+        conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def _guarded(conn, budget, fn, *args):
+    """Call fn(*args) while the budget is enforced on conn."""
+    conn.set_progress_handler(budget, SANDBOX_PROGRESS_INTERVAL)
+    try:
+        return fn(*args)
+    except sqlite3.OperationalError as e:
+        if budget.reason:
+            raise QueryError(budget.reason) from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def _fetch(conn, sql, params, size):
+    return conn.execute(sql, params).fetchmany(size)
+
+
+def _start(conn, sql, params, size):
+    cur = conn.execute(sql, params)
+    return cur, cur.fetchmany(size)
+
+
+class Batch(list):
+    """Rows of a result, along with the names of its columns (even if there are no rows)."""
+
+    def __init__(self, rows, columns):
+        super().__init__(rows)
+        self.columns = columns
+
+
+def _columns(cur):
+    return [column[0] for column in cur.description or ()]
+
+
+def _check_size(rows, max_rows):
+    if len(rows) > max_rows:
+        raise QueryError(f"Query returned more than {max_rows:,} rows")
+    return rows
+
+
+def _disconnected(request):
+    transport = getattr(request, "transport", None)
+    return transport is not None and transport.is_closing()
+
+
+class _Worker:
+    """Runs guarded calls on one connection in a thread, one at a time."""
+
+    def __init__(self, conn, request):
+        self.conn = conn
+        self.request = request
+        self.task = None
+
+    async def __call__(self, fn, *args, budget=None):
+        if budget is None:
+            budget = Budget()
+        self.task = asyncio.ensure_future(
+            asyncio.to_thread(_guarded, self.conn, budget, fn, *args)
+        )
+        try:
+            while not self.task.done():
+                await asyncio.wait(
+                    {self.task},
+                    timeout=SANDBOX_DISCONNECT_POLL_INTERVAL.total_seconds(),
+                )
+                if self.request is not None and _disconnected(self.request):
+                    budget.cancel()
+        finally:
+            # also stops the query if we are cancelled ourselves, e.g. by
+            # Sanic when the connection is lost.
+            if not self.task.done():
+                budget.cancel()
+        return self.task.result()
+
+    def close(self, release=_release):
+        # the connection can only be reused once the thread is done with it.
+        if self.task is None or self.task.done():
+            release(self.conn)
+        else:
+            self.task.add_done_callback(lambda _: release(self.conn))
+
+
+def execute(sql, params=(), *, max_rows=SANDBOX_MAX_ROWS, budget=None):
+    """Run a read-only query within the given budget and return its rows."""
+    if budget is None:
+        budget = Budget()
+    if not isinstance(db.conn, sqlite3.Connection):
+        # remote connection; the other side enforces its own budget.
+        return db.conn.cursor().execute(sql, params).fetchall()[:max_rows]
+    if _isolated():
+        conn = _acquire()
+        try:
+            rows = _guarded(conn, budget, _fetch, conn, sql, params, max_rows + 1)
+        finally:
+            _release(conn)
+    else:
+        with _main_connection() as conn:
+            rows = _guarded(conn, budget, _fetch, conn, sql, params, max_rows + 1)
+    return _check_size(rows, max_rows)
+
+
+async def run(sql, params=(), *, max_rows=SANDBOX_MAX_ROWS, request=None):
+    """
+    Like execute(), but without blocking the event loop.
+
+    If a request is given, the query is cancelled as soon as its client
+    disconnects.
+    """
+    if not _isolated():
+        return execute(sql, params, max_rows=max_rows)
+    conn = _acquire()
+    worker = _Worker(conn, request)
+    try:
+        rows = await worker(_fetch, conn, sql, params, max_rows + 1)
+    finally:
+        worker.close()
+    return _check_size(rows, max_rows)
+
+
+async def stream(sql, params=(), *, batch_size=SANDBOX_BATCH_SIZE, request=None, conn=None):
+    """
+    Yield the rows of a read-only query as Batches of up to batch_size rows.
+
+    Only one batch is held in memory at a time. An empty result is one empty
+    Batch, so the columns are known anyway. With conn (a read-only connection
+    of its own, see snapshot()), there's no limit on the total number of
+    rows or the time taken, and the budget applies to each batch separately;
+    otherwise, the whole stream shares one budget.
+    """
+    if not isinstance(db.conn, sqlite3.Connection) and conn is None:
+        if rows := execute(sql, params):
+            yield Batch(rows, list(rows[0].keys()))
+        return
+    if conn is None and not _isolated():
+        # don't keep the main connection read-only while others use it;
+        # fetch everything first.
+        budget = Budget()
+        with _main_connection() as main:
+            cur = _guarded(main, budget, main.execute, sql, params)
+            rows = _check_size(
+                _guarded(main, budget, cur.fetchmany, SANDBOX_MAX_ROWS + 1),
+                SANDBOX_MAX_ROWS,
+            )
+            columns = _columns(cur)
+        for start in range(0, max(len(rows), 1), batch_size):
+            yield Batch(rows[start:start + batch_size], columns)
+        return
+    private = conn is not None
+    if not private:
+        conn = _acquire()
+    budget = None if private else Budget()
+    worker = _Worker(conn, request)
+    try:
+        # the first batch comes with the execution, which saves a round trip
+        # to the thread for small results.
+        cur, rows = await worker(_start, conn, sql, params, batch_size, budget=budget)
+        columns = _columns(cur)
+        yield Batch(rows, columns)
+        while len(rows) == batch_size:
+            if budget is not None and monotonic() > budget.deadline:
+                raise QueryError(
+                    f"Query took longer than {budget.time_limit.total_seconds():g} seconds"
+                )
+            if rows := await worker(cur.fetchmany, batch_size, budget=budget):
+                yield Batch(rows, columns)
+    finally:
+        # a private connection isn't ours to pool
+        worker.close(release=(lambda _: None) if private else _release)
@@ -1,10 +1,9 @@
 import unicodedata
 
-from veronique import db
+from veronique import caches, db
 from veronique.constants import SEARCH_AVGDL_CACHE_TIME, SEARCH_AVGDL_FALLBACK
 from veronique.db import ROOT
 from veronique.settings import settings as S
-from veronique.utils import timed_cache
 
 
 def update_index_for_doc(cur, table, id, name):
@@ -55,7 +54,10 @@ def ngrams(string):
     yield from ("".join(e) for e in zip(*iterables))
 
 
-@timed_cache(SEARCH_AVGDL_CACHE_TIME)
+avgdl_cache = caches.Cache("avgdl", ttl=SEARCH_AVGDL_CACHE_TIME, max_size=1)
+
+
+@avgdl_cache.cached()
 def calculate_avgdl(cur):
     row = cur.execute("SELECT AVG(length) AS avgdl FROM forward_index").fetchone()
     if not row:
@@ -19,10 +19,10 @@ from veronique.constants import (
     SEARCH_DEFAULT_B,
     SEARCH_DEFAULT_K1,
     SEARCH_DEFAULT_N,
+    SLOW_QUERY_DEFAULT_THRESHOLD,
 )
 from veronique.context import context
 
-UNKNOWN = object()
 
 class ConditionalInt:
     """
@@ -60,39 +60,35 @@ class ConditionalInt:
 
 class Setting:
     def __init__(self, default, user_settable=False):
-        self.value = UNKNOWN
         self.default = default
         self.name = None
         self.converter = str
         self.user_settable = user_settable
 
-    def __get__(self, _obj, _objtype=None):
-        if self.value is UNKNOWN:
-            row = db.conn.execute(
-                "SELECT value FROM settings WHERE key=?",
-                (self.key,),
-            ).fetchone()
-            if row is None:
-                self.value = self.default
-            else:
-                self.value = self.converter(row["value"])
-        return self.value
-
-    def __set__(self, _obj, value):
-        if value is None:
-            value = self.default
-        self.value = self.converter(value)
-        row = db.conn.execute("SELECT value FROM settings WHERE key=?", (self.key,)).fetchone()
-        if row is None:
-            db.conn.execute("INSERT INTO settings (key, value) VALUES (?, ?)", (self.key, str(value)))
-        else:
-            db.conn.execute("UPDATE settings SET value=? WHERE key=?", (str(value), self.key))
-        db.conn.commit()
+    def __get__(self, obj, _objtype=None):
+        if obj is None:
+            return self
+        if self.user_settable and context.user is None:
+            return self.converted_default
+        return obj._load(self.scope).get(self.name, self.converted_default)
+
+    def __set__(self, obj, value):
+        obj.update({self.name: value})
 
     def __set_name__(self, owner, name):
         self.converter = typing.get_type_hints(owner).get(name, str)
+        # stored values are converted when they're loaded, and defaults have
+        # to look the same (a ConditionalInt default is a string otherwise)
+        self.converted_default = self.converter(self.default)
         self.name = name
 
+    @property
+    def scope(self):
+        """The user whose value this is, or None for settings shared by everyone."""
+        if self.user_settable:
+            return context.user.name
+        return None
+
     @property
     def key(self):
         if self.user_settable:
@@ -115,6 +111,83 @@ class Settings:
     map_tile_attribution_link: str = Setting(MAP_TILES_DEFAULT_ATTRIBUTION_LINK)
     location_link_template: str = Setting(LOCATION_DEFAULT_LINK_TEMPLATE)
     default_source_type: str = Setting(DEFAULT_SOURCE_TYPE)
+    slow_query_threshold: float = Setting(SLOW_QUERY_DEFAULT_THRESHOLD)
+    profiling_endpoint: str = Setting("")
+    profiling_rate: float = Setting(0)
+
+    def __init__(self):
+        # scope (a user name, or None for shared settings) -> {name: value}
+        self._values = {}
+
+    @classmethod
+    def _settings(cls):
+        return {name: s for name, s in vars(cls).items() if isinstance(s, Setting)}
+
+    def _load(self, scope):
+        """All stored values of one scope, read with a single query."""
+        if scope not in self._values:
+            if scope is None:
+                rows = db.conn.execute(
+                    "SELECT key, value FROM settings WHERE key NOT LIKE '%:%'",
+                ).fetchall()
+            else:
+                rows = db.conn.execute(
+                    "SELECT key, value FROM settings WHERE key LIKE ?",
+                    (f"%:{scope}",),
+                ).fetchall()
+            settings = self._settings()
+            values = {}
+            for row in rows:
+                name, _, user = row["key"].partition(":")
+                setting = settings.get(name)
+                if setting is None or (user or None) != scope:
+                    continue
+                values[name] = setting.converter(row["value"])
+            self._values[scope] = values
+        return self._values[scope]
+
+    def update(self, values):
+        """
+        Save several settings at once, in a single transaction.
+
+        A value of None resets the setting to its default.
+        """
+        settings = self._settings()
+        # convert everything first, so a bad value doesn't leave some of the
+        # others saved
+        changed = []
+        for name, value in values.items():
+            setting = settings[name]
+            if value is None:
+                value = setting.default
+            changed.append((setting, str(value), setting.converter(value)))
+        cur = db.conn.cursor()
+        try:
+            for setting, value, _ in changed:
+                # the cache may be stale (another worker may have saved it
+                # since), so let the table decide whether there is a row already
+                cur.execute("UPDATE settings SET value=? WHERE key=?", (value, setting.key))
+                if cur.rowcount:
+                    db.log_change(cur, "settings", setting.key, "update")
+                else:
+                    cur.execute("INSERT INTO settings (key, value) VALUES (?, ?)", (setting.key, value))
+                    db.log_change(cur, "settings", setting.key, "insert")
+            db.conn.commit()
+        except BaseException:
+            db.conn.rollback()
+            raise
+        for setting, _, converted in changed:
+            self._load(setting.scope)[setting.name] = converted
 
 
 settings = Settings()
+
+
+def forget(key):
+    """Drop the cached values of a setting's scope, e.g. after a change elsewhere."""
+    _name, _, user = key.partition(":")
+    settings._values.pop(user or None, None)
+
+
+def forget_all():
+    settings._values.clear()
@@ -1,6 +1,5 @@
 import functools
 from datetime import datetime
-from time import monotonic
 from types import CoroutineType
 
 from sanic import HTTPResponse, html
@@ -11,8 +10,18 @@ from veronique.settings import settings as S
 
 startup_time = datetime.now()
 
-with open("data/template.html") as f:
-    TEMPLATE = f.read().format
+
+@functools.cache
+def asset(name):
+    """Return the contents of a file in data/; it's only read once."""
+    with open(f"data/{name}", "rb") as f:
+        return f.read()
+
+
+@functools.cache
+def template(name):
+    return asset(name).decode().format
+
 
 def _error(msg):
     return f"""
@@ -138,6 +147,7 @@ def page(fn):
                     if context.impersonator else ''
                     }
                     <li><a href="/settings">Settings</a></li>
+                    <li><a href="/export">Export</a></li>
                     <li><a target="_blank" href="https://veronique.readthedocs.io">Help</a></li>
                     <li><a href="/logout">Logout</a></li>
                 </ul>
@@ -145,7 +155,7 @@ def page(fn):
         </li>
         """
         return html(
-            TEMPLATE(
+            template("template.html")(
                 title=title,
                 content=ret,
                 gotos="".join(gotos),
@@ -184,31 +194,6 @@ def admin_only(fn):
     return wrapper
 
 
-def timed_cache(max_duration, *, key=None):
-    def decorator(fn):
-        @functools.wraps(fn)
-        def wrapper(*args, **kwargs):
-            if key is not None:
-                key_ = key(*args, **kwargs)
-            else:
-                key_ = None
-            if not hasattr(fn, "_cached"):
-                fn._cached = {}
-                fn._cache_time = {}
-            if (
-                key_ not in fn._cached
-                or monotonic() - fn._cache_time[key_] > max_duration.total_seconds()
-            ):
-                result = fn(*args, **kwargs)
-                fn._cached[key_] = result
-                fn._cache_time[key_] = monotonic()
-            else:
-                result = fn._cached[key_]
-            return result
-        return wrapper
-    return decorator
-
-
 def http_date(dt):
     # We're just assuming UTC here. That is a) probably correct in a production
     # setup, and b) it really doesn't matter; this is just to force caching to